@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 import os
-from setuptools import setup
+from setuptools import find_packages, setup
 
 with open(os.path.join(os.path.dirname(__file__), 'README.md')) as readme:
     README = readme.read()
@@ -11,7 +11,7 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 setup(
     name='django-xfeed',
     version='0.0.4',
-    packages=['xfeed'],
+    packages=find_packages(),
     include_package_data=True,
     license='BSD License',
     description='A reusable application for Django, that aims to be a single '
@@ -1,17 +1,106 @@
 from django.contrib import admin
-from models import Feed, Tweet, RSSItem, RSSChannelData
+from django.contrib.admin.actions import delete_selected as delete_selected_action
+from django.db.models.functions import Substr
+from django.utils import timezone
+from django.utils.translation import ugettext as _, ugettext_lazy
+from models import Feed, FeedRefreshLog, Tweet, RSSItem, RSSChannelData, hide_items, items_deleted
+from paginator import EstimatedCountPaginator
 
 class RSSChannelDataInline(admin.StackedInline):
     model = RSSChannelData
 
 class FeedAdmin(admin.ModelAdmin):
     inlines = [RSSChannelDataInline]
+    actions = ['refresh_now']
+    list_display = ('name', 'feed_type', 'is_active', 'last_refreshed', 'next_refresh_at', 'failure_count')
+    list_filter = ('feed_type', 'is_active')
+    readonly_fields = ('hub', 'websub_state', 'websub_expires_at')
+
+    def refresh_now(self, request, queryset):
+        # Only makes the feeds due, the request does not wait for the refresh. A daemon picks them up at its next poll,
+        # a refresh_xfeeds that runs on a schedule only at its next run.
+        count = queryset.filter(is_active=True).update(next_refresh_at=timezone.now())
+        self.message_user(request, _('%s active feeds are due now. They are refreshed at the next poll of a '
+                                     'refresh_xfeeds --daemon, or else at the next run of refresh_xfeeds.') % count)
+    refresh_now.short_description = ugettext_lazy('Refresh selected feeds now')
 
     def get_formsets_with_inlines(self, request, obj=None):
         for inline in self.get_inline_instances(request, obj):
-            if obj is not None and inline.get_queryset(request).count() > 0:
+            if obj is not None and inline.get_queryset(request).filter(feed=obj).exists():
                 yield inline.get_formset(request, obj), inline
 
+class ItemAdmin(admin.ModelAdmin):
+    """
+    Admin for the large item tables. Counts are estimated, the filters use the indexes on the feed and hide flag and
+    the changelist does not load the long text columns.
+    """
+    actions = ['delete_selected', 'hide_selected', 'unhide_selected']
+    list_select_related = ('feed',)
+    list_filter = ('feed', 'hide')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Columns that are not loaded by the changelist
+    deferred_fields = ()
+    # Annotations of the rows on the page of the changelist, not of the counts
+    page_annotations = {}
+
+    def get_changelist(self, request, **kwargs):
+        ChangeList = super(ItemAdmin, self).get_changelist(request, **kwargs)
+        deferred_fields = self.deferred_fields
+        page_annotations = self.page_annotations
+
+        class ItemChangeList(ChangeList):
+            def get_queryset(self, request):
+                return super(ItemChangeList, self).get_queryset(request).defer(*deferred_fields)
+
+            def get_results(self, request):
+                super(ItemChangeList, self).get_results(request)
+                if page_annotations:
+                    self.result_list = self.result_list.annotate(**page_annotations)
+        return ItemChangeList
+
+    def delete_selected(self, request, queryset):
+        # The confirmed items are deleted with QuerySet.delete(), which does not call the delete() of the models
+        rows = list(queryset.order_by().values_list('pk', 'feed')) if request.POST.get('post') else None
+        response = delete_selected_action(self, request, queryset)
+        if rows and response is None:
+            items_deleted(self.model, [pk for pk, feed_id in rows], [feed_id for pk, feed_id in rows])
+        return response
+    delete_selected.short_description = delete_selected_action.short_description
+
+    def hide_selected(self, request, queryset):
+        count = hide_items(queryset, True)
+        self.message_user(request, _('%s items are hidden.') % count)
+    hide_selected.short_description = ugettext_lazy('Hide selected items')
+
+    def unhide_selected(self, request, queryset):
+        count = hide_items(queryset, False)
+        self.message_user(request, _('%s items are no longer hidden.') % count)
+    unhide_selected.short_description = ugettext_lazy('Unhide selected items')
+
+class TweetAdmin(ItemAdmin):
+    list_display = ('text_preview', 'feed', 'from_user_name', 'create_date', 'hide')
+    date_hierarchy = 'create_date'
+    deferred_fields = ('text', 'profile_image_url', 'source')
+    # The database cuts the text off, so the changelist does not load the full text
+    page_annotations = {'text_preview': Substr('text', 1, 80)}
+
+    def text_preview(self, obj):
+        return obj.text_preview
+    text_preview.short_description = ugettext_lazy('Text')
+
+class RSSItemAdmin(ItemAdmin):
+    list_display = ('title', 'feed', 'pub_date', 'hide')
+    date_hierarchy = 'pub_date'
+    raw_id_fields = ('content',)
+
+class FeedRefreshLogAdmin(admin.ModelAdmin):
+    list_display = ('feed', 'started_at', 'outcome', 'duration', 'fetch_time', 'parse_time', 'entries_inserted',
+                    'query_count')
+    list_filter = ('outcome',)
+    list_select_related = ('feed',)
+
 admin.site.register(Feed, FeedAdmin)
-admin.site.register(Tweet)
-admin.site.register(RSSItem)
+admin.site.register(Tweet, TweetAdmin)
+admin.site.register(RSSItem, RSSItemAdmin)
+admin.site.register(FeedRefreshLog, FeedRefreshLogAdmin)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Provides archive_in_batches and get_archived_items, functions for keeping old Tweets and RSSItems outside the tables
+that are queried for rendering feeds.
+
+Archived items are moved to ItemArchive rows: every row holds the items of one feed and month, serialized as JSON and
+compressed with zlib. Items are archived in bounded batches like xfeed.retention.delete_in_batches, so a month can be
+spread over several rows. Archived items are removed from the search index and can only be read back as a stream of
+unsaved items, with get_archived_items.
+"""
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime
+from xfeed.retention import delete_rows, get_batch_pause, get_batch_size, get_content_field
+from xfeed.search import get_kind
+import json
+import time
+import zlib
+
+
+def get_date_field(model):
+    """Returns the name of the date field items are archived by, 'create_date' or 'pub_date'."""
+    return 'create_date' if get_kind(model) == 'tweet' else 'pub_date'
+
+
+def get_archived_fields(model):
+    """Returns the names of the fields of a model that are archived. The primary key and feed are not archived, the
+    content of a RSSItem is archived as its description."""
+    content_field = get_content_field(model)
+    names = [field.name for field in model._meta.concrete_fields
+             if not field.primary_key and field.name != 'feed' and field is not content_field]
+    if content_field is not None:
+        names.append('description')
+    return names
+
+
+def get_compression_level():
+    """Returns the zlib compression level of archives, settings.XFEED_ARCHIVE_COMPRESSION_LEVEL or 6."""
+    return getattr(settings, 'XFEED_ARCHIVE_COMPRESSION_LEVEL', 6)
+
+
+def encode_value(value):
+    """Encodes the values json can not encode, dates are encoded in ISO 8601 format. Used as default of json.dumps."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def decode_dates(model, item):
+    """Decodes the dates of a dict of field values of a model, encoded by encode_value."""
+    for field in model._meta.concrete_fields:
+        if field.get_internal_type() == 'DateTimeField' and item.get(field.name):
+            item[field.name] = parse_datetime(item[field.name])
+    return item
+
+
+def pack_items(items):
+    """Returns the compressed JSON of a list of item dicts."""
+    return zlib.compress(json.dumps(items, default=encode_value, separators=(',', ':')), get_compression_level())
+
+
+def unpack_items(model, data):
+    """Returns the item dicts of compressed JSON made by pack_items."""
+    return [decode_dates(model, item) for item in json.loads(zlib.decompress(bytes(data)))]
+
+
+def archive_in_batches(queryset, batch_size=None, pause=None):
+    """Moves the Tweets or RSSItems of a queryset to the archive, in batches of the oldest items.
+    Every batch is archived and deleted in its own short transaction.
+
+    :param queryset: The rows to archive.
+    :type queryset: QuerySet
+    :param batch_size: The amount of rows to archive per batch. Defaults to get_batch_size().
+    :type batch_size: int
+    :param pause: The amount of seconds to pause between two batches. Defaults to get_batch_pause().
+    :type pause: float
+    :returns:  int -- the amount of archived rows
+
+    """
+    from xfeed.models import ItemArchive
+    if batch_size is None:
+        batch_size = get_batch_size()
+    if pause is None:
+        pause = get_batch_pause()
+    model = queryset.model
+    using = router.db_for_write(model)
+    kind = get_kind(model)
+    date_field = get_date_field(model)
+    names = get_archived_fields(model)
+    content_field = get_content_field(model)
+    columns = ['content__body' if name == 'description' else name for name in names]
+    rows = queryset.order_by(date_field, 'pk').values_list('pk', 'feed', content_field.name if content_field else 'pk',
+                                                           *columns)
+    archived = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(rows[:batch_size])
+            if not batch:
+                return archived
+            months = {}
+            for row in batch:
+                item = dict(zip(names, row[3:]))
+                date = item[date_field]
+                if timezone.is_aware(date):
+                    date = timezone.localtime(date, timezone.utc)
+                months.setdefault((row[1], date.year, date.month), []).append(item)
+            ItemArchive.objects.using(using).bulk_create([
+                ItemArchive(feed_id=feed_id, kind=kind, month=datetime(year, month, 1).date(),
+                            first_date=items[0][date_field], last_date=items[-1][date_field], item_count=len(items),
+                            data=pack_items(items))
+                for (feed_id, year, month), items in sorted(months.items())])
+            content_ids = set(row[2] for row in batch if row[2] is not None) if content_field else ()
+            archived += delete_rows(model, [row[0] for row in batch], content_ids, using)
+        if len(batch) < batch_size:
+            return archived
+        if pause:
+            time.sleep(pause)
+
+
+def get_archived_items(feed, model, start=None, end=None):
+    """Streams the archived Tweets or RSSItems of a Feed back, oldest archive first. The archive rows are fetched one
+    at a time, so only one row is decompressed in memory.
+
+    :param feed: The feed of the items.
+    :type feed: Feed
+    :param model: Tweet or RSSItem.
+    :type model: Model
+    :param start: If given, only items of this date or later are returned.
+    :type start: DateTime
+    :param end: If given, only items before this date are returned.
+    :type end: DateTime
+    :returns:  generator -- unsaved Tweets or RSSItems
+
+    """
+    from xfeed.models import ItemArchive
+    date_field = get_date_field(model)
+    archives = ItemArchive.objects.filter(feed=feed, kind=get_kind(model))
+    if start is not None:
+        archives = archives.filter(last_date__gte=start)
+    if end is not None:
+        archives = archives.filter(first_date__lt=end)
+    for data in archives.order_by('first_date', 'pk').values_list('data', flat=True).iterator():
+        for item in unpack_items(model, data):
+            date = item[date_field]
+            if (start is None or date >= start) and (end is None or date < end):
+                yield model(feed=feed, **item)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Provides functions for caching output that is generated from the items of a feed.
+
+Every feed stores a version in the database (Feed.version). Cache keys for output of a feed contain this version, so
+bumping the version invalidates all cached output of the feed at once, in every process that shares the cache. The
+version is read from the feed instance the output is generated for, the cache itself is never asked for it.
+"""
+
+from django.conf import settings
+from django.utils import timezone
+import hashlib
+import uuid
+
+
+def new_version():
+    """Returns a new random cache version, the default of Feed.version."""
+    return uuid.uuid4().hex
+
+
+def bump_feed_version(feed_id):
+    """Invalidates all cached output of a feed, by storing a new version and the date its items changed.
+
+    :param feed_id: The primary key of the feed.
+    :type feed_id: int
+    :returns:  tuple -- (version, changed_at), for callers that hold an instance of the feed
+
+    """
+    from xfeed.models import Feed
+    version, changed_at = new_version(), timezone.now()
+    Feed.objects.filter(pk=feed_id).update(version=version, content_changed_at=changed_at)
+    return version, changed_at
+
+
+def get_cache_key(feed, name, *args):
+    """Returns a cache key for output of a feed, that changes when the feed version is bumped.
+
+    :param feed: The feed, with its version loaded.
+    :type feed: Feed
+    :param name: The name of the output (e.g. 'feed_list').
+    :type name: str
+    :param args: The arguments the output was generated with.
+    :returns:  str -- the cache key
+
+    """
+    args_hash = hashlib.md5(repr(args)).hexdigest()
+    return 'xfeed:%s:%s:%s:%s' % (name, feed.pk, feed.version, args_hash)
+
+
+def get_group_cache_key(feeds, name, *args):
+    """Returns a cache key for output of a group of feeds, that changes when the version of any of them is bumped.
+
+    :param feeds: The feeds, with their versions loaded.
+    :type feeds: list
+    :param name: The name of the output (e.g. 'syndication').
+    :type name: str
+    :param args: The arguments the output was generated with.
+    :returns:  str -- the cache key
+
+    """
+    versions = sorted((feed.pk, feed.version) for feed in feeds)
+    return 'xfeed:%s:group:%s' % (name, hashlib.md5(repr((versions, args))).hexdigest())
+
+
+def get_cache_timeout():
+    """Returns the amount of seconds output of a feed is cached, settings.XFEED_CACHE_TIMEOUT or 3600."""
+    return getattr(settings, 'XFEED_CACHE_TIMEOUT', 3600)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Provides canonicalize_url and get_content_digest, functions for recognizing the same RSS item across feeds and fetches.
+
+The same article is often published with different URLs: with tracking parameters, an uppercase host, a default port
+or a fragment. canonicalize_url removes these differences, so links and link-based original IDs of the same article
+are equal. Descriptions are stored once per content digest (see RSSContent) and shared by the items of every feed.
+"""
+
+from django.conf import settings
+from django.utils.encoding import force_bytes
+import hashlib
+import urlparse
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = frozenset([
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_hsenc', '_hsmi', 'ref_src',
+])
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def is_tracking_param(name):
+    """Returns whether a query parameter is a tracking parameter, including settings.XFEED_TRACKING_PARAMS."""
+    name = name.lower()
+    return (name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES) or
+            name in getattr(settings, 'XFEED_TRACKING_PARAMS', ()))
+
+
+def canonicalize_url(url):
+    """Returns the canonical form of a URL: the scheme and host in lowercase, without a default port, fragment and
+    tracking parameters. The order and encoding of the other query parameters is kept. Values that are not absolute
+    URLs (e.g. tag: URIs) are returned without surrounding whitespace.
+
+    :param url: The URL to canonicalize.
+    :type url: unicode
+    :returns:  unicode -- the canonical URL
+
+    """
+    url = url.strip()
+    try:
+        parts = urlparse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.scheme.lower() not in DEFAULT_PORTS or not parts.hostname:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname.rstrip('.')
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc = '%s:%s' % (netloc, port)
+    query = '&'.join(param for param in parts.query.split('&')
+                     if param and not is_tracking_param(param.split('=', 1)[0]))
+    return urlparse.urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def get_content_digest(body):
+    """Returns the digest a description is stored under."""
+    return hashlib.sha1(force_bytes(body)).hexdigest()
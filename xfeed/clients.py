@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Provides get_twitter_client, a function that returns the TwitterClient shared by all Twitter feeds in the process.
+
+TwitterClient wraps a single authenticated twitter.Api, so credentials and the HTTP connection pool are reused
+across feeds. It keeps track of the rate limit of the user timeline, and raises RateLimited instead of making
+requests that are bound to fail until the limit resets.
+"""
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+from datetime import datetime, timedelta
+from xfeed.exceptions import NoCredentials, RateLimited
+import threading
+import twitter
+
+# Rate limit window of the Twitter API, used when the API does not tell when the limit resets
+RATE_LIMIT_WINDOW = timedelta(minutes=15)
+RATE_LIMIT_ERROR_CODE = 88
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class TwitterClient(object):
+    """
+    Fetches user timelines with a shared twitter.Api while keeping track of the remaining rate limit
+    """
+    def __init__(self, api):
+        self.api = api
+        self.timeline_url = '%s/statuses/user_timeline.json' % api.base_url
+        self.remaining = None
+        self.reset = None
+        self.lock = threading.Lock()
+
+    def check_rate_limit(self):
+        """Checks whether requests can be made.
+
+        :raises: RateLimited
+
+        """
+        with self.lock:
+            if self.remaining == 0 and self.reset is not None:
+                if self.reset > timezone.now():
+                    raise RateLimited(_('Twitter rate limit exhausted'), self.reset)
+                self.remaining = None
+                self.reset = None
+
+    def update_rate_limit(self):
+        """Reads the rate limit of the last user timeline response from the API."""
+        rate_limit = getattr(self.api, 'rate_limit', None)
+        if rate_limit is None:
+            return
+        limit = rate_limit.get_limit(self.timeline_url)
+        with self.lock:
+            self.remaining = limit.remaining
+            if limit.reset:
+                self.reset = timezone.make_aware(datetime.utcfromtimestamp(limit.reset), timezone.utc)
+
+    def get_user_timeline(self, **kwargs):
+        """Fetches statuses of a user timeline. Takes the same arguments as twitter.Api.GetUserTimeline.
+
+        :returns:  list -- the statuses
+        :raises: RateLimited
+
+        """
+        self.check_rate_limit()
+        try:
+            statuses = self.api.GetUserTimeline(**kwargs)
+        except twitter.TwitterError, e:
+            if not is_rate_limit_error(e):
+                raise
+            with self.lock:
+                self.remaining = 0
+                if self.reset is None or self.reset <= timezone.now():
+                    self.reset = timezone.now() + RATE_LIMIT_WINDOW
+                reset = self.reset
+            raise RateLimited(_('Twitter rate limit exhausted'), reset)
+        self.update_rate_limit()
+        return statuses
+
+
+def is_rate_limit_error(error):
+    """Returns whether a TwitterError was raised because of an exhausted rate limit.
+
+    :param error: The error to check.
+    :type error: twitter.TwitterError
+    :returns:  bool
+
+    """
+    messages = error.message if isinstance(error.message, list) else [error.message]
+    for message in messages:
+        if isinstance(message, dict) and message.get('code') == RATE_LIMIT_ERROR_CODE:
+            return True
+    return 'rate limit exceeded' in unicode(error).lower()
+
+
+def get_twitter_client():
+    """Returns the TwitterClient for the Twitter credentials in the settings. The client is created once per process,
+    its requests time out after settings.XFEED_REFRESH_TIMEOUT (defaults to 30) seconds.
+
+    :returns:  TwitterClient
+    :raises: NoCredentials
+
+    """
+    consumer_key = getattr(settings, 'TWITTER_CONSUMER_KEY', None)
+    consumer_secret = getattr(settings, 'TWITTER_CONSUMER_SECRET', None)
+    access_token_key = getattr(settings, 'TWITTER_ACCESS_TOKEN_KEY', None)
+    access_token_secret = getattr(settings, 'TWITTER_ACCESS_TOKEN_SECRET', None)
+
+    if not consumer_key:
+        raise NoCredentials(_('Twitter consumer key missing'))
+    if not consumer_secret:
+        raise NoCredentials(_('Twitter consumer secret missing'))
+    if not access_token_key:
+        raise NoCredentials(_('Twitter access token key missing'))
+    if not access_token_secret:
+        raise NoCredentials(_('Twitter access token secret missing'))
+
+    credentials = (consumer_key, consumer_secret, access_token_key, access_token_secret)
+    with _clients_lock:
+        if credentials not in _clients:
+            _clients[credentials] = TwitterClient(twitter.Api(consumer_key=consumer_key,
+                                                              consumer_secret=consumer_secret,
+                                                              access_token_key=access_token_key,
+                                                              access_token_secret=access_token_secret,
+                                                              timeout=getattr(settings, 'XFEED_REFRESH_TIMEOUT', 30)))
+        return _clients[credentials]
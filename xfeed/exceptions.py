@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Provides the exceptions that are raised while refreshing feeds.
+"""
+
+
+class NoCredentials(Exception):
+    """
+    Exception for incomplete credentials
+    """
+    pass
+
+
+class RateLimited(Exception):
+    """
+    Exception for an exhausted rate limit. The 'reset' attribute holds the datetime at which the limit resets.
+    """
+    def __init__(self, message, reset):
+        super(RateLimited, self).__init__(message)
+        self.reset = reset
+
+
+class FetchError(Exception):
+    """
+    Exception for a feed document that could not be fetched
+    """
+    pass
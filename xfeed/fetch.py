@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Provides fetch, a function for downloading a feed document with bounded memory.
+
+The response is read in chunks and decompressed while streaming. Reading stops with a FetchError as soon as the
+(decompressed) document exceeds the maximum size, so an oversized or malicious feed never ends up in memory as a whole.
+Conditional request headers are sent along, and permanent redirects are reported so the caller can store the new URL.
+The timeout applies to every socket operation and to the download as a whole: before every read the socket timeout is
+lowered to the time that is left, so a server that trickles the body can not hold on to a worker either.
+"""
+
+from django.conf import settings
+from django.utils.translation import ugettext as _
+from xfeed.exceptions import FetchError
+import socket
+import time
+import urllib2
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = 'django-xfeed'
+
+
+def get_max_bytes():
+    """Returns the maximum size of a feed document, settings.XFEED_MAX_RESPONSE_BYTES or 10 MB."""
+    return getattr(settings, 'XFEED_MAX_RESPONSE_BYTES', 10 * 1024 * 1024)
+
+
+class RedirectHandler(urllib2.HTTPRedirectHandler):
+    """
+    Follows redirects while keeping track of their status codes. Also follows 308 Permanent Redirect, which urllib2
+    does not know, like a 307 Temporary Redirect.
+    """
+    def __init__(self):
+        self.codes = []
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        self.codes.append(code)
+        return urllib2.HTTPRedirectHandler.redirect_request(self, req, fp, 307 if code == 308 else code, msg, headers,
+                                                            newurl)
+
+    http_error_308 = urllib2.HTTPRedirectHandler.http_error_302
+
+
+class DeflateDecompressor(object):
+    """
+    Decompresses a deflate response. Servers send it zlib-wrapped, as the specification says, or as raw deflate data,
+    which is tried when the data does not start with a zlib header.
+    """
+    def __init__(self):
+        self.decompressor = zlib.decompressobj()
+        self.started = False
+
+    @property
+    def unconsumed_tail(self):
+        return self.decompressor.unconsumed_tail
+
+    def decompress(self, data, max_length=0):
+        if not self.started:
+            self.started = True
+            try:
+                return self.decompressor.decompress(data, max_length)
+            except zlib.error:
+                self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decompressor.decompress(data, max_length)
+
+    def flush(self):
+        return self.decompressor.flush()
+
+
+def get_socket(response):
+    """Returns the socket a urllib2 response is read from, or None if it can not be found (e.g. for file: URLs).
+
+    :param response: The response of urllib2.urlopen.
+    :type response: addinfourl
+    :returns:  socket.socket
+
+    """
+    # addinfourl wraps a socket._fileobject around the httplib response, which reads from a socket._fileobject itself
+    http_response = getattr(response.fp, '_sock', None)
+    return getattr(getattr(http_response, 'fp', None), '_sock', None)
+
+
+def get_decompressor(content_encoding):
+    """Returns a zlib decompressor for a Content-Encoding, or None if the content is not compressed.
+
+    :param content_encoding: The value of the Content-Encoding header.
+    :type content_encoding: str
+    :returns:  zlib.Decompress or DeflateDecompressor
+    :raises: FetchError
+
+    """
+    content_encoding = (content_encoding or '').strip().lower()
+    if content_encoding in ('', 'identity'):
+        return None
+    if content_encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        return DeflateDecompressor()
+    raise FetchError(_('Unsupported content encoding %s') % content_encoding)
+
+
+def fetch(url, etag=None, modified=None, max_bytes=None, timeout=None):
+    """Fetches a feed document.
+
+    :param url: The URL to fetch.
+    :type url: str
+    :param etag: If given, sent as If-None-Match header.
+    :type etag: str
+    :param modified: If given, sent as If-Modified-Since header.
+    :type modified: str
+    :param max_bytes: The maximum size of the decompressed document. Defaults to get_max_bytes().
+    :type max_bytes: int
+    :param timeout: Timeout in seconds for every socket operation, and the deadline of the whole fetch.
+                    Defaults to the default socket timeout, without a deadline.
+    :type timeout: int
+    :returns:  Object -- holds the status, the final url, the url of a permanent redirect (or None),
+               the etag, the modified date, the response headers and the body (None for a 304)
+    :raises: FetchError
+
+    """
+    if max_bytes is None:
+        max_bytes = get_max_bytes()
+    deadline = time.time() + timeout if timeout is not None else None
+    request = urllib2.Request(url, headers={'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'})
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if modified:
+        request.add_header('If-Modified-Since', modified)
+    redirect_handler = RedirectHandler()
+    opener = urllib2.build_opener(redirect_handler)
+    try:
+        response = opener.open(request, **({'timeout': timeout} if timeout is not None else {}))
+    except urllib2.HTTPError, e:
+        if e.code != 304:
+            raise FetchError(_('HTTP error %s') % e.code)
+        return {'status': 304, 'url': url, 'permanent_url': None, 'etag': etag, 'modified': modified,
+                'headers': {}, 'body': None}
+    except urllib2.URLError, e:
+        raise FetchError(e.reason)
+
+    try:
+        headers = dict((key.lower(), value) for key, value in response.info().items())
+        if int(headers.get('content-length') or 0) > max_bytes and not headers.get('content-encoding'):
+            raise FetchError(_('Response is larger than %s bytes') % max_bytes)
+        decompressor = get_decompressor(headers.get('content-encoding'))
+        sock = get_socket(response)
+        chunks = []
+        size = 0
+        while True:
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise FetchError(_('Fetching took longer than %s seconds') % timeout)
+                if sock is not None:
+                    # A read waits for the time that is left at most, not for another full timeout
+                    sock.settimeout(remaining)
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if decompressor is not None:
+                # Never decompress more than the remaining allowance, compressed bombs stay small in memory
+                chunk = decompressor.decompress(chunk, max_bytes - size + 1)
+                if decompressor.unconsumed_tail:
+                    raise FetchError(_('Response is larger than %s bytes') % max_bytes)
+            size += len(chunk)
+            if size > max_bytes:
+                raise FetchError(_('Response is larger than %s bytes') % max_bytes)
+            chunks.append(chunk)
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            size += len(chunk)
+            if size > max_bytes:
+                raise FetchError(_('Response is larger than %s bytes') % max_bytes)
+            chunks.append(chunk)
+    except zlib.error, e:
+        raise FetchError(_('Invalid compressed response: %s') % e)
+    except socket.timeout, e:
+        if timeout is None:
+            raise FetchError(e)
+        raise FetchError(_('Fetching took longer than %s seconds') % timeout)
+    finally:
+        response.close()
+
+    final_url = response.geturl()
+    permanent_url = None
+    if redirect_handler.codes and all(code in (301, 308) for code in redirect_handler.codes):
+        permanent_url = final_url
+    return {'status': response.getcode(), 'url': final_url, 'permanent_url': permanent_url,
+            'etag': headers.get('etag'), 'modified': headers.get('last-modified'), 'headers': headers,
+            'body': ''.join(chunks)}
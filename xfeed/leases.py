@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Provides claim_feeds, release_feeds and refresh_claimed_feeds, functions for distributing due feeds over refresh
+workers on several hosts.
+
+A worker claims feeds by setting a lease on them: the lease_owner and lease_expires_at fields of Feed. The owner of a
+lease is the ID of the worker followed by a token of the claim, so a claim finds its own feeds again without comparing
+dates, which some databases store with less precision. A feed with an active lease is skipped by the other workers, so
+every due feed is refreshed by one worker. While a batch is refreshed its leases are renewed, a lease that is not
+released, because its worker died, expires after settings.XFEED_LEASE_DURATION seconds (defaults to 600).
+
+On PostgreSQL 9.5+ and MySQL 8 the due feeds are locked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers
+never wait for each other. Other databases fall back to a single conditional UPDATE, which only sets the leases of
+feeds that are still free.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, F, Q, Value, When
+from django.utils import timezone
+from datetime import timedelta
+from xfeed.models import Feed
+from xfeed.refresh import get_due_feeds, refresh_feeds
+import os
+import socket
+import threading
+import uuid
+
+
+def get_worker_id():
+    """Returns an ID for a refresh worker that is unique across hosts and processes."""
+    return '%s:%s:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def get_lease_duration():
+    """Returns the time after which an unreleased lease expires, settings.XFEED_LEASE_DURATION or 600 seconds."""
+    return timedelta(seconds=getattr(settings, 'XFEED_LEASE_DURATION', 600))
+
+
+def supports_skip_locked():
+    """Returns whether the database supports SELECT ... FOR UPDATE SKIP LOCKED."""
+    if connection.vendor == 'postgresql':
+        return connection.pg_version >= 90500
+    if connection.vendor == 'mysql':
+        return connection.mysql_version >= (8, 0, 1)
+    return False
+
+
+def claim_feeds(queryset, worker_id, limit):
+    """Claims due feeds that are not leased by another worker, the feeds that are due the longest first.
+
+    :param queryset: The feeds to claim from.
+    :type queryset: QuerySet
+    :param worker_id: The ID of the claiming worker, see get_worker_id.
+    :type worker_id: str
+    :param limit: The maximum amount of feeds to claim.
+    :type limit: int
+    :returns:  list -- the claimed feeds
+
+    """
+    now = timezone.now()
+    expires = now + get_lease_duration()
+    owner = '%s/%s' % (worker_id, uuid.uuid4().hex[:8])
+    available = get_due_feeds(queryset).filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now))
+    pks = available.order_by('next_refresh_at', 'pk').values_list('pk', flat=True)[:limit]
+    if supports_skip_locked():
+        with transaction.atomic():
+            sql, params = pks.query.sql_with_params()
+            cursor = connection.cursor()
+            cursor.execute(sql + ' FOR UPDATE SKIP LOCKED', params)
+            pks = [row[0] for row in cursor.fetchall()]
+            if pks:
+                Feed.objects.filter(pk__in=pks).update(lease_owner=owner, lease_expires_at=expires)
+    else:
+        # Not selected in the same transaction, which would need a lock upgrade on databases like SQLite.
+        # Instead the lease condition is checked again, so a feed claimed in the meantime is not taken over.
+        pks = list(pks)
+        if pks:
+            available.filter(pk__in=pks).update(lease_owner=owner, lease_expires_at=expires)
+    if not pks:
+        return []
+    return list(Feed.objects.filter(pk__in=pks, lease_owner=owner))
+
+
+def get_lease_owners(feeds, worker_id):
+    """Returns the owners of the leases a worker holds on feeds, see claim_feeds."""
+    return set(feed.lease_owner for feed in feeds if feed.lease_owner.startswith(worker_id + '/'))
+
+
+def renew_leases(feeds, worker_id):
+    """Extends the leases a worker holds on feeds by settings.XFEED_LEASE_DURATION from now. Leases that expired and
+    were claimed by another worker in the meantime are left alone.
+
+    :param feeds: The claimed feeds.
+    :type feeds: iterable
+    :param worker_id: The ID of the worker that claimed the feeds.
+    :type worker_id: str
+    :returns:  int -- the amount of renewed leases
+
+    """
+    feeds = list(feeds)
+    if not feeds:
+        return 0
+    return Feed.objects.filter(pk__in=[feed.pk for feed in feeds],
+                               lease_owner__in=get_lease_owners(feeds, worker_id)).update(
+        lease_expires_at=timezone.now() + get_lease_duration())
+
+
+class LeaseRenewer(threading.Thread):
+    """
+    Renews the leases of a batch of feeds every third of the lease duration, until it is stopped. Keeps a batch that
+    takes longer than the lease duration from being claimed by another worker while it is refreshed.
+    """
+    def __init__(self, feeds, worker_id):
+        super(LeaseRenewer, self).__init__()
+        self.daemon = True
+        self.feeds = feeds
+        self.worker_id = worker_id
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = get_lease_duration().total_seconds() / 3
+        try:
+            while not self.stopped.wait(interval):
+                renew_leases(self.feeds, self.worker_id)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def release_feeds(feeds, worker_id):
+    """Releases the leases a worker holds on feeds. A refresh schedules the next refresh of a feed, a feed that is
+    still due (e.g. because its refresh was interrupted) is scheduled after settings.XFEED_MIN_REFRESH_INTERVAL
+    (defaults to 300) seconds, so it is not claimed again right away.
+
+    :param feeds: The claimed feeds.
+    :type feeds: iterable
+    :param worker_id: The ID of the worker that claimed the feeds.
+    :type worker_id: str
+
+    """
+    feeds = list(feeds)
+    if not feeds:
+        return
+    now = timezone.now()
+    retry = now + timedelta(seconds=getattr(settings, 'XFEED_MIN_REFRESH_INTERVAL', 300))
+    still_due = Q(next_refresh_at__isnull=True) | Q(next_refresh_at__lte=now)
+    Feed.objects.filter(pk__in=[feed.pk for feed in feeds], lease_owner__in=get_lease_owners(feeds, worker_id)).update(
+        lease_owner='', lease_expires_at=None,
+        next_refresh_at=Case(When(still_due, then=Value(retry, output_field=DateTimeField())),
+                             default=F('next_refresh_at')))
+
+
+def refresh_claimed_feeds(queryset, worker_id=None, batch_size=10, refresh=refresh_feeds, **kwargs):
+    """Claims, refreshes and releases due feeds in batches until no due feed is left to claim.
+    Refreshed feeds are scheduled in the future, so they are not claimed again in the same run. The leases of a batch
+    are renewed while it is refreshed, see LeaseRenewer.
+
+    :param queryset: The feeds to refresh.
+    :type queryset: QuerySet
+    :param worker_id: The ID of the worker. Defaults to a new ID.
+    :type worker_id: str
+    :param batch_size: The amount of feeds to claim at once.
+    :type batch_size: int
+    :param refresh: The function that refreshes a batch, xfeed.refresh.refresh_feeds or
+                    xfeed.pipeline.pipeline_refresh_feeds.
+    :type refresh: callable
+    :param kwargs: Passed on to the refresh function.
+    :returns:  Object -- like refresh_feeds, for all batches together
+    :raises: ValueError
+
+    """
+    if worker_id is None:
+        worker_id = get_worker_id()
+    result = {'succeeded': [], 'deferred': [], 'failed': [], 'elapsed': 0}
+    while True:
+        feeds = claim_feeds(queryset, worker_id, batch_size)
+        if not feeds:
+            return result
+        renewer = LeaseRenewer(feeds, worker_id)
+        renewer.start()
+        try:
+            batch_result = refresh(feeds, **kwargs)
+        finally:
+            renewer.stop()
+            release_feeds(feeds, worker_id)
+        for key in ('succeeded', 'deferred', 'failed'):
+            result[key].extend(batch_result[key])
+        result['elapsed'] += batch_result['elapsed']
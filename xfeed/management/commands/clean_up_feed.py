@@ -8,7 +8,8 @@ from datetime import datetime
 
 class Command(BaseCommand):
     """
-    This command will clean up a feed by removing Tweets and RSS item before a specified date
+    This command will clean up a feed by removing Tweets and RSS item before a specified date, or by moving them to
+    the archive with --archive
     """
     help = _('Remove all items from feed before a specified date')
 
@@ -17,6 +18,10 @@ class Command(BaseCommand):
         parser.add_argument('feed_uuid', nargs='+', type=str)
         parser.add_argument('date_string', nargs='+', type=str)
 
+        # Named (optional) arguments
+        parser.add_argument('--archive', action='store_true', default=False,
+                            help='Move the items to the archive instead of deleting them')
+
     def handle(self, *args, **options):
         translation.activate(settings.LANGUAGE_CODE)
         try:
@@ -27,6 +32,7 @@ class Command(BaseCommand):
             date = datetime.strptime(options['date_string'][0], '%Y-%m-%d')
         except:
             raise CommandError("Invalid date format. Must be YYYY-MM-DD.")
-        result = feed.clean_up(date)
-        self.stdout.write('Successfully cleaned up %s-feed %s. %s tweets and %s RSS items were removed.' % (
-            feed.get_feed_type_display(), feed.name, result['tweets_count'], result['rss_items_count']))
+        result = feed.clean_up(date, archive=options['archive'])
+        self.stdout.write('Successfully cleaned up %s-feed %s. %s tweets and %s RSS items were %s.' % (
+            feed.get_feed_type_display(), feed.name, result['tweets_count'], result['rss_items_count'],
+            'archived' if options['archive'] else 'removed'))
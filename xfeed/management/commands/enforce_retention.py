@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from xfeed.models import Feed, RSSItem
+from xfeed.retention import delete_orphaned_contents
+from django.utils import translation
+from django.utils.translation import ugettext as _
+
+
+class Command(BaseCommand):
+    """
+    This command will remove the Tweets and RSS items that fall outside the retention policy of every feed, and the
+    RSS contents no item uses anymore (e.g. after deleting a feed). With --archive the items are moved to the archive
+    """
+    help = _('Remove items outside the retention policy of every feed')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument('--batch-size', type=int, default=None, dest='batch_size',
+                            help='Amount of items to delete per batch')
+        parser.add_argument('--pause', type=float, default=None,
+                            help='Amount of seconds to pause between two batches')
+        parser.add_argument('--archive', action='store_true', default=False,
+                            help='Move the items to the archive instead of deleting them')
+
+    def handle(self, *args, **options):
+        translation.activate(settings.LANGUAGE_CODE)
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError("The batch size must be at least 1")
+        tweets_count = 0
+        rss_items_count = 0
+        feeds = Feed.objects.filter(Q(retention_days__isnull=False) | Q(retention_max_items__isnull=False))
+        for feed in feeds:
+            result = feed.enforce_retention(batch_size=options['batch_size'], pause=options['pause'],
+                                            archive=options['archive'])
+            tweets_count += result['tweets_count']
+            rss_items_count += result['rss_items_count']
+            self.stdout.write('Enforced retention of %s-feed %s. %s tweets and %s RSS items were %s.' % (
+                feed.get_feed_type_display(), feed.name, result['tweets_count'], result['rss_items_count'],
+                'archived' if options['archive'] else 'removed'))
+        contents_count = delete_orphaned_contents(RSSItem, batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write('Successfully enforced retention. %s tweets, %s RSS items and %s RSS contents were '
+                          'removed.' % (tweets_count, rss_items_count, contents_count))
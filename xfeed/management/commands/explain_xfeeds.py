@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from xfeed.models import Feed, RSSItem, Tweet
+from django.utils import timezone, translation
+from django.utils.translation import ugettext as _
+
+
+class Command(BaseCommand):
+    """
+    This command shows the query plans of the queries that read and clean up items of a feed
+    """
+    help = _('Show the query plans of the item queries of a feed')
+
+    def add_arguments(self, parser):
+        # Positional arguments
+        parser.add_argument('feed_uuid', nargs='+', type=str)
+
+    def handle(self, *args, **options):
+        translation.activate(settings.LANGUAGE_CODE)
+        try:
+            feed = Feed.objects.get(uuid=options['feed_uuid'][0])
+        except Feed.DoesNotExist:
+            raise CommandError("Feed does not exist")
+        if connection.vendor == 'sqlite':
+            explain = 'EXPLAIN QUERY PLAN '
+        elif connection.vendor in ('postgresql', 'mysql'):
+            explain = 'EXPLAIN '
+        else:
+            raise CommandError("Query plans are not supported for database vendor %s" % connection.vendor)
+
+        now = timezone.now()
+        queries = [
+            ('generate_feed_list (Twitter)', Tweet.objects.filter(feed=feed, hide=False)[:10]),
+            ('generate_feed_list (RSS)', RSSItem.objects.filter(feed=feed, hide=False)[:10]),
+            ('clean_up (Twitter)', Tweet.objects.filter(feed=feed, create_date__lt=now).values_list('pk')),
+            ('clean_up (RSS)', RSSItem.objects.filter(feed=feed, pub_date__lt=now).values_list('pk')),
+            ('refresh (Twitter)', Tweet.objects.filter(feed=feed, ogid__in=['0']).order_by().values_list('ogid')),
+            ('refresh (RSS)', RSSItem.objects.filter(feed=feed, ogid__in=['0']).order_by().values_list('ogid')),
+        ]
+        cursor = connection.cursor()
+        for name, queryset in queries:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(explain + sql, params)
+            self.stdout.write('%s\n  %s' % (name, sql % tuple(repr(p) for p in params)))
+            for row in cursor.fetchall():
+                self.stdout.write('  %s' % ' '.join(unicode(column) for column in row))
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from xfeed.models import Feed, RSSItem, Tweet
+from xfeed.retention import get_batch_size
+from xfeed.search import index_items, unindex_items
+from django.utils import translation
+from django.utils.translation import ugettext as _
+
+
+class Command(BaseCommand):
+    """
+    This command will add the items of feeds to the search index, for items that were stored before search existed.
+    Items are re-indexed in batches, so it is safe to run on a live database.
+    """
+    help = _('Add the items of feeds to the search index')
+
+    def add_arguments(self, parser):
+        # Positional arguments
+        parser.add_argument('feed_uuid', nargs='*', type=str)
+
+    def handle(self, *args, **options):
+        translation.activate(settings.LANGUAGE_CODE)
+        feeds = Feed.objects.all()
+        if options['feed_uuid']:
+            feeds = feeds.filter(uuid__in=options['feed_uuid'])
+            if len(feeds) != len(set(options['feed_uuid'])):
+                raise CommandError("Feed does not exist")
+        batch_size = get_batch_size()
+        count = 0
+        for feed in feeds:
+            for model in (Tweet, RSSItem):
+                pks = model.objects.filter(feed=feed).order_by('pk').values_list('pk', flat=True)
+                last_pk = 0
+                while True:
+                    batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+                    if not batch:
+                        break
+                    with transaction.atomic():
+                        unindex_items(model, batch)
+                        index_items(model, model.objects.filter(pk__in=batch))
+                    count += len(batch)
+                    last_pk = batch[-1]
+        self.stdout.write('Successfully indexed %s items.' % count)
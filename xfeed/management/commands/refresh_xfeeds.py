@@ -1,8 +1,14 @@
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from xfeed.exceptions import RateLimited
+from xfeed.leases import get_worker_id, refresh_claimed_feeds
 from xfeed.models import Feed
-from django.utils import translation
+from xfeed.pipeline import pipeline_refresh_feeds
+from xfeed.refresh import get_due_feeds, refresh_feeds
+from django.db.models import Min
+from django.utils import timezone, translation
 from django.utils.translation import ugettext as _
+import time
 
 
 class Command(BaseCommand):
@@ -11,8 +17,84 @@ class Command(BaseCommand):
     """
     help = _('Refresh all active feeds')
 
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Amount of feeds to refresh at the same time')
+        parser.add_argument('--per-host', type=int, default=None, dest='per_host',
+                            help='Maximum amount of feeds of the same host to refresh at the same time')
+        parser.add_argument('--timeout', type=int, default=None,
+                            help='Timeout in seconds for fetching a single feed')
+        parser.add_argument('--due-only', action='store_true', default=False, dest='due_only',
+                            help='Only refresh feeds of which the next refresh date has passed')
+        parser.add_argument('--daemon', action='store_true', default=False,
+                            help='Keep running and refresh feeds when they are due')
+        parser.add_argument('--pipeline', action='store_true', default=False,
+                            help='Fetch, parse and store feeds in a pipeline, parsing in a pool of processes')
+        parser.add_argument('--parse-workers', type=int, default=None, dest='parse_workers',
+                            help='Amount of processes that parse feeds with --pipeline, defaults to the amount of CPUs')
+        parser.add_argument('--distributed', action='store_true', default=False,
+                            help='Claim due feeds with a lease, so several hosts can refresh the same feeds')
+
     def handle(self, *args, **options):
         translation.activate(settings.LANGUAGE_CODE)
-        for feed in Feed.objects.filter(is_active=True):
-            feed.refresh()
+        self.worker_id = get_worker_id()
+        if not options['daemon']:
+            result = self.refresh(options)
+            if result['failed']:
+                # Exits with a non-zero status, so cron and other schedulers notice the failures
+                raise CommandError('%s feeds failed to refresh' % len(result['failed']))
+            return
+        options['due_only'] = True
+        while True:
+            time.sleep(self.poll(options))
+
+    def poll(self, options):
+        """Refreshes the due feeds once, see --daemon.
+
+        :returns:  int -- the amount of seconds to sleep until the next feed is due
+
+        """
+        self.refresh(options)
+        # Sleep until the next feed is due, but wake up regularly to pick up new feeds and "refresh now" requests
+        wait = getattr(settings, 'XFEED_REFRESH_POLL_INTERVAL', 60)
+        next_refresh_at = Feed.objects.filter(is_active=True).aggregate(Min('next_refresh_at'))
+        if next_refresh_at['next_refresh_at__min'] is not None:
+            delta = next_refresh_at['next_refresh_at__min'] - timezone.now()
+            wait = min(wait, delta.days * 86400 + delta.seconds + 1)
+        return max(1, wait)
+
+    def refresh(self, options):
+        feeds = Feed.objects.filter(is_active=True)
+        kwargs = {'per_host': options['per_host'], 'timeout': options['timeout'], 'callback': self.report}
+        if options['pipeline']:
+            refresh = pipeline_refresh_feeds
+            kwargs.update(fetch_workers=options['workers'], parse_workers=options['parse_workers'])
+        else:
+            refresh = refresh_feeds
+            kwargs.update(workers=options['workers'])
+        try:
+            if options['distributed']:
+                # Due feeds only, claimed a few at a time so the other hosts get their share
+                batch_size = max(options['workers'], 1) * (8 if options['pipeline'] else 2)
+                result = refresh_claimed_feeds(feeds, worker_id=self.worker_id, batch_size=batch_size,
+                                               refresh=refresh, **kwargs)
+            else:
+                if options['due_only']:
+                    feeds = get_due_feeds(feeds)
+                result = refresh(feeds, **kwargs)
+        except ValueError, e:
+            raise CommandError(e)
+        self.stdout.write('Refreshed %s feeds in %.2f seconds. %s succeeded, %s deferred, %s failed.' % (
+            len(result['succeeded']) + len(result['deferred']) + len(result['failed']), result['elapsed'],
+            len(result['succeeded']), len(result['deferred']), len(result['failed'])))
+        return result
+
+    def report(self, feed, error):
+        if error is None:
             self.stdout.write('Successfully refreshed %s-feed %s.' % (feed.get_feed_type_display(), feed.uuid))
+        elif isinstance(error, RateLimited):
+            self.stdout.write('Deferred %s-feed %s until %s: %s' % (feed.get_feed_type_display(), feed.uuid,
+                                                                    error.reset, error))
+        else:
+            self.stderr.write('Failed to refresh %s-feed %s: %s' % (feed.get_feed_type_display(), feed.uuid, error))
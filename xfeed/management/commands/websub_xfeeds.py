@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from xfeed.websub import update_subscriptions
+from django.utils import translation
+from django.utils.translation import ugettext as _
+
+
+class Command(BaseCommand):
+    """
+    This command will request, renew and cancel the WebSub subscriptions of feeds with a hub.
+    Run it regularly (e.g. hourly), leases are renewed a day before they expire.
+    """
+    help = _('Request, renew and cancel WebSub subscriptions')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument('--timeout', type=int, default=30,
+                            help='Timeout in seconds for a single request to a hub')
+
+    def handle(self, *args, **options):
+        translation.activate(settings.LANGUAGE_CODE)
+        if not getattr(settings, 'XFEED_WEBSUB_CALLBACK_URL', None):
+            raise CommandError('WebSub is not enabled, set XFEED_WEBSUB_CALLBACK_URL')
+        result = update_subscriptions(timeout=options['timeout'])
+        for feed, error in result['failed']:
+            self.stderr.write('Failed to request the subscription of feed %s at %s: %s' % (feed.uuid, feed.hub, error))
+        self.stdout.write('Successfully requested %s subscriptions and %s unsubscriptions, %s failed.' % (
+            len(result['subscribed']), len(result['unsubscribed']), len(result['failed'])))
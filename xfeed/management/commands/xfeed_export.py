@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from xfeed.transfer import export_feeds
+from django.utils import timezone, translation
+from django.utils.translation import ugettext as _
+from datetime import datetime
+import argparse
+
+
+def parse_date(date_string):
+    """Returns the start of a day given as YYYY-MM-DD, in the current time zone. Used as the type of arguments."""
+    try:
+        date = datetime.strptime(date_string, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid date format. Must be YYYY-MM-DD.")
+    return timezone.make_aware(date, timezone.get_current_timezone()) if settings.USE_TZ else date
+
+
+class Command(BaseCommand):
+    """
+    This command will export feeds, their channel data and their Tweets and RSS items as NDJSON, one object per line.
+    Rows are selected in batches, so large tables are exported in constant memory.
+    """
+    help = _('Export feeds and their items as NDJSON')
+
+    def add_arguments(self, parser):
+        # Positional arguments
+        parser.add_argument('path', nargs='?', default='-', help='The file to write to, - for stdout')
+
+        # Named (optional) arguments
+        parser.add_argument('--feed', action='append', dest='uuids', default=[],
+                            help='Only export the feed with this uuid, can be given more than once')
+        parser.add_argument('--since', type=parse_date, default=None,
+                            help='Only export the items published on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', type=parse_date, default=None,
+                            help='Only export the items published before this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=1000, dest='batch_size',
+                            help='Amount of rows to select per query')
+
+    def handle(self, *args, **options):
+        translation.activate(settings.LANGUAGE_CODE)
+        if options['batch_size'] < 1:
+            raise CommandError("The batch size must be at least 1")
+        if options['path'] == '-':
+            result = export_feeds(self.stdout, options['uuids'], options['since'], options['until'],
+                                  options['batch_size'])
+            output = self.stderr
+        else:
+            with open(options['path'], 'w') as stream:
+                result = export_feeds(stream, options['uuids'], options['since'], options['until'],
+                                      options['batch_size'])
+            output = self.stdout
+        output.write('Successfully exported %s feeds, %s channels, %s tweets and %s RSS items.' % (
+            result['feeds_count'], result['channels_count'], result['tweets_count'], result['rss_items_count']))
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from xfeed.management.commands.xfeed_export import parse_date
+from xfeed.transfer import import_feeds
+from django.utils import translation
+from django.utils.translation import ugettext as _
+import sys
+
+
+class Command(BaseCommand):
+    """
+    This command will import feeds, their channel data and their Tweets and RSS items from NDJSON made by xfeed_export.
+    Existing feeds are kept and items of which the original ID is already stored for their feed are skipped, so an
+    import can be repeated. Items are inserted in batches, so large files are imported in constant memory.
+    """
+    help = _('Import feeds and their items from NDJSON')
+
+    def add_arguments(self, parser):
+        # Positional arguments
+        parser.add_argument('path', nargs='?', default='-', help='The file to read from, - for stdin')
+
+        # Named (optional) arguments
+        parser.add_argument('--feed', action='append', dest='uuids', default=[],
+                            help='Only import the feed with this uuid, can be given more than once')
+        parser.add_argument('--since', type=parse_date, default=None,
+                            help='Only import the items published on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', type=parse_date, default=None,
+                            help='Only import the items published before this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=1000, dest='batch_size',
+                            help='Amount of items to insert per batch')
+
+    def handle(self, *args, **options):
+        translation.activate(settings.LANGUAGE_CODE)
+        if options['batch_size'] < 1:
+            raise CommandError("The batch size must be at least 1")
+        try:
+            if options['path'] == '-':
+                result = import_feeds(options.get('stdin', sys.stdin), options['uuids'], options['since'],
+                                      options['until'], options['batch_size'])
+            else:
+                with open(options['path']) as stream:
+                    result = import_feeds(stream, options['uuids'], options['since'], options['until'],
+                                          options['batch_size'])
+        except (IOError, ValueError), e:
+            raise CommandError(e)
+        self.stdout.write('Successfully imported %s feeds, %s channels, %s tweets and %s RSS items, %s items of '
+                          'unknown feeds were skipped.' % (result['feeds_count'], result['channels_count'],
+                                                           result['tweets_count'], result['rss_items_count'],
+                                                           result['skipped_count']))
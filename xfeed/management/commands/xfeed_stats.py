@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from xfeed.models import Feed, FeedRefreshLog
+from xfeed.stats import percentile
+from django.utils import timezone, translation
+from django.utils.translation import ugettext as _
+from datetime import timedelta
+
+
+def format_seconds(seconds):
+    return '-' if seconds is None else '%.3fs' % seconds
+
+
+class Command(BaseCommand):
+    """
+    This command shows statistics of the refresh logs: latencies, the slowest feeds and the feeds that fail most often
+    """
+    help = _('Show refresh statistics of the feeds')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument('--days', type=int, default=7,
+                            help='Only use the refreshes of this amount of last days')
+        parser.add_argument('--limit', type=int, default=10,
+                            help='Amount of feeds to show in the slowest feeds and error rates lists')
+
+    def handle(self, *args, **options):
+        translation.activate(settings.LANGUAGE_CODE)
+        if options['days'] < 1:
+            raise CommandError("The amount of days must be at least 1")
+        since = timezone.now() - timedelta(days=options['days'])
+        logs = FeedRefreshLog.objects.filter(started_at__gte=since).order_by('started_at').values_list(
+            'feed', 'outcome', 'error', 'duration', 'fetch_time', 'parse_time', 'query_count')
+        feeds = {}
+        for feed_id, outcome, error, duration, fetch_time, parse_time, query_count in logs.iterator():
+            stats = feeds.setdefault(feed_id, {'outcomes': [], 'durations': [], 'fetch_times': [],
+                                               'parse_times': [], 'query_counts': [], 'last_error': ''})
+            stats['outcomes'].append(outcome)
+            stats['durations'].append(duration)
+            if fetch_time is not None:
+                stats['fetch_times'].append(fetch_time)
+            if parse_time is not None:
+                stats['parse_times'].append(parse_time)
+            stats['query_counts'].append(query_count)
+            if outcome == 'failed':
+                stats['last_error'] = error
+        if not feeds:
+            self.stdout.write('No refreshes were logged in the last %s days.' % options['days'])
+            return
+
+        def summarize(key):
+            values = [value for stats in feeds.values() for value in stats[key]]
+            return percentile(values, 50), percentile(values, 95)
+
+        def error_rate(stats):
+            return 100.0 * stats['outcomes'].count('failed') / len(stats['outcomes'])
+
+        outcomes = [outcome for stats in feeds.values() for outcome in stats['outcomes']]
+        self.stdout.write('%s refreshes of %s feeds in the last %s days. %.1f%% failed, %.1f%% deferred.' % (
+            len(outcomes), len(feeds), options['days'], 100.0 * outcomes.count('failed') / len(outcomes),
+            100.0 * outcomes.count('deferred') / len(outcomes)))
+        for name, key in (('Duration', 'durations'), ('Fetch time', 'fetch_times'), ('Parse time', 'parse_times')):
+            p50, p95 = summarize(key)
+            self.stdout.write('%s: p50 %s, p95 %s' % (name, format_seconds(p50), format_seconds(p95)))
+        p50, p95 = summarize('query_counts')
+        self.stdout.write('Queries: p50 %s, p95 %s' % (p50, p95))
+
+        names = Feed.objects.in_bulk(feeds.keys())
+        self.stdout.write('\nSlowest feeds (by p95 duration):')
+        slowest = sorted(feeds.items(), key=lambda item: percentile(item[1]['durations'], 95), reverse=True)
+        for feed_id, stats in slowest[:options['limit']]:
+            self.stdout.write('  %s: %s refreshes, duration p50 %s, p95 %s, fetch time p95 %s, %.1f%% failed' % (
+                names[feed_id], len(stats['outcomes']), format_seconds(percentile(stats['durations'], 50)),
+                format_seconds(percentile(stats['durations'], 95)),
+                format_seconds(percentile(stats['fetch_times'], 95)), error_rate(stats)))
+
+        self.stdout.write('\nHighest error rates:')
+        failing = sorted([item for item in feeds.items() if 'failed' in item[1]['outcomes']],
+                         key=lambda item: error_rate(item[1]), reverse=True)
+        if not failing:
+            self.stdout.write('  No failed refreshes.')
+        for feed_id, stats in failing[:options['limit']]:
+            self.stdout.write('  %s: %s of %s refreshes failed (%.1f%%), last error: %s' % (
+                names[feed_id], stats['outcomes'].count('failed'), len(stats['outcomes']), error_rate(stats),
+                stats['last_error']))
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0002_auto_20150823_2109'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='etag',
+            field=models.CharField(default=b'', help_text='ETag of the last response, sent along with the next fetch', max_length=255, verbose_name='ETag', blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_modified',
+            field=models.CharField(default=b'', help_text='Last-Modified header of the last response, sent along with the next fetch', max_length=255, verbose_name='last modified', blank=True),
+        ),
+    ]
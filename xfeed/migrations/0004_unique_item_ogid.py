@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_items(apps, schema_editor):
+    """
+    Keeps only the oldest Tweet and RSSItem for every feed and original ID, so the unique constraint can be added
+    """
+    for model_name in ('Tweet', 'RSSItem'):
+        model = apps.get_model('xfeed', model_name)
+        duplicates = model.objects.values('feed', 'ogid').annotate(Min('pk'), count=Count('pk')).filter(
+            count__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(feed=duplicate['feed'], ogid=duplicate['ogid']).exclude(
+                pk=duplicate['pk__min']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0003_feed_conditional_get'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_items, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='rssitem',
+            unique_together=set([('feed', 'ogid')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tweet',
+            unique_together=set([('feed', 'ogid')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0004_unique_item_ogid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='failure_count',
+            field=models.PositiveIntegerField(default=0, help_text='Amount of refreshes in a row that failed', verbose_name='failure count'),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='next_refresh_at',
+            field=models.DateTimeField(help_text='Feeds are only refreshed with --due-only after this date', null=True, verbose_name='next refresh at', db_index=True, blank=True),
+        ),
+    ]
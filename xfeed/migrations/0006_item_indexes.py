@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0005_feed_scheduling'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='rssitem',
+            options={'ordering': ('-pub_date',), 'get_latest_by': 'ogid', 'verbose_name': 'RSS item', 'verbose_name_plural': 'RSS items'},
+        ),
+        migrations.AlterModelOptions(
+            name='tweet',
+            options={'ordering': ('-create_date',), 'get_latest_by': 'ogid', 'verbose_name': 'tweet', 'verbose_name_plural': 'tweets'},
+        ),
+        migrations.AlterIndexTogether(
+            name='rssitem',
+            index_together=set([('feed', 'hide', 'pub_date'), ('feed', 'pub_date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='tweet',
+            index_together=set([('feed', 'hide', 'create_date'), ('feed', 'create_date')]),
+        ),
+    ]
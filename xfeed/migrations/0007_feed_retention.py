@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0006_item_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='retention_days',
+            field=models.PositiveIntegerField(help_text='Items older than this amount of days are removed by enforce_retention', null=True, verbose_name='retention days', blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='retention_max_items',
+            field=models.PositiveIntegerField(help_text='Only this amount of newest items is kept by enforce_retention', null=True, verbose_name='retention max items', blank=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0007_feed_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='channel_digest',
+            field=models.CharField(default=b'', verbose_name='channel digest', max_length=40, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='content_digest',
+            field=models.CharField(default=b'', verbose_name='content digest', max_length=40, editable=False, blank=True),
+        ),
+    ]
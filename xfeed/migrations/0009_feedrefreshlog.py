@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0008_feed_digests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedRefreshLog',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('started_at', models.DateTimeField(verbose_name='started at')),
+                ('outcome', models.CharField(max_length=20, verbose_name='outcome', choices=[(b'updated', b'Updated'), (b'not_modified', b'Not modified'), (b'deferred', b'Deferred'), (b'failed', b'Failed')])),
+                ('error', models.CharField(default=b'', max_length=255, verbose_name='error', blank=True)),
+                ('duration', models.FloatField(verbose_name='duration')),
+                ('fetch_time', models.FloatField(null=True, verbose_name='fetch time', blank=True)),
+                ('bytes_received', models.PositiveIntegerField(null=True, verbose_name='bytes received', blank=True)),
+                ('parse_time', models.FloatField(null=True, verbose_name='parse time', blank=True)),
+                ('entries_seen', models.PositiveIntegerField(default=0, verbose_name='entries seen')),
+                ('entries_inserted', models.PositiveIntegerField(default=0, verbose_name='entries inserted')),
+                ('query_count', models.PositiveIntegerField(default=0, verbose_name='query count')),
+                ('query_time', models.FloatField(default=0, verbose_name='query time')),
+                ('feed', models.ForeignKey(related_name='refresh_logs', verbose_name='feed', to='xfeed.Feed')),
+            ],
+            options={
+                'ordering': ('-started_at',),
+                'verbose_name': 'refresh log',
+                'verbose_name_plural': 'refresh logs',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='feedrefreshlog',
+            index_together=set([('feed', 'started_at')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0009_feedrefreshlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='lease_expires_at',
+            field=models.DateTimeField(verbose_name='lease expires at', null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='lease_owner',
+            field=models.CharField(default=b'', verbose_name='lease owner', max_length=255, editable=False, blank=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models, transaction
+from django.db.utils import OperationalError
+
+
+def create_search_table(apps, schema_editor):
+    """
+    Creates the full-text search table of PostgreSQL or SQLite with FTS5, see xfeed.search
+    """
+    connection = schema_editor.connection
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute('CREATE TABLE xfeed_search (kind varchar(10) NOT NULL, item_id integer NOT NULL, '
+                       'feed_id integer NOT NULL, document tsvector NOT NULL, PRIMARY KEY (kind, item_id))')
+        cursor.execute('CREATE INDEX xfeed_search_document ON xfeed_search USING GIN (document)')
+        cursor.execute('CREATE INDEX xfeed_search_feed_id ON xfeed_search (feed_id)')
+    elif connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                cursor.execute('CREATE VIRTUAL TABLE xfeed_search USING fts5(title, body, feed_id UNINDEXED)')
+        except OperationalError:
+            # SQLite without FTS5, the SearchTerm model is used instead
+            pass
+
+
+def drop_search_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if 'xfeed_search' in connection.introspection.table_names():
+        connection.cursor().execute('DROP TABLE xfeed_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0010_feed_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('term', models.CharField(max_length=40, verbose_name='term')),
+                ('kind', models.CharField(max_length=10, verbose_name='kind')),
+                ('item_id', models.PositiveIntegerField(verbose_name='item ID')),
+                ('weight', models.PositiveIntegerField(verbose_name='weight')),
+                ('feed', models.ForeignKey(related_name='+', verbose_name='feed', to='xfeed.Feed')),
+            ],
+            options={
+                'verbose_name': 'search term',
+                'verbose_name_plural': 'search terms',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='searchterm',
+            index_together=set([('term', 'feed'), ('kind', 'item_id')]),
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
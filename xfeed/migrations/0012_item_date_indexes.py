@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0011_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rssitem',
+            name='pub_date',
+            field=models.DateTimeField(verbose_name='publishing date', db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='tweet',
+            name='create_date',
+            field=models.DateTimeField(verbose_name='create date', db_index=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0012_item_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='hub',
+            field=models.CharField(default=b'', verbose_name='WebSub hub', max_length=255, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='websub_expires_at',
+            field=models.DateTimeField(help_text='The lease of the subscription ends, or a pending request is sent again, after this date', verbose_name='WebSub expires at', null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='websub_secret',
+            field=models.CharField(default=b'', verbose_name='WebSub secret', max_length=40, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='websub_state',
+            field=models.CharField(default=b'', editable=False, choices=[(b'', b'Not subscribed'), (b'subscribing', b'Subscribing'), (b'subscribed', b'Subscribed'), (b'unsubscribing', b'Unsubscribing'), (b'denied', b'Denied')], max_length=20, blank=True, verbose_name='WebSub state'),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='websub_topic',
+            field=models.CharField(default=b'', verbose_name='WebSub topic', max_length=255, editable=False, blank=True),
+        ),
+    ]
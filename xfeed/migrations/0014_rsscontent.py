@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import hashlib
+import urlparse
+
+BATCH_SIZE = 500
+
+# A copy of xfeed.canonical at the time of this migration, so later changes to it do not change what this migration does
+TRACKING_PARAMS = frozenset([
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_hsenc', '_hsmi', 'ref_src',
+])
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return (name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES) or
+            name in getattr(settings, 'XFEED_TRACKING_PARAMS', ()))
+
+
+def canonicalize_url(url):
+    url = url.strip()
+    try:
+        parts = urlparse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.scheme.lower() not in DEFAULT_PORTS or not parts.hostname:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname.rstrip('.')
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc = '%s:%s' % (netloc, port)
+    query = '&'.join(param for param in parts.query.split('&')
+                     if param and not is_tracking_param(param.split('=', 1)[0]))
+    return urlparse.urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def unindex_rss_items(connection, pks):
+    """
+    Removes RSS items from the search tables of 0011_search. The FTS5 table of SQLite combines the kind (0 for RSS
+    items) and the primary key of an item into its rowid
+    """
+    if not pks:
+        return
+    cursor = connection.cursor()
+    ids = ', '.join(['%s'] * len(pks))
+    if connection.vendor == 'postgresql':
+        cursor.execute("DELETE FROM xfeed_search WHERE kind = 'rss' AND item_id IN (%s)" % ids, pks)
+    elif connection.vendor == 'sqlite' and 'xfeed_search' in connection.introspection.table_names():
+        cursor.execute('DELETE FROM xfeed_search WHERE rowid IN (%s)' % ids, [pk * 2 for pk in pks])
+    cursor.execute("DELETE FROM xfeed_searchterm WHERE kind = 'rss' AND item_id IN (%s)" % ids, pks)
+
+
+def move_descriptions(apps, schema_editor):
+    """
+    Stores the description of every RSSItem once as RSSContent, in batches of items
+    """
+    RSSItem = apps.get_model('xfeed', 'RSSItem')
+    RSSContent = apps.get_model('xfeed', 'RSSContent')
+    last_pk = 0
+    while True:
+        batch = list(RSSItem.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', 'description')[:BATCH_SIZE])
+        if not batch:
+            break
+        items = {}
+        for pk, description in batch:
+            digest = hashlib.sha1(description.encode('utf-8')).hexdigest()
+            items.setdefault(digest, (description, []))[1].append(pk)
+        contents = dict(RSSContent.objects.filter(digest__in=items.keys()).values_list('digest', 'pk'))
+        RSSContent.objects.bulk_create(RSSContent(digest=digest, body=description)
+                                       for digest, (description, pks) in items.items() if digest not in contents)
+        contents = dict(RSSContent.objects.filter(digest__in=items.keys()).values_list('digest', 'pk'))
+        for digest, (description, pks) in items.items():
+            RSSItem.objects.filter(pk__in=pks).update(content=contents[digest])
+        last_pk = batch[-1][0]
+
+
+def canonicalize_links(apps, schema_editor):
+    """
+    Canonicalizes the links of every RSSItem and the original IDs that are links, like xfeed.providers.rss does for
+    new items, in batches of items. When an original ID becomes the same as one of another item of the feed, the oldest
+    item is kept.
+    """
+    RSSItem = apps.get_model('xfeed', 'RSSItem')
+    RSSContent = apps.get_model('xfeed', 'RSSContent')
+
+    def delete_duplicates(pks):
+        content_ids = list(RSSItem.objects.filter(pk__in=pks).values_list('content', flat=True))
+        RSSItem.objects.filter(pk__in=pks).delete()
+        RSSContent.objects.filter(pk__in=content_ids, rss_items__isnull=True).delete()
+        unindex_rss_items(schema_editor.connection, pks)
+
+    last_pk = 0
+    while True:
+        batch = list(RSSItem.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', 'feed', 'ogid', 'ogid_is_link', 'link')[:BATCH_SIZE])
+        if not batch:
+            break
+        changes = {}
+        for pk, feed_id, ogid, ogid_is_link, link in batch:
+            new_link = canonicalize_url(link)
+            new_ogid_is_link = ogid_is_link or canonicalize_url(ogid) == new_link
+            new_ogid = canonicalize_url(ogid) if new_ogid_is_link else ogid
+            if (new_ogid, new_ogid_is_link, new_link) != (ogid, ogid_is_link, link):
+                changes[pk] = (feed_id, new_ogid, new_ogid_is_link, new_link)
+        # The items that already have the new original IDs, including items of later batches
+        owners = {}
+        candidates = RSSItem.objects.filter(feed__in=set(change[0] for change in changes.values()),
+                                            ogid__in=set(change[1] for change in changes.values()))
+        for pk, feed_id, ogid in candidates.order_by('pk').values_list('pk', 'feed', 'ogid'):
+            owners.setdefault((feed_id, ogid), pk)
+        duplicates = []
+        for pk in sorted(changes):
+            feed_id, ogid, ogid_is_link, link = changes[pk]
+            owner = owners.setdefault((feed_id, ogid), pk)
+            if owner < pk:
+                duplicates.append(pk)
+                continue
+            if owner > pk:
+                # A newer item already has the original ID, it is deleted first because of the unique constraint
+                delete_duplicates([owner])
+                owners[(feed_id, ogid)] = pk
+            RSSItem.objects.filter(pk=pk).update(ogid=ogid, ogid_is_link=ogid_is_link, link=link)
+        delete_duplicates(duplicates)
+        last_pk = batch[-1][0]
+
+
+def restore_descriptions(apps, schema_editor):
+    RSSItem = apps.get_model('xfeed', 'RSSItem')
+    RSSContent = apps.get_model('xfeed', 'RSSContent')
+    for content in RSSContent.objects.iterator():
+        RSSItem.objects.filter(content=content).update(description=content.body)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0013_feed_websub'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RSSContent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('digest', models.CharField(unique=True, max_length=40, verbose_name='digest')),
+                ('body', models.TextField(verbose_name='body')),
+            ],
+            options={
+                'verbose_name': 'RSS content',
+                'verbose_name_plural': 'RSS contents',
+            },
+        ),
+        migrations.AddField(
+            model_name='rssitem',
+            name='content',
+            field=models.ForeignKey(related_name='rss_items', on_delete=django.db.models.deletion.PROTECT, verbose_name='content', blank=True, to='xfeed.RSSContent', null=True),
+        ),
+        migrations.RunPython(move_descriptions, restore_descriptions),
+        migrations.RunPython(canonicalize_links, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='rssitem',
+            name='description',
+        ),
+    ]
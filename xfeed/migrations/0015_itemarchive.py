@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0014_rsscontent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemArchive',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=10, verbose_name='kind')),
+                ('month', models.DateField(verbose_name='month')),
+                ('first_date', models.DateTimeField(verbose_name='first date')),
+                ('last_date', models.DateTimeField(verbose_name='last date')),
+                ('item_count', models.PositiveIntegerField(verbose_name='item count')),
+                ('data', models.BinaryField(verbose_name='data')),
+                ('feed', models.ForeignKey(related_name='archives', verbose_name='feed', to='xfeed.Feed')),
+            ],
+            options={
+                'ordering': ('first_date',),
+                'verbose_name': 'item archive',
+                'verbose_name_plural': 'item archives',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='itemarchive',
+            index_together=set([('feed', 'kind', 'first_date')]),
+        ),
+    ]
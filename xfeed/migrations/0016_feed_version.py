@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import xfeed.caching
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xfeed', '0015_itemarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='content_changed_at',
+            field=models.DateTimeField(help_text='When items of the feed were last inserted, hidden or removed', verbose_name='content changed at', null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='version',
+            field=models.CharField(default=xfeed.caching.new_version, help_text='Changes whenever the items of the feed change, see xfeed.caching', max_length=32, editable=False, verbose_name='version'),
+        ),
+    ]
@@ -5,19 +5,30 @@ Provides Feed, Tweet, RSSItem and RSSChannelData, classes for storing data about
 Feed holds the necessary information for fetching items from the feed.
 Tweet holds information about tweets fetched from the feed.
 RSSItems holds information about rss items fetched from the feed.
+RSSContent holds a description, shared by the RSSItems of every feed that have the same description.
 RSSChannelData holds information about a RSS feed (e.g. generator, feed title, copyright)
+ItemArchive holds compressed Tweets or RSS items of a feed and month that were moved out of the item tables.
+FeedRefreshLog holds the measurement of a single refresh of a feed.
+SearchTerm holds a term of a Tweet or RSS item, for searching on databases without full-text search.
 """
 
 from django.conf import settings
-from django.db import models
-from django.utils.encoding import python_2_unicode_compatible
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.encoding import force_text, python_2_unicode_compatible
 from django.utils.translation import ugettext as _
 from django.utils import timezone
-from datetime import datetime
-import feedparser
-from time import mktime
-import twitter
-import urlparse
+from datetime import timedelta
+from xfeed.archive import archive_in_batches
+from xfeed.caching import bump_feed_version, new_version
+from xfeed.canonical import get_content_digest
+from xfeed.exceptions import NoCredentials, RateLimited
+from xfeed.providers import get_provider, parse_document
+from xfeed.retention import delete_in_batches
+from xfeed.search import index_items, unindex_feed, unindex_items
+from xfeed.signals import post_refresh, pre_refresh
+from xfeed.stats import QueryStats
 
 __author__ = 'Ruud Schroën'
 __copyright__ = 'Copyright 2015, Ruud Schroën'
@@ -27,17 +38,28 @@ __maintainer__ = 'Ruud Schroën'
 __email__ = 'schroenruud@gmail.com'
 __status__ = 'Development'
 
+# Maximum amount of statuses Twitter returns per user timeline request
+TWITTER_PAGE_SIZE = 200
+
 FEED_TYPES = [
     ('twitter', 'Twitter'),
     ('rss', 'RSS'),
 ]
 
+REFRESH_OUTCOMES = [
+    ('updated', 'Updated'),
+    ('not_modified', 'Not modified'),
+    ('deferred', 'Deferred'),
+    ('failed', 'Failed'),
+]
 
-class NoCredentials(Exception):
-    """
-    Exception for incomplete credentials
-    """
-    pass
+WEBSUB_STATES = [
+    ('', 'Not subscribed'),
+    ('subscribing', 'Subscribing'),
+    ('subscribed', 'Subscribed'),
+    ('unsubscribing', 'Unsubscribing'),
+    ('denied', 'Denied'),
+]
 
 
 class Base(models.Model):
@@ -72,6 +94,45 @@ class Feed(Base):
     last_refreshed = models.DateTimeField(verbose_name=_('last refreshed'), null=True, blank=True)
     is_active = models.BooleanField(default=True, verbose_name=_('is active'),
                                     help_text=_('Must be checked if this feed should be updated'))
+    etag = models.CharField(max_length=255, blank=True, default='', verbose_name=_('ETag'),
+                            help_text=_('ETag of the last response, sent along with the next fetch'))
+    last_modified = models.CharField(max_length=255, blank=True, default='', verbose_name=_('last modified'),
+                                     help_text=_('Last-Modified header of the last response, sent along with '
+                                                 'the next fetch'))
+    content_digest = models.CharField(max_length=40, blank=True, default='', editable=False,
+                                      verbose_name=_('content digest'))
+    channel_digest = models.CharField(max_length=40, blank=True, default='', editable=False,
+                                      verbose_name=_('channel digest'))
+    next_refresh_at = models.DateTimeField(verbose_name=_('next refresh at'), null=True, blank=True, db_index=True,
+                                           help_text=_('Feeds are only refreshed with --due-only after this date'))
+    failure_count = models.PositiveIntegerField(default=0, verbose_name=_('failure count'),
+                                                help_text=_('Amount of refreshes in a row that failed'))
+    retention_days = models.PositiveIntegerField(null=True, blank=True, verbose_name=_('retention days'),
+                                                 help_text=_('Items older than this amount of days are removed by '
+                                                             'enforce_retention'))
+    retention_max_items = models.PositiveIntegerField(null=True, blank=True, verbose_name=_('retention max items'),
+                                                      help_text=_('Only this amount of newest items is kept by '
+                                                                  'enforce_retention'))
+    lease_owner = models.CharField(max_length=255, blank=True, default='', editable=False,
+                                   verbose_name=_('lease owner'))
+    lease_expires_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_('lease expires at'))
+    hub = models.CharField(max_length=255, blank=True, default='', editable=False, verbose_name=_('WebSub hub'))
+    websub_topic = models.CharField(max_length=255, blank=True, default='', editable=False,
+                                    verbose_name=_('WebSub topic'))
+    websub_state = models.CharField(max_length=20, choices=WEBSUB_STATES, blank=True, default='', editable=False,
+                                    verbose_name=_('WebSub state'))
+    websub_secret = models.CharField(max_length=40, blank=True, default='', editable=False,
+                                     verbose_name=_('WebSub secret'))
+    websub_expires_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                             verbose_name=_('WebSub expires at'),
+                                             help_text=_('The lease of the subscription ends, or a pending request '
+                                                         'is sent again, after this date'))
+    version = models.CharField(max_length=32, default=new_version, editable=False, verbose_name=_('version'),
+                               help_text=_('Changes whenever the items of the feed change, see xfeed.caching'))
+    content_changed_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                              verbose_name=_('content changed at'),
+                                              help_text=_('When items of the feed were last inserted, hidden or '
+                                                          'removed'))
 
     class Meta:
         ordering = ('feed_type', 'name',)
@@ -82,6 +143,25 @@ class Feed(Base):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Feed, cls).from_db(db, field_names, values)
+        instance._stored_pk = instance.pk
+        return instance
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if (update_fields is None and not force_insert and not self._state.adding and self.pk is not None and
+                self.pk == getattr(self, '_stored_pk', None)):
+            # The version is only changed by bump_feed_version, saving an instance that was loaded before the
+            # version was bumped must not restore the old version. Copies (with another or no primary key) are saved
+            # as usual.
+            deferred = self.get_deferred_fields()
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.attname not in deferred and
+                             field.name not in ('version', 'content_changed_at')]
+        super(Feed, self).save(force_insert, force_update, using, update_fields)
+        self._stored_pk = self.pk
+
     def set_active(self, which):
         """Sets the active state on/off for a Feed.
 
@@ -94,159 +174,388 @@ class Feed(Base):
             raise ValueError(_('The "force" parameter must be True or False!'))
         self.is_active = which
 
-    def clean_up(self, date, feed_type=None):
+    def clean_up(self, date, feed_type=None, batch_size=None, pause=None, archive=False):
         """Cleans up a Feed by removing all Tweets and RSSItems that where published before a given date.
+        Items are deleted in batches, see xfeed.retention.delete_in_batches, or moved to the archive in batches when
+        archive is True, see xfeed.archive.archive_in_batches.
 
         :param date: Date to use in the "lower than" delete query.
         :type date: DateTime
         :param feed_type: If given, only items with a matching feed_type will be deleted.
         :type feed_type: str
+        :param batch_size: The amount of items to delete per batch.
+        :type batch_size: int
+        :param pause: The amount of seconds to pause between two batches.
+        :type pause: float
+        :param archive: Whether to archive the items instead of deleting them.
+        :type archive: bool
+        :returns:  Object -- holds counts for the amount of deleted tweets/rss-items
+
+        """
+        return self.delete_items(self.tweets.filter(create_date__lt=date),
+                                 self.rss_items.filter(pub_date__lt=date), feed_type, batch_size, pause, archive)
+
+    def flush(self, feed_type=None, batch_size=None, pause=None):
+        """Removes all Tweets and RSSItems of a Feed.
+        Items are deleted in batches, see xfeed.retention.delete_in_batches.
+
+        :param feed_type: If given, only items with a matching feed_type will be deleted.
+        :type feed_type: str
+        :param batch_size: The amount of items to delete per batch.
+        :type batch_size: int
+        :param pause: The amount of seconds to pause between two batches.
+        :type pause: float
+        :returns:  Object -- holds counts for the amount of deleted tweets/rss-items
+
+        """
+        result = self.delete_items(self.tweets.all(), self.rss_items.all(), feed_type, batch_size, pause)
+        # Forget the validators of the last fetch, so the next refresh stores the items again
+        self.etag = self.last_modified = self.content_digest = ''
+        Feed.objects.filter(pk=self.pk).update(etag='', last_modified='', content_digest='')
+        return result
+
+    def enforce_retention(self, batch_size=None, pause=None, archive=False):
+        """Removes the Tweets and RSSItems that fall outside the retention policy of the Feed.
+        Items older than retention_days are removed, and only the newest retention_max_items items are kept.
+
+        :param batch_size: The amount of items to delete per batch.
+        :type batch_size: int
+        :param pause: The amount of seconds to pause between two batches.
+        :type pause: float
+        :param archive: Whether to archive the items instead of deleting them.
+        :type archive: bool
         :returns:  Object -- holds counts for the amount of deleted tweets/rss-items
 
         """
         tweets_count = 0
         rss_items_count = 0
-        if not feed_type:
-            tweets = Tweet.objects.filter(feed=self, create_date__lt=date)
-            tweets_count = tweets.count()
-            tweets.delete()
-            rss_items = RSSItem.objects.filter(feed=self, pub_date__lt=date)
-            rss_items_count = rss_items.count()
-            rss_items.delete()
-        elif feed_type == 'twitter':
-            tweets = Tweet.objects.filter(feed=self, create_date__lt=date)
-            tweets_count = tweets.count()
-            tweets.delete()
-        elif feed_type == 'rss':
-            rss_items = RSSItem.objects.filter(feed=self, pub_date__lt=date)
-            rss_items_count = rss_items.count()
-            rss_items.delete()
+        if self.retention_days is not None:
+            result = self.clean_up(timezone.now() - timedelta(days=self.retention_days),
+                                   batch_size=batch_size, pause=pause, archive=archive)
+            tweets_count += result['tweets_count']
+            rss_items_count += result['rss_items_count']
+        if self.retention_max_items is not None:
+            def beyond_max_items(items, date_field):
+                # Items older than the oldest item to keep are removed, items with the same date are kept
+                if not self.retention_max_items:
+                    return items
+                dates = items.order_by('-' + date_field).values_list(date_field, flat=True)[
+                    self.retention_max_items - 1:self.retention_max_items + 1]
+                if len(dates) < 2:
+                    return items.none()
+                return items.filter(**{date_field + '__lt': dates[0]})
+
+            tweets = beyond_max_items(self.tweets.all(), 'create_date')
+            rss_items = beyond_max_items(self.rss_items.all(), 'pub_date')
+            result = self.delete_items(tweets, rss_items, batch_size=batch_size, pause=pause, archive=archive)
+            tweets_count += result['tweets_count']
+            rss_items_count += result['rss_items_count']
         return {'tweets_count': tweets_count, 'rss_items_count': rss_items_count}
 
-    def flush(self, feed_type=None):
-        """Removes all Tweets and RSSItems of a Feed.
+    def delete_items(self, tweets, rss_items, feed_type=None, batch_size=None, pause=None, archive=False):
+        """Deletes or archives Tweets and RSSItems of this Feed in batches.
 
+        :param tweets: The Tweets to delete.
+        :type tweets: QuerySet
+        :param rss_items: The RSSItems to delete.
+        :type rss_items: QuerySet
         :param feed_type: If given, only items with a matching feed_type will be deleted.
         :type feed_type: str
+        :param batch_size: The amount of items to delete per batch.
+        :type batch_size: int
+        :param pause: The amount of seconds to pause between two batches.
+        :type pause: float
+        :param archive: Whether to archive the items instead of deleting them.
+        :type archive: bool
         :returns:  Object -- holds counts for the amount of deleted tweets/rss-items
 
         """
         tweets_count = 0
         rss_items_count = 0
-        if not feed_type:
-            tweets = Tweet.objects.filter(feed=self)
-            tweets_count = tweets.count()
-            tweets.delete()
-            rss_items = RSSItem.objects.filter(feed=self)
-            rss_items_count = rss_items.count()
-            rss_items.delete()
-        elif feed_type == 'twitter':
-            tweets = Tweet.objects.filter(feed=self)
-            tweets_count = tweets.count()
-            tweets.delete()
-        elif feed_type == 'rss':
-            rss_items = RSSItem.objects.filter(feed=self)
-            rss_items_count = rss_items.count()
-            rss_items.delete()
+        remove = archive_in_batches if archive else delete_in_batches
+        if not feed_type or feed_type == 'twitter':
+            tweets_count = remove(tweets, batch_size, pause)
+        if not feed_type or feed_type == 'rss':
+            rss_items_count = remove(rss_items, batch_size, pause)
+        if tweets_count or rss_items_count:
+            self.version, self.content_changed_at = bump_feed_version(self.pk)
         return {'tweets_count': tweets_count, 'rss_items_count': rss_items_count}
 
-    def refresh(self):
-        """Refreshes a Feed. Gathers new content if available.
-        Sets the last_refreshed field of the Feed to the date of refreshing.
+    def insert_new_items(self, model, items):
+        """Inserts the Tweets or RSSItems of which the original ID is not stored for this Feed yet.
+        The existing original IDs are loaded in batches, see get_lookup_batches, and the new items are inserted and added
+        to the search index in one transaction.
 
-        :raises: RuntimeError
+        :param model: Tweet or RSSItem.
+        :type model: Model
+        :param items: Unsaved items belonging to this Feed.
+        :type items: list
+        :returns:  int -- the amount of inserted items
+        :raises: IntegrityError
+
+        """
+        seen = set()
+        unique_items = []
+        for item in items:
+            if item.ogid not in seen:
+                seen.add(item.ogid)
+                unique_items.append(item)
+        for attempt in range(2):
+            # The unique constraint guards against concurrent inserts, so the lookup does not need to be part of
+            # the transaction. Keeping it out avoids lock upgrades on databases like SQLite.
+            existing = set()
+            for ogids in get_lookup_batches(seen):
+                existing.update(model.objects.filter(feed=self, ogid__in=ogids).order_by().values_list('ogid',
+                                                                                                     flat=True))
+            new_items = [item for item in unique_items if item.ogid not in existing]
+            if model is RSSItem:
+                # Outside the transaction of the items, a transaction that reads the contents before inserting them
+                # has to upgrade its lock on databases like SQLite, which fails when another refresh does the same
+                attach_contents(new_items)
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(new_items)
+                    for ogids in get_lookup_batches(item.ogid for item in new_items):
+                        index_items(model, model.objects.filter(feed=self, ogid__in=ogids))
+                break
+            except IntegrityError:
+                # A concurrent refresh stored some of the same items, try again with the new existing IDs
+                if attempt:
+                    raise
+        if new_items:
+            self.version, self.content_changed_at = bump_feed_version(self.pk)
+        return len(new_items)
+
+    def get_refresh_interval(self):
+        """Returns the time to wait between two refreshes, based on how often items were posted recently.
+        The interval is the average time between the latest items (including the time since the newest item),
+        clamped between settings.XFEED_MIN_REFRESH_INTERVAL and settings.XFEED_MAX_REFRESH_INTERVAL.
+
+        :returns:  timedelta -- the refresh interval
 
         """
+        min_interval = getattr(settings, 'XFEED_MIN_REFRESH_INTERVAL', 300)
+        max_interval = getattr(settings, 'XFEED_MAX_REFRESH_INTERVAL', 86400)
         if self.feed_type == 'twitter':
-            consumer_key = getattr(settings, 'TWITTER_CONSUMER_KEY', None)
-            consumer_secret = getattr(settings, 'TWITTER_CONSUMER_SECRET', None)
-            access_token_key = getattr(settings, 'TWITTER_ACCESS_TOKEN_KEY', None)
-            access_token_secret = getattr(settings, 'TWITTER_ACCESS_TOKEN_SECRET', None)
-
-            if not consumer_key:
-                raise NoCredentials(_('Twitter consumer key missing'))
-            if not consumer_secret:
-                raise NoCredentials(_('Twitter consumer secret missing'))
-            if not access_token_key:
-                raise NoCredentials(_('Twitter access token key missing'))
-            if not access_token_secret:
-                raise NoCredentials(_('Twitter access token secret missing'))
+            dates = list(self.tweets.order_by('-create_date').values_list('create_date', flat=True)[:10])
+        else:
+            dates = list(self.rss_items.order_by('-pub_date').values_list('pub_date', flat=True)[:10])
+        if not dates:
+            return timedelta(seconds=min_interval)
+        span = timezone.now() - dates[-1]
+        seconds = (span.days * 86400 + span.seconds) / len(dates)
+        return timedelta(seconds=max(min_interval, min(max_interval, seconds)))
+
+    def is_pushed(self):
+        """Returns whether the hub of the Feed pushes new content, see xfeed.websub."""
+        return self.websub_state == 'subscribed' and self.websub_expires_at > timezone.now()
+
+    def schedule_refresh(self, failed=False):
+        """Sets the next_refresh_at field of the Feed. After failed refreshes the interval is doubled for every
+        failure in a row, up to settings.XFEED_MAX_REFRESH_INTERVAL. Feeds of which the hub pushes new content are
+        polled every settings.XFEED_WEBSUB_POLL_INTERVAL seconds (defaults to 86400) at most.
+
+        :param failed: Whether the last refresh failed.
+        :type failed: bool
 
-            try:
-                api = twitter.Api(consumer_key=consumer_key,
-                                  consumer_secret=consumer_secret,
-                                  access_token_key=access_token_key,
-                                  access_token_secret=access_token_secret)
-                statuses = api.GetUserTimeline(screen_name=self.target)
-                for s in statuses:
-                    new = True
-                    ogid = s.id
-                    for t in self.tweets.all():
-                        if t.ogid == str(ogid):
-                            new = False
-                            break
-                    if new:
-                        current_tz = timezone.get_current_timezone()
-                        naive_date = datetime.strptime(s.created_at, '%a %b %d %H:%M:%S +0000 %Y')
-                        create_date = current_tz.localize(naive_date)
-                        t = Tweet(feed=self, ogid=ogid, create_date=create_date, from_user_id=s.user.id,
-                                  from_user_name=s.user.screen_name, language=s.user.lang,
-                                  profile_image_url=s.user.profile_image_url,
-                                  source=s.source, text=s.text, to_user_id=s.in_reply_to_user_id,
-                                  to_user_screen_name=s.in_reply_to_screen_name, to_status_id=s.in_reply_to_status_id)
-                        t.save()
-            except Exception, e:
-                raise RuntimeError('Failed to fetch Tweets for feed %s, reason: %s' % (self.name, e))
-        if self.feed_type == "rss":
-            if not bool(urlparse.urlparse(self.target).scheme):
-                raise ValueError('RSS target is not a valid URL')
+        """
+        max_interval = timedelta(seconds=getattr(settings, 'XFEED_MAX_REFRESH_INTERVAL', 86400))
+        if failed:
+            self.failure_count += 1
+        else:
+            self.failure_count = 0
+        interval = min(self.get_refresh_interval() * 2 ** min(self.failure_count, 16), max_interval)
+        if self.is_pushed():
+            # Only a safety net for missed pushes
+            interval = max(interval, timedelta(seconds=getattr(settings, 'XFEED_WEBSUB_POLL_INTERVAL', 86400)))
+        self.next_refresh_at = timezone.now() + interval
+
+    def get_since_id(self):
+        """Returns the highest original ID of the Tweets stored for this Feed.
+
+        :returns:  int -- the highest original ID, or None if no Tweets are stored
+
+        """
+        # Tweet IDs increase over time, so the highest ID is among the most recently created Tweets
+        ogids = self.tweets.order_by('-create_date').values_list('ogid', flat=True)[:20]
+        return max([int(ogid) for ogid in ogids]) if ogids else None
+
+    def get_new_statuses(self, client):
+        """Fetches the statuses of the user timeline that are newer than the stored Tweets.
+        When a page is full there may be more new statuses, so older pages are fetched with max_id until the gap
+        is closed or settings.XFEED_TWITTER_MAX_PAGES (defaults to 5) pages are fetched.
+        At most settings.XFEED_TWITTER_MAX_ENTRIES (defaults to no limit) statuses are returned.
 
+        :param client: The Twitter client to fetch with.
+        :type client: TwitterClient
+        :returns:  list -- the new statuses
+
+        """
+        since_id = self.get_since_id()
+        max_pages = getattr(settings, 'XFEED_TWITTER_MAX_PAGES', 5)
+        max_entries = getattr(settings, 'XFEED_TWITTER_MAX_ENTRIES', None)
+        page_size = min(TWITTER_PAGE_SIZE, max_entries or TWITTER_PAGE_SIZE)
+        page = client.get_user_timeline(screen_name=self.target, since_id=since_id, count=page_size)
+        statuses = list(page)
+        pages = 1
+        while since_id and len(page) >= page_size and pages < max_pages:
+            if max_entries is not None and len(statuses) >= max_entries:
+                break
+            max_id = min([status.id for status in page]) - 1
+            page = client.get_user_timeline(screen_name=self.target, since_id=since_id, max_id=max_id,
+                                            count=page_size)
+            statuses.extend(page)
+            pages += 1
+        return statuses[:max_entries] if max_entries is not None else statuses
+
+    def refresh(self, document=None, timeout=None):
+        """Refreshes a Feed. Gathers new content if available.
+        Sets the last_refreshed field of the Feed to the date of refreshing.
+        RSS feeds are fetched with the ETag and Last-Modified of the previous fetch. A feed that is not modified, or of
+        which the document has the same digest as the previous fetch, is not parsed.
+        At most settings.XFEED_MAX_RESPONSE_BYTES are fetched and settings.XFEED_MAX_ENTRIES new items are stored.
+        Every refresh is measured and stored as a FeedRefreshLog, the pre_refresh and post_refresh signals are sent
+        before and after.
+        A refresh consists of three stages: fetch_document, xfeed.providers.parse_document and store_records.
+        xfeed.pipeline runs them concurrently for many feeds.
+
+        :param document: If given, stored instead of a fetched document, e.g. content pushed by a WebSub hub.
+        :type document: dict
+        :param timeout: If given, the timeout in seconds of the fetch, see fetch_document.
+        :type timeout: int
+        :raises: RuntimeError, NoCredentials, RateLimited
+
+        """
+        measurement = self.start_refresh()
+        queries = QueryStats(connection)
+        try:
             try:
-                d = feedparser.parse(self.target)
-                current_tz = timezone.get_current_timezone()
-                feed_timestamp = d.feed.published_parsed
-                feed_pub_date = current_tz.localize(datetime.fromtimestamp(mktime(feed_timestamp)))
-                last_build_timestamp = d.feed.updated_parsed
-                last_build_date = current_tz.localize(datetime.fromtimestamp(mktime(last_build_timestamp)))
-
-                # Updating or inserting RSS channel data
-                try:
-                    # If channel data exists, update
-                    RSSChannelData.objects.filter(feed=self).update(title=d.feed.title, subtitle=d.feed.subtitle,
-                                                                    link=d.feed.link, language=d.feed.language,
-                                                                    pub_date=feed_pub_date,
-                                                                    last_build_date=last_build_date,
-                                                                    generator=d.feed.generator, copyright=d.feed.rights)
-                except RSSChannelData.DoesNotExist:
-                    # Else create a new record
-                    channel_data = RSSChannelData(feed=self, title=d.feed.title, subtitle=d.feed.subtitle,
-                                                  link=d.feed.link, language=d.feed.language, pub_date=feed_pub_date,
-                                                  last_build_date=last_build_date, generator=d.feed.generator,
-                                                  copyright=d.feed.rights,
-                                                  )
-                    channel_data.save()
-
-                # Inserting new posts into database
-                for post in d.entries:
-                    new = True
-                    ogid = post.id
-                    for e in self.rss_items.all():
-                        if e.ogid == ogid:
-                            new = False
-                            break
-                    post_timestamp = post.published_parsed
-                    naive_date = datetime.fromtimestamp(mktime(post_timestamp))
-                    pub_date = current_tz.localize(naive_date)
-                    if new:
-                        item = RSSItem(feed=self, ogid=ogid, ogid_is_link=post.guidislink, pub_date=pub_date,
-                                       language=d.feed.language, title=post.title, description=post.summary,
-                                       link=post.link)
-                        item.save()
-            except Exception, e:
-                raise RuntimeError('Failed to fetch RSS for feed %s, reason: %s' % (self.name, e))
+                with queries:
+                    if document is None:
+                        document = self.fetch_document(measurement, timeout=timeout)
+                    records = None
+                    if not document['not_modified']:
+                        try:
+                            records = parse_document(self.feed_type, document)
+                        except Exception, e:
+                            raise self.get_refresh_error(e)
+                    self.store_records(document, records, measurement)
+            finally:
+                measurement['query_count'] += queries.count
+                measurement['query_time'] += queries.time
+        except Exception, e:
+            self.finish_refresh(measurement, e)
+            raise
+        self.finish_refresh(measurement)
+
+    def start_refresh(self):
+        """Sends the pre_refresh signal and returns a new measurement for a refresh, see finish_refresh.
+
+        :returns:  dict -- the values of the FeedRefreshLog fields, to be filled in by the refresh stages
+
+        """
+        pre_refresh.send(sender=Feed, feed=self)
+        return {'started_at': timezone.now(), 'outcome': 'failed', 'error': '', 'duration': None, 'fetch_time': None,
+                'bytes_received': None, 'parse_time': None, 'entries_seen': 0, 'entries_inserted': 0,
+                'query_count': 0, 'query_time': 0.0}
+
+    def finish_refresh(self, measurement, error=None):
+        """Completes the measurement of a refresh, stores it and sends the post_refresh signal.
+
+        :param measurement: The measurement returned by start_refresh.
+        :type measurement: dict
+        :param error: The exception the refresh failed with, if any.
+        :type error: Exception
+        :returns:  FeedRefreshLog -- the stored log, or None if logging is disabled
+
+        """
+        if error is not None:
+            measurement['outcome'] = 'deferred' if isinstance(error, RateLimited) else 'failed'
+            measurement['error'] = force_text(error, errors='replace')
+        duration = timezone.now() - measurement['started_at']
+        measurement['duration'] = duration.days * 86400 + duration.seconds + duration.microseconds / 1000000.0
+        log = self.log_refresh(measurement)
+        post_refresh.send(sender=Feed, feed=self, measurement=measurement, log=log)
+        return log
+
+    def log_refresh(self, measurement):
+        """Stores the measurement of a refresh as a FeedRefreshLog.
+        Only the newest settings.XFEED_REFRESH_LOG_ENTRIES (defaults to 100) logs of a Feed are kept, 0 disables
+        logging.
+
+        :param measurement: The values of the FeedRefreshLog fields.
+        :type measurement: dict
+        :returns:  FeedRefreshLog -- the stored log, or None if logging is disabled
+
+        """
+        max_entries = getattr(settings, 'XFEED_REFRESH_LOG_ENTRIES', 100)
+        if not max_entries:
+            return None
+        log = FeedRefreshLog.objects.create(feed=self, **dict(measurement, error=measurement['error'][:255]))
+        oldest = self.refresh_logs.order_by('-pk').values_list('pk', flat=True)[max_entries:max_entries + 1]
+        if oldest:
+            self.refresh_logs.filter(pk__lte=oldest[0]).delete()
+        return log
+
+    def get_refresh_error(self, error):
+        """Returns the RuntimeError a refresh of this Feed fails with for an error."""
+        return RuntimeError('Failed to fetch %s for feed %s, reason: %s' % (
+            get_provider(self.feed_type).label, self.name, error))
+
+    def fetch_document(self, measurement, timeout=None):
+        """Fetches the new content of a Feed with the provider of its type, the first stage of a refresh.
+        Does not save the Feed. For Twitter feeds the statuses newer than the stored Tweets are fetched. RSS feeds
+        are fetched with the ETag and Last-Modified of the previous fetch, a permanent redirect updates the target.
+
+        :param measurement: Receives the fetch time and bytes received.
+        :type measurement: dict
+        :param timeout: If given, RSS feeds fail when a socket operation or the whole fetch takes longer than this
+                        amount of seconds. Twitter feeds use the timeout of the shared Twitter client.
+        :type timeout: int
+        :returns:  Object -- holds whether the content is not modified, and the statuses (Twitter) or the response
+                   and its digest (RSS). Can be pickled.
+        :raises: RuntimeError, NoCredentials, RateLimited, ValueError
+
+        """
+        return get_provider(self.feed_type).fetch(self, measurement, timeout=timeout)
+
+    def store_records(self, document, records, measurement):
+        """Stores the new items of a Feed with the provider of its type, the last stage of a refresh.
+        Sets the last_refreshed field of the Feed to the date of refreshing and schedules the next refresh.
+
+        :param document: The document returned by fetch_document.
+        :type document: dict
+        :param records: The records returned by xfeed.providers.parse_document, None if the document is not modified.
+        :type records: dict
+        :param measurement: Receives the outcome, parse time and entries seen and inserted.
+        :type measurement: dict
+        :returns:  str -- the outcome, 'updated' or 'not_modified'
+        :raises: RuntimeError
+
+        """
+        if document['not_modified']:
+            # Nothing changed since the last fetch, so there is nothing to parse or store
+            self.last_refreshed = timezone.now()
+            self.schedule_refresh()
+            self.save(update_fields=['target', 'etag', 'last_modified', 'last_refreshed', 'next_refresh_at',
+                                     'failure_count'])
+            measurement['outcome'] = 'not_modified'
+            return measurement['outcome']
+
+        measurement['parse_time'] = records['parse_time']
+        measurement['entries_seen'] = records['entries_seen']
+        try:
+            measurement['entries_inserted'] = get_provider(self.feed_type).store(self, document, records)
+        except Exception, e:
+            raise self.get_refresh_error(e)
 
         self.last_refreshed = timezone.now()
-        self.save()
+        self.schedule_refresh()
+        # The lease fields belong to the refresh workers and are left alone
+        self.save(update_fields=['target', 'etag', 'last_modified', 'content_digest', 'channel_digest',
+                                 'last_refreshed', 'next_refresh_at', 'failure_count'])
+        measurement['outcome'] = 'updated'
+        return measurement['outcome']
 
 
 @python_2_unicode_compatible
@@ -256,7 +565,7 @@ class Tweet(Base):
     """
     feed = models.ForeignKey(Feed, related_name="tweets", verbose_name=_('feed'))
     ogid = models.CharField(max_length=255, verbose_name=_('original ID'))
-    create_date = models.DateTimeField(verbose_name=_('create date'))
+    create_date = models.DateTimeField(verbose_name=_('create date'), db_index=True)
     from_user_id = models.CharField(max_length=255, verbose_name=_('from user ID'))
     from_user_name = models.CharField(max_length=255, verbose_name=_('from user name'))
     language = models.CharField(max_length=255, verbose_name=_('iso language code'))
@@ -269,15 +578,25 @@ class Tweet(Base):
     hide = models.BooleanField(default=False, verbose_name=_('hide this tweet'))
 
     class Meta:
-        ordering = ('create_date',)
+        ordering = ('-create_date',)
         verbose_name = _('tweet')
         verbose_name_plural = _('tweets')
         get_latest_by = "ogid"
+        unique_together = ('feed', 'ogid')
+        index_together = [
+            ('feed', 'create_date'),
+            ('feed', 'hide', 'create_date'),
+        ]
         app_label = 'xfeed'
 
     def __str__(self):
         return self.text
 
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        super(Tweet, self).delete(*args, **kwargs)
+        items_deleted(Tweet, [pk], [self.feed_id])
+
     def set_hide(self, which):
         """Sets the hide state on/off for a Tweet.
 
@@ -299,23 +618,51 @@ class RSSItem(Base):
     feed = models.ForeignKey(Feed, related_name="rss_items", verbose_name=_('feed'))
     ogid = models.CharField(max_length=255, verbose_name=_('original ID'))
     ogid_is_link = models.BooleanField(default=False, verbose_name=_('original ID is link'))
-    pub_date = models.DateTimeField(verbose_name=_('publishing date'))
+    pub_date = models.DateTimeField(verbose_name=_('publishing date'), db_index=True)
     language = models.CharField(max_length=255, verbose_name=_('iso language code'))
     title = models.CharField(max_length=255, verbose_name=_('title'))
-    description = models.TextField(verbose_name=_('description'))
+    content = models.ForeignKey('RSSContent', null=True, blank=True, on_delete=models.PROTECT,
+                                related_name='rss_items', verbose_name=_('content'))
     link = models.URLField(max_length=255, verbose_name=_('link'))
     hide = models.BooleanField(default=False, verbose_name=_('hide this item'))
 
     class Meta:
-        ordering = ('feed', 'title',)
+        ordering = ('-pub_date',)
         verbose_name = _('RSS item')
         verbose_name_plural = _('RSS items')
         get_latest_by = 'ogid'
+        unique_together = ('feed', 'ogid')
+        index_together = [
+            ('feed', 'pub_date'),
+            ('feed', 'hide', 'pub_date'),
+        ]
         app_label = 'xfeed'
 
     def __str__(self):
         return self.title
 
+    def _get_description(self):
+        description = getattr(self, '_description', None)
+        if description is None:
+            # Load items with select_related('content') to avoid a query per item
+            description = self.content.body if self.content_id is not None else ''
+        return description
+
+    def _set_description(self, value):
+        self._description = value
+    # The description is stored in RSSContent, once for all items with the same description
+    description = property(_get_description, _set_description)
+
+    def save(self, *args, **kwargs):
+        if getattr(self, '_description', None) is not None:
+            attach_contents([self])
+        super(RSSItem, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        super(RSSItem, self).delete(*args, **kwargs)
+        items_deleted(RSSItem, [pk], [self.feed_id])
+
     def set_hide(self, which):
         """Sets the hide state on/off for a RSSItem.
 
@@ -329,6 +676,137 @@ class RSSItem(Base):
         self.hide = which
 
 
+@python_2_unicode_compatible
+class RSSContent(models.Model):
+    """
+    Stores the description of RSS items once, shared by every RSSItem with the same description
+    """
+    digest = models.CharField(max_length=40, unique=True, verbose_name=_('digest'))
+    body = models.TextField(verbose_name=_('body'))
+
+    class Meta:
+        verbose_name = _('RSS content')
+        verbose_name_plural = _('RSS contents')
+        app_label = 'xfeed'
+
+    def __str__(self):
+        return self.digest
+
+
+def get_lookup_batches(values):
+    """Splits values into lists that fit in a single IN lookup. A list holds settings.XFEED_LOOKUP_BATCH_SIZE (defaults
+    to 500) values at most, or fewer when the database allows fewer query parameters.
+
+    :param values: The values to look up.
+    :type values: iterable
+    :returns:  list -- lists of values
+
+    """
+    batch_size = getattr(settings, 'XFEED_LOOKUP_BATCH_SIZE', 500)
+    # Not every version of Django reports the limit, and the other parameters of the query need some room as well
+    max_query_params = getattr(connection.features, 'max_query_params', None)
+    if max_query_params:
+        batch_size = min(batch_size, max_query_params - 10)
+    values = list(values)
+    return [values[i:i + batch_size] for i in range(0, len(values), batch_size)]
+
+
+def attach_contents(items):
+    """Sets the content of unsaved RSSItems to the RSSContent of their description. Contents that are not stored yet
+    are inserted, the existing contents are looked up in batches, see get_lookup_batches. Should not be called in the
+    transaction that inserts the items, contents stored by a concurrent call are looked up after the insert fails on
+    their digest.
+
+    :param items: RSSItems with a description.
+    :type items: list
+
+    """
+    digests = {}
+    for item in items:
+        digests.setdefault(get_content_digest(item.description), item.description)
+    contents = {}
+    for batch in get_lookup_batches(digests):
+        contents.update(RSSContent.objects.filter(digest__in=batch).values_list('digest', 'pk'))
+    missing = [RSSContent(digest=digest, body=body) for digest, body in digests.items() if digest not in contents]
+    if missing:
+        try:
+            with transaction.atomic():
+                RSSContent.objects.bulk_create(missing)
+        except IntegrityError:
+            # A concurrent refresh stored some of the same contents
+            for content in missing:
+                RSSContent.objects.get_or_create(digest=content.digest, defaults={'body': content.body})
+        # bulk_create does not return primary keys on every database
+        for batch in get_lookup_batches(content.digest for content in missing):
+            contents.update(RSSContent.objects.filter(digest__in=batch).values_list('digest', 'pk'))
+    for item in items:
+        item.content_id = contents[get_content_digest(item.description)]
+
+
+def hide_items(queryset, which, batch_size=500):
+    """Hides or unhides the Tweets or RSSItems of a queryset with an UPDATE per batch of primary keys. Every batch is
+    updated and added to or removed from the search index in its own short transaction, so hiding all items of a large
+    table neither holds all their keys in memory nor locks them in one long transaction.
+    Saving the items one by one would send a post_save signal per item, so the cached output of their feeds is
+    invalidated here instead.
+
+    :param queryset: The Tweets or RSSItems to hide or unhide.
+    :type queryset: QuerySet
+    :param which: True to hide, False to unhide.
+    :type which: bool
+    :param batch_size: The amount of items to update per batch.
+    :type batch_size: int
+    :returns:  int -- the amount of items that changed
+    :raises: ValueError
+
+    """
+    if not isinstance(which, (bool,)):
+        raise ValueError(_('The "force" parameter must be True or False!'))
+    model = queryset.model
+    changed = queryset.filter(hide=not which).order_by('pk').values_list('pk', 'feed')
+    count = 0
+    last_pk = None
+    while True:
+        rows = changed if last_pk is None else changed.filter(pk__gt=last_pk)
+        batch = list(rows[:batch_size])
+        if not batch:
+            break
+        pks = [pk for pk, feed_id in batch]
+        with transaction.atomic():
+            count += model.objects.filter(pk__in=pks, hide=not which).update(hide=which)
+            if which:
+                unindex_items(model, pks)
+            else:
+                index_items(model, model.objects.filter(pk__in=pks))
+        for feed_id in set(feed_id for pk, feed_id in batch):
+            bump_feed_version(feed_id)
+        if len(batch) < batch_size:
+            break
+        last_pk = pks[-1]
+    return count
+
+
+def items_deleted(model, pks, feed_ids, batch_size=500):
+    """Removes deleted Tweets or RSSItems from the search index and invalidates the cached output of their feeds.
+    Called by Tweet.delete(), RSSItem.delete() and the delete action of the admin. A post_delete receiver would do the
+    same, but would make every delete of a feed fetch all of its items, which are removed by feed_deleted instead.
+
+    :param model: Tweet or RSSItem.
+    :type model: Model
+    :param pks: The primary keys of the deleted items.
+    :type pks: list
+    :param feed_ids: The primary keys of the feeds of the items.
+    :type feed_ids: iterable
+    :param batch_size: The amount of items per update of the search index.
+    :type batch_size: int
+
+    """
+    for start in range(0, len(pks), batch_size):
+        unindex_items(model, pks[start:start + batch_size])
+    for feed_id in set(feed_ids):
+        bump_feed_version(feed_id)
+
+
 @python_2_unicode_compatible
 class RSSChannelData(Base):
     """
@@ -354,3 +832,107 @@ class RSSChannelData(Base):
 
     def __str__(self):
         return self.feed.name
+
+
+class FeedRefreshLog(models.Model):
+    """
+    Stores the measurement of a single refresh, related to model:'xfeed.Feed'.
+    Times are in seconds. The fetch and parse fields are empty when the refresh did not get that far.
+    """
+    feed = models.ForeignKey(Feed, related_name='refresh_logs', verbose_name=_('feed'))
+    started_at = models.DateTimeField(verbose_name=_('started at'))
+    outcome = models.CharField(max_length=20, choices=REFRESH_OUTCOMES, verbose_name=_('outcome'))
+    error = models.CharField(max_length=255, blank=True, default='', verbose_name=_('error'))
+    duration = models.FloatField(verbose_name=_('duration'))
+    fetch_time = models.FloatField(null=True, blank=True, verbose_name=_('fetch time'))
+    bytes_received = models.PositiveIntegerField(null=True, blank=True, verbose_name=_('bytes received'))
+    parse_time = models.FloatField(null=True, blank=True, verbose_name=_('parse time'))
+    entries_seen = models.PositiveIntegerField(default=0, verbose_name=_('entries seen'))
+    entries_inserted = models.PositiveIntegerField(default=0, verbose_name=_('entries inserted'))
+    query_count = models.PositiveIntegerField(default=0, verbose_name=_('query count'))
+    query_time = models.FloatField(default=0, verbose_name=_('query time'))
+
+    class Meta:
+        ordering = ('-started_at',)
+        verbose_name = _('refresh log')
+        verbose_name_plural = _('refresh logs')
+        index_together = [
+            ('feed', 'started_at'),
+        ]
+        app_label = 'xfeed'
+
+
+@python_2_unicode_compatible
+class ItemArchive(models.Model):
+    """
+    Stores archived Tweets or RSS items of a feed and month as compressed JSON, related to model:'xfeed.Feed'.
+    See xfeed.archive
+    """
+    feed = models.ForeignKey(Feed, related_name='archives', verbose_name=_('feed'))
+    kind = models.CharField(max_length=10, verbose_name=_('kind'))
+    month = models.DateField(verbose_name=_('month'))
+    first_date = models.DateTimeField(verbose_name=_('first date'))
+    last_date = models.DateTimeField(verbose_name=_('last date'))
+    item_count = models.PositiveIntegerField(verbose_name=_('item count'))
+    data = models.BinaryField(verbose_name=_('data'))
+
+    class Meta:
+        ordering = ('first_date',)
+        verbose_name = _('item archive')
+        verbose_name_plural = _('item archives')
+        index_together = [
+            ('feed', 'kind', 'first_date'),
+        ]
+        app_label = 'xfeed'
+
+    def __str__(self):
+        return '%s %s' % (self.kind, self.month.strftime('%Y-%m'))
+
+
+@python_2_unicode_compatible
+class SearchTerm(models.Model):
+    """
+    Stores a term of an indexed Tweet or RSSItem and its weight in the item.
+    Only used by the search backend of databases without full-text search, see xfeed.search.
+    """
+    term = models.CharField(max_length=40, verbose_name=_('term'))
+    kind = models.CharField(max_length=10, verbose_name=_('kind'))
+    item_id = models.PositiveIntegerField(verbose_name=_('item ID'))
+    feed = models.ForeignKey(Feed, related_name='+', verbose_name=_('feed'))
+    weight = models.PositiveIntegerField(verbose_name=_('weight'))
+
+    class Meta:
+        verbose_name = _('search term')
+        verbose_name_plural = _('search terms')
+        index_together = [
+            ('term', 'feed'),
+            ('kind', 'item_id'),
+        ]
+        app_label = 'xfeed'
+
+    def __str__(self):
+        return self.term
+
+
+@receiver(post_save, sender=Tweet)
+@receiver(post_save, sender=RSSItem)
+def item_saved(sender, instance, created, **kwargs):
+    """
+    Invalidates the cached output of a feed when one of its items is saved (e.g. after hiding it), and updates the
+    search index of the item.
+    Deletes are not handled here, a post_delete receiver would make every bulk delete fetch the deleted rows. Deleted
+    items are handled by items_deleted instead.
+    """
+    bump_feed_version(instance.feed_id)
+    if not created:
+        unindex_items(sender, [instance.pk])
+    if not instance.hide:
+        index_items(sender, sender.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Feed)
+def feed_deleted(sender, instance, **kwargs):
+    """
+    Removes the items of a deleted feed from the search index.
+    """
+    unindex_feed(instance.pk)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Provides EstimatedCountPaginator, a paginator that does not count every row of a large table.
+
+An exact COUNT(*) scans the whole table on most databases. When the rows of a table are not filtered, the row count
+estimated by the database statistics is used instead, once it is above EXACT_COUNT_LIMIT. Filtered rows are counted
+exactly, the filters of the admin use the indexes on the feed and hide flag.
+"""
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, router, transaction
+
+# Below this amount of rows an exact count is cheap, and more accurate than the estimate
+EXACT_COUNT_LIMIT = 10000
+
+
+def get_estimated_count(model):
+    """Returns the amount of rows of the table of a model, estimated from the database statistics.
+
+    :param model: The model to estimate the amount of rows for.
+    :type model: Model
+    :returns:  int -- the estimated amount of rows, or None if the database has no estimate
+
+    """
+    connection = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [connection.ops.quote_name(table)]
+    elif connection.vendor == 'mysql':
+        sql, params = ('SELECT table_rows FROM information_schema.tables '
+                       'WHERE table_schema = DATABASE() AND table_name = %s'), [table]
+    elif connection.vendor == 'sqlite':
+        # Only filled in by ANALYZE, the first number of the statistics of an index is the amount of rows
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    else:
+        return None
+    try:
+        # A savepoint, so a failing lookup does not break the transaction of the request
+        with transaction.atomic(using=connection.alias):
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    count = int(float(str(row[0]).split()[0]))
+    # PostgreSQL returns -1 or 0 for tables that were never analyzed
+    return count if count > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the estimated amount of rows for the count of unfiltered querysets of large tables
+    """
+    def _get_count(self):
+        if self._count is None:
+            query = getattr(self.object_list, 'query', None)
+            if query is not None and not query.where and not query.distinct:
+                estimate = get_estimated_count(self.object_list.model)
+                if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+                    self._count = estimate
+        return super(EstimatedCountPaginator, self)._get_count()
+    count = property(_get_count)
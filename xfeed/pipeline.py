@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Provides pipeline_refresh_feeds, a function for refreshing many feeds in a pipeline of three stages.
+
+1. Fetch: a pool of threads runs Feed.fetch_document, network I/O does not hold the GIL.
+2. Parse: a pool of processes runs xfeed.providers.parse_document, so parsing uses every core.
+3. Write: the calling thread runs Feed.store_records, for a batch of feeds in one transaction.
+
+The stages are connected by bounded queues. When parsing or writing falls behind, the fetch threads wait instead of
+piling up documents, so a burst of big feeds can not exhaust memory.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from xfeed.providers import parse_document
+from xfeed.refresh import get_feed_host, interleave_by_host, reschedule_failed_feed
+from xfeed.exceptions import RateLimited
+from xfeed.stats import QueryStats
+import multiprocessing
+import threading
+import time
+import Queue
+
+# Put on a queue by a stage that is done
+DONE = None
+
+
+class InlineResult(object):
+    """
+    Stands in for multiprocessing.pool.AsyncResult when documents are parsed without a process pool
+    """
+    def __init__(self, func, *args):
+        try:
+            self.value, self.error = func(*args), None
+        except Exception, e:
+            self.value, self.error = None, e
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def pipeline_refresh_feeds(feeds, fetch_workers=4, parse_workers=None, per_host=None, timeout=None, queue_size=None,
+                           batch_size=None, callback=None):
+    """Refreshes feeds in a fetch, parse and write pipeline. Failing feeds do not stop the other feeds from being
+    refreshed. Measures and logs every refresh like Feed.refresh().
+
+    :param feeds: The feeds to refresh.
+    :type feeds: iterable
+    :param fetch_workers: The amount of fetch threads to use.
+    :type fetch_workers: int
+    :param parse_workers: The amount of parse processes to use, 0 parses in a thread of this process.
+                          Defaults to the amount of CPUs.
+    :type parse_workers: int
+    :param per_host: The maximum amount of feeds of the same host that are fetched at the same time.
+                     Defaults to settings.XFEED_REFRESH_PER_HOST or 2.
+    :type per_host: int
+    :param timeout: Timeout in seconds of every fetch, see Feed.fetch_document.
+                    Defaults to settings.XFEED_REFRESH_TIMEOUT or 30.
+    :type timeout: int
+    :param queue_size: The maximum amount of feeds waiting between two stages.
+                       Defaults to settings.XFEED_PIPELINE_QUEUE_SIZE or 16.
+    :type queue_size: int
+    :param batch_size: The maximum amount of feeds that are written in one transaction.
+                       Defaults to settings.XFEED_PIPELINE_BATCH_SIZE or 10.
+    :type batch_size: int
+    :param callback: If given, called with (feed, error) after every refresh. error is None on success.
+    :type callback: callable
+    :returns:  Object -- like xfeed.refresh.refresh_feeds
+    :raises: ValueError
+
+    """
+    if parse_workers is None:
+        parse_workers = multiprocessing.cpu_count()
+    if per_host is None:
+        per_host = getattr(settings, 'XFEED_REFRESH_PER_HOST', 2)
+    if timeout is None:
+        timeout = getattr(settings, 'XFEED_REFRESH_TIMEOUT', 30)
+    if queue_size is None:
+        queue_size = getattr(settings, 'XFEED_PIPELINE_QUEUE_SIZE', 16)
+    if batch_size is None:
+        batch_size = getattr(settings, 'XFEED_PIPELINE_BATCH_SIZE', 10)
+    if fetch_workers < 1:
+        raise ValueError('The amount of fetch workers must be at least 1')
+    if parse_workers < 0:
+        raise ValueError('The amount of parse workers can not be negative')
+    if per_host < 1:
+        raise ValueError('The amount of feeds per host must be at least 1')
+    if queue_size < 1 or batch_size < 1:
+        raise ValueError('The queue size and batch size must be at least 1')
+    max_entries = getattr(settings, 'XFEED_MAX_ENTRIES', None)
+
+    feed_queue = Queue.Queue()
+    for feed in interleave_by_host(feeds):
+        feed_queue.put(feed)
+    fetch_workers = max(1, min(fetch_workers, feed_queue.qsize()))
+    parse_queue = Queue.Queue(queue_size)
+    write_queue = Queue.Queue(queue_size)
+
+    host_limits = {}
+    lock = threading.Lock()
+    succeeded = []
+    deferred = []
+    failed = []
+
+    def get_host_limit(host):
+        with lock:
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(per_host)
+            return host_limits[host]
+
+    def fetch_stage():
+        try:
+            while True:
+                try:
+                    feed = feed_queue.get_nowait()
+                except Queue.Empty:
+                    return
+                measurement = feed.start_refresh()
+                document = error = None
+                queries = QueryStats(connection)
+                with get_host_limit(get_feed_host(feed)):
+                    try:
+                        with queries:
+                            document = feed.fetch_document(measurement, timeout=timeout)
+                    except Exception, e:
+                        error = e
+                measurement['query_count'] += queries.count
+                measurement['query_time'] += queries.time
+                # Waits while the parse stage is behind
+                parse_queue.put((feed, measurement, document, error))
+        finally:
+            parse_queue.put(DONE)
+            # Every thread gets its own database connection, which must not be left open.
+            connection.close()
+
+    def parse_stage(pool):
+        done = 0
+        while done < fetch_workers:
+            item = parse_queue.get()
+            if item is DONE:
+                done += 1
+                continue
+            feed, measurement, document, error = item
+            result = None
+            if error is None and not document['not_modified']:
+                if pool is not None:
+                    result = pool.apply_async(parse_document, (feed.feed_type, document, max_entries))
+                else:
+                    result = InlineResult(parse_document, feed.feed_type, document, max_entries)
+            # Waits while the write stage is behind, which also caps the amount of documents in the pool
+            write_queue.put((feed, measurement, document, result, error))
+        write_queue.put(DONE)
+
+    def write(feed, measurement, document, records, error):
+        if error is None:
+            queries = QueryStats(connection)
+            try:
+                # A savepoint, so a failing feed does not roll back the other feeds of the batch
+                with transaction.atomic():
+                    with queries:
+                        feed.store_records(document, records, measurement)
+            except Exception, e:
+                error = e
+            measurement['query_count'] += queries.count
+            measurement['query_time'] += queries.time
+        if error is not None:
+            reschedule_failed_feed(feed, error)
+        feed.finish_refresh(measurement, error)
+        if error is None:
+            succeeded.append(feed)
+        elif isinstance(error, RateLimited):
+            deferred.append(feed)
+        else:
+            failed.append((feed, error))
+        if callback is not None:
+            callback(feed, error)
+
+    def write_stage():
+        done = False
+        while not done:
+            batch = [write_queue.get()]
+            while len(batch) < batch_size and batch[-1] is not DONE:
+                try:
+                    batch.append(write_queue.get_nowait())
+                except Queue.Empty:
+                    break
+            if batch[-1] is DONE:
+                batch.pop()
+                done = True
+            # Parsing is waited for before the transaction starts, so the transaction stays short
+            parsed = []
+            for feed, measurement, document, result, error in batch:
+                records = None
+                if result is not None:
+                    try:
+                        records = result.get()
+                    except Exception, e:
+                        error = feed.get_refresh_error(e)
+                parsed.append((feed, measurement, document, records, error))
+            if parsed:
+                with transaction.atomic():
+                    for item in parsed:
+                        write(*item)
+
+    start = time.time()
+    pool = None
+    if parse_workers and not feed_queue.empty():
+        # Forked before any thread starts, the processes must not share the database connection
+        connection.close()
+        pool = multiprocessing.Pool(parse_workers)
+    try:
+        threads = [threading.Thread(target=fetch_stage) for _ in range(fetch_workers)]
+        threads.append(threading.Thread(target=parse_stage, args=(pool,)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        write_stage()
+        for thread in threads:
+            thread.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return {'succeeded': succeeded, 'deferred': deferred, 'failed': failed, 'elapsed': time.time() - start}
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Provides the registry of feed providers, keyed by Feed.feed_type, and parse_document.
+
+A provider fetches, parses and stores the items of one type of feed. Providers are imported the first time a feed of
+their type is refreshed, so processes that never refresh (e.g. web workers) do not import feedparser or twitter.
+settings.XFEED_PROVIDERS maps feed types to the dotted paths of provider classes and overrides the defaults.
+"""
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+import abc
+import threading
+import time
+import urlparse
+
+DEFAULT_PROVIDERS = {
+    'twitter': 'xfeed.providers.twitter.TwitterProvider',
+    'rss': 'xfeed.providers.rss.RSSProvider',
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+class Provider(object):
+    """
+    Base class of the providers. A refresh calls fetch, parse and store, in that order. Subclasses must implement all
+    three.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    # Describes the items of the feed in error messages
+    label = 'items'
+
+    def get_host(self, feed):
+        """Returns the host that is contacted when refreshing a Feed, in lowercase."""
+        return urlparse.urlparse(feed.target).netloc.lower()
+
+    @abc.abstractmethod
+    def fetch(self, feed, measurement, timeout=None):
+        """Fetches the new content of a Feed. Does not save the Feed.
+
+        :param feed: The feed to fetch.
+        :type feed: Feed
+        :param measurement: Receives the fetch time and bytes received.
+        :type measurement: dict
+        :param timeout: If given, the timeout in seconds of the fetch.
+        :type timeout: int
+        :returns:  Object -- holds whether the content is not modified, and whatever parse needs. Can be pickled.
+        :raises: RuntimeError, RateLimited, ValueError
+
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def parse(self, document, max_entries=None):
+        """Parses a fetched document into item records. Must not use the database, it may run in another process.
+
+        :param document: The document returned by fetch.
+        :type document: dict
+        :param max_entries: The maximum amount of newest entries to return.
+        :type max_entries: int
+        :returns:  Object -- holds the channel data (or None), the item records and the amount of entries seen.
+                   Can be pickled.
+
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def store(self, feed, document, records):
+        """Stores the new items of a Feed.
+
+        :param feed: The feed to store the items for.
+        :type feed: Feed
+        :param document: The document returned by fetch.
+        :type document: dict
+        :param records: The records returned by parse.
+        :type records: dict
+        :returns:  int -- the amount of inserted items
+
+        """
+        raise NotImplementedError
+
+
+def get_provider(feed_type):
+    """Returns the provider of a feed type, imported on first use.
+
+    :param feed_type: The type of the feed, e.g. 'twitter' or 'rss'.
+    :type feed_type: str
+    :returns:  Provider
+    :raises: ValueError
+
+    """
+    provider = _providers.get(feed_type)
+    if provider is None:
+        path = dict(DEFAULT_PROVIDERS, **getattr(settings, 'XFEED_PROVIDERS', {})).get(feed_type)
+        if path is None:
+            raise ValueError('There is no provider for feed type %s' % feed_type)
+        with _providers_lock:
+            provider = _providers.get(feed_type)
+            if provider is None:
+                provider = _providers[feed_type] = import_string(path)()
+    return provider
+
+
+def parse_document(feed_type, document, max_entries=None):
+    """Parses a document fetched by Feed.fetch_document into item records.
+    Both the arguments and the result can be pickled, so it can run in another process.
+
+    :param feed_type: The type of the feed.
+    :type feed_type: str
+    :param document: The fetched document, see Feed.fetch_document.
+    :type document: dict
+    :param max_entries: The maximum amount of newest RSS entries to return. Defaults to settings.XFEED_MAX_ENTRIES.
+    :type max_entries: int
+    :returns:  Object -- holds the channel data (None for Twitter), the item records, the amount of entries seen
+               and the parse time
+    :raises: Exception
+
+    """
+    start = time.time()
+    if max_entries is None:
+        max_entries = getattr(settings, 'XFEED_MAX_ENTRIES', None)
+    records = get_provider(feed_type).parse(document, max_entries)
+    records['parse_time'] = time.time() - start
+    return records
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Provides RSSProvider, which refreshes RSS feeds from the URL in Feed.target.
+"""
+
+from django.utils import timezone
+from datetime import datetime
+from time import mktime
+from xfeed.caching import bump_feed_version
+from xfeed.canonical import canonicalize_url
+from xfeed.fetch import fetch
+from xfeed.models import RSSChannelData, RSSItem
+from xfeed.providers import Provider
+from xfeed.websub import discover_hub, get_websub_links
+import feedparser
+import hashlib
+import time
+import urlparse
+
+
+def parse_rss(response, current_tz, max_entries):
+    d = feedparser.parse(response['body'], response_headers=dict(response['headers'],
+                                                                 **{'content-location': response['url']}))
+    feed_pub_date = current_tz.localize(datetime.fromtimestamp(mktime(d.feed.published_parsed)))
+    last_build_date = current_tz.localize(datetime.fromtimestamp(mktime(d.feed.updated_parsed)))
+    channel = {'title': d.feed.title, 'subtitle': d.feed.subtitle, 'link': d.feed.link, 'language': d.feed.language,
+               'pub_date': feed_pub_date, 'last_build_date': last_build_date, 'generator': d.feed.generator,
+               'copyright': d.feed.rights}
+
+    entries = d.entries
+    if max_entries is not None:
+        # Only the newest entries become candidates, feeds are not always ordered newest first
+        entries = sorted(entries, key=lambda entry: entry.get('published_parsed'), reverse=True)[:max_entries]
+    items = []
+    for post in entries:
+        # Without a guid the link identifies the entry. Links are canonical, so tracking parameters or a different
+        # host notation do not make the same entry new. feedparser only sets guidislink when the entry has no
+        # separate link, a guid that is the same URL as the link is a link as well.
+        link = canonicalize_url(post.get('link') or '')
+        ogid = post.get('id') or ''
+        ogid_is_link = bool(post.get('guidislink')) or not ogid or canonicalize_url(ogid) == link
+        ogid = canonicalize_url(ogid or link) if ogid_is_link else ogid
+        if not ogid:
+            continue
+        link = link or (ogid if ogid_is_link else '')
+        pub_date = current_tz.localize(datetime.fromtimestamp(mktime(post.published_parsed)))
+        items.append({'ogid': ogid, 'ogid_is_link': ogid_is_link, 'pub_date': pub_date,
+                      'language': d.feed.language, 'title': post.title, 'description': post.get('summary', ''),
+                      'link': link})
+    websub = get_websub_links(d.feed.get('links', []), response['headers'].get('link'))
+    return {'channel': channel, 'items': items, 'entries_seen': len(d.entries), 'websub': websub}
+
+
+class RSSProvider(Provider):
+    """
+    Fetches RSS documents with the ETag and Last-Modified of the previous fetch, and parses them with feedparser
+    """
+    label = 'RSS'
+
+    def fetch(self, feed, measurement, timeout=None):
+        # A permanent redirect updates the target, the document digest is compared with the previous fetch
+        if not bool(urlparse.urlparse(feed.target).scheme):
+            raise ValueError('RSS target is not a valid URL')
+        try:
+            fetch_start = time.time()
+            response = fetch(feed.target, etag=feed.etag, modified=feed.last_modified, timeout=timeout)
+            measurement['fetch_time'] = time.time() - fetch_start
+            measurement['bytes_received'] = len(response['body'] or '')
+        except Exception, e:
+            raise feed.get_refresh_error(e)
+        if response['permanent_url']:
+            # Permanently moved, later fetches go straight to the new location
+            feed.target = response['permanent_url']
+        feed.etag = response['etag'] or ''
+        feed.last_modified = response['modified'] or ''
+        content_digest = hashlib.sha1(response['body'] or '').hexdigest()
+        return {'not_modified': response['status'] == 304 or content_digest == feed.content_digest,
+                'response': response, 'content_digest': content_digest}
+
+    def parse(self, document, max_entries=None):
+        return parse_rss(document['response'], timezone.get_current_timezone(), max_entries)
+
+    def store(self, feed, document, records):
+        # Updating or inserting RSS channel data, only when it changed
+        channel_digest = hashlib.sha1(repr(sorted(records['channel'].items()))).hexdigest()
+        channel_changed = channel_digest != feed.channel_digest
+        if channel_changed:
+            RSSChannelData.objects.update_or_create(feed=feed, defaults=records['channel'])
+            feed.channel_digest = channel_digest
+        rss_items = [RSSItem(feed=feed, **item) for item in records['items']]
+        inserted = feed.insert_new_items(RSSItem, rss_items)
+        if channel_changed and not inserted:
+            # Inserting items already bumped the version
+            feed.version, feed.content_changed_at = bump_feed_version(feed.pk)
+        # Only stored once the items are, so a failed refresh is processed again next time
+        feed.content_digest = document['content_digest']
+        discover_hub(feed, records['websub'])
+        return inserted
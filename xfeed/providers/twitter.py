@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Provides TwitterProvider, which refreshes Twitter feeds from the user timeline of Feed.target.
+"""
+
+from django.utils import timezone
+from datetime import datetime
+from xfeed.clients import get_twitter_client
+from xfeed.exceptions import RateLimited
+from xfeed.models import Tweet
+from xfeed.providers import Provider
+import time
+
+TWITTER_HOST = 'api.twitter.com'
+
+
+def get_status_record(status):
+    """Returns the values of a python-twitter Status that are stored, as a plain dict."""
+    return {'id': status.id, 'created_at': status.created_at, 'user_id': status.user.id,
+            'screen_name': status.user.screen_name, 'lang': status.user.lang,
+            'profile_image_url': status.user.profile_image_url, 'source': status.source, 'text': status.text,
+            'in_reply_to_user_id': status.in_reply_to_user_id,
+            'in_reply_to_screen_name': status.in_reply_to_screen_name,
+            'in_reply_to_status_id': status.in_reply_to_status_id}
+
+
+def parse_statuses(statuses, current_tz):
+    items = []
+    for s in statuses:
+        naive_date = datetime.strptime(s['created_at'], '%a %b %d %H:%M:%S +0000 %Y')
+        items.append({'ogid': str(s['id']), 'create_date': current_tz.localize(naive_date),
+                      'from_user_id': s['user_id'], 'from_user_name': s['screen_name'], 'language': s['lang'],
+                      'profile_image_url': s['profile_image_url'], 'source': s['source'], 'text': s['text'],
+                      'to_user_id': s['in_reply_to_user_id'], 'to_user_screen_name': s['in_reply_to_screen_name'],
+                      'to_status_id': s['in_reply_to_status_id']})
+    return {'channel': None, 'items': items, 'entries_seen': len(statuses)}
+
+
+class TwitterProvider(Provider):
+    """
+    Fetches the statuses newer than the stored Tweets with the shared Twitter client
+    """
+    label = 'Tweets'
+
+    def get_host(self, feed):
+        # Every Twitter feed is fetched from the API, whatever its target
+        return TWITTER_HOST
+
+    def fetch(self, feed, measurement, timeout=None):
+        # The shared client has the timeout of settings.XFEED_REFRESH_TIMEOUT, see get_twitter_client
+        client = get_twitter_client()
+        try:
+            fetch_start = time.time()
+            statuses = [get_status_record(status) for status in feed.get_new_statuses(client)]
+            measurement['fetch_time'] = time.time() - fetch_start
+        except RateLimited:
+            raise
+        except Exception, e:
+            raise feed.get_refresh_error(e)
+        return {'not_modified': False, 'statuses': statuses}
+
+    def parse(self, document, max_entries=None):
+        # The amount of statuses is already limited by settings.XFEED_TWITTER_MAX_ENTRIES while fetching
+        return parse_statuses(document['statuses'], timezone.get_current_timezone())
+
+    def store(self, feed, document, records):
+        tweets = [Tweet(feed=feed, **item) for item in records['items']]
+        return feed.insert_new_items(Tweet, tweets)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Provides refresh_feeds, a function for refreshing a set of feeds with a pool of worker threads.
+
+Every feed is refreshed by calling Feed.refresh() in a worker thread. The amount of feeds that are
+refreshed at the same time for a single host is capped, so one slow host can not tie up every worker.
+Feeds that fail to refresh are scheduled again with a backoff, feeds that hit a rate limit are deferred until
+the limit resets.
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from xfeed.exceptions import RateLimited
+from xfeed.providers import get_provider
+from collections import deque
+import threading
+import time
+import Queue
+
+
+def get_due_feeds(queryset):
+    """Filters feeds that should be refreshed now.
+
+    :param queryset: The feeds to filter.
+    :type queryset: QuerySet
+    :returns:  QuerySet -- the feeds that were never scheduled or of which the next refresh date has passed
+
+    """
+    return queryset.filter(Q(next_refresh_at__isnull=True) | Q(next_refresh_at__lte=timezone.now()))
+
+
+def get_feed_host(feed):
+    """Returns the host that is contacted when refreshing a Feed.
+
+    :param feed: The feed to get the host for.
+    :type feed: Feed
+    :returns:  str -- the lowercase host name
+
+    """
+    return get_provider(feed.feed_type).get_host(feed)
+
+
+def interleave_by_host(feeds):
+    """Orders feeds so that feeds of the same host are spread out as much as possible.
+
+    :param feeds: The feeds to order.
+    :type feeds: iterable
+    :returns:  list -- the reordered feeds
+
+    """
+    hosts = {}
+    order = []
+    for feed in feeds:
+        host = get_feed_host(feed)
+        if host not in hosts:
+            hosts[host] = deque()
+            order.append(host)
+        hosts[host].append(feed)
+    ret = []
+    while order:
+        for host in list(order):
+            ret.append(hosts[host].popleft())
+            if not hosts[host]:
+                order.remove(host)
+    return ret
+
+
+def reschedule_failed_feed(feed, error):
+    """Schedules the next refresh of a Feed of which the refresh failed.
+    A feed that hit a rate limit is deferred until the limit resets, that is not a failure of the feed.
+
+    :param feed: The feed that failed to refresh.
+    :type feed: Feed
+    :param error: The exception the refresh failed with.
+    :type error: Exception
+
+    """
+    if isinstance(error, RateLimited):
+        feed.next_refresh_at = error.reset
+        feed.save(update_fields=['next_refresh_at'])
+    else:
+        feed.schedule_refresh(failed=True)
+        feed.save(update_fields=['next_refresh_at', 'failure_count'])
+
+
+def refresh_feeds(feeds, workers=1, per_host=None, timeout=None, callback=None):
+    """Refreshes feeds concurrently. Failing feeds do not stop the other feeds from being refreshed.
+
+    :param feeds: The feeds to refresh.
+    :type feeds: iterable
+    :param workers: The amount of worker threads to use.
+    :type workers: int
+    :param per_host: The maximum amount of feeds of the same host that are refreshed at the same time.
+                     Defaults to settings.XFEED_REFRESH_PER_HOST or 2.
+    :type per_host: int
+    :param timeout: Timeout in seconds of every fetch, see Feed.fetch_document.
+                    Defaults to settings.XFEED_REFRESH_TIMEOUT or 30.
+    :type timeout: int
+    :param callback: If given, called with (feed, error) after every refresh. error is None on success.
+    :type callback: callable
+    :returns:  Object -- holds the succeeded feeds, the feeds deferred because of a rate limit, the failed feeds
+               with their errors and the elapsed time
+    :raises: ValueError
+
+    """
+    if per_host is None:
+        per_host = getattr(settings, 'XFEED_REFRESH_PER_HOST', 2)
+    if timeout is None:
+        timeout = getattr(settings, 'XFEED_REFRESH_TIMEOUT', 30)
+    if workers < 1:
+        raise ValueError('The amount of workers must be at least 1')
+    if per_host < 1:
+        raise ValueError('The amount of feeds per host must be at least 1')
+
+    queue = Queue.Queue()
+    for feed in interleave_by_host(feeds):
+        queue.put(feed)
+
+    host_limits = {}
+    lock = threading.Lock()
+    succeeded = []
+    deferred = []
+    failed = []
+
+    def get_host_limit(host):
+        with lock:
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(per_host)
+            return host_limits[host]
+
+    def refresh(feed):
+        limit = get_host_limit(get_feed_host(feed))
+        with limit:
+            try:
+                feed.refresh(timeout=timeout)
+            except Exception, e:
+                error = e
+                reschedule_failed_feed(feed, error)
+            else:
+                error = None
+        with lock:
+            if error is None:
+                succeeded.append(feed)
+            elif isinstance(error, RateLimited):
+                deferred.append(feed)
+            else:
+                failed.append((feed, error))
+            if callback is not None:
+                callback(feed, error)
+
+    def work():
+        try:
+            while True:
+                try:
+                    feed = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                refresh(feed)
+        finally:
+            # Every thread gets its own database connection, which must not be left open.
+            connection.close()
+
+    start = time.time()
+    if workers == 1:
+        while not queue.empty():
+            refresh(queue.get_nowait())
+    else:
+        threads = [threading.Thread(target=work) for _ in range(min(workers, queue.qsize()))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return {'succeeded': succeeded, 'deferred': deferred, 'failed': failed, 'elapsed': time.time() - start}
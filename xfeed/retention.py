@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Provides delete_in_batches, a function for deleting large amounts of Tweets or RSSItems without long locks.
+
+Rows are deleted in bounded batches of primary keys, every batch in its own short transaction, with an optional
+pause in between so other queries get a chance to run. The rows are deleted with plain DELETE statements, so no
+objects are collected in memory and no signals are sent. Deleted Tweets and RSSItems are removed from the search index
+in the same transaction, and the RSSContents that are no longer used by any RSSItem are deleted along with them.
+"""
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from xfeed.search import unindex_items
+import time
+
+
+def get_batch_size():
+    """Returns the amount of rows to delete per batch, settings.XFEED_DELETE_BATCH_SIZE or 500."""
+    return getattr(settings, 'XFEED_DELETE_BATCH_SIZE', 500)
+
+
+def get_batch_pause():
+    """Returns the amount of seconds to pause between two batches, settings.XFEED_DELETE_BATCH_PAUSE or 0."""
+    return getattr(settings, 'XFEED_DELETE_BATCH_PAUSE', 0)
+
+
+def get_content_field(model):
+    """Returns the foreign key of a model to the shared RSSContent, or None if the model has none."""
+    for field in model._meta.fields:
+        if field.name == 'content' and field.rel is not None:
+            return field
+    return None
+
+
+def delete_unused_contents(content_field, content_ids, using='default'):
+    """Deletes the contents of which the primary key is given, when no item uses them anymore.
+
+    :param content_field: The foreign key of the items to the contents.
+    :type content_field: ForeignKey
+    :param content_ids: The primary keys of the contents to check.
+    :type content_ids: iterable
+    :param using: The alias of the database.
+    :type using: str
+    :returns:  int -- the amount of deleted contents
+
+    """
+    content_ids = list(content_ids)
+    if not content_ids:
+        return 0
+    quote_name = connections[using].ops.quote_name
+    contents = content_field.rel.to._meta
+    cursor = connections[using].cursor()
+    cursor.execute('DELETE FROM %(contents)s WHERE %(pk)s IN (%(ids)s) AND NOT EXISTS '
+                   '(SELECT 1 FROM %(items)s WHERE %(items)s.%(fk)s = %(contents)s.%(pk)s)' % {
+                       'contents': quote_name(contents.db_table), 'pk': quote_name(contents.pk.column),
+                       'ids': ', '.join(['%s'] * len(content_ids)),
+                       'items': quote_name(content_field.model._meta.db_table),
+                       'fk': quote_name(content_field.column)}, content_ids)
+    return cursor.rowcount
+
+
+def delete_orphaned_contents(model, batch_size=None, pause=None):
+    """Deletes the contents that no item uses anymore, e.g. after deleting a Feed, in batches of primary keys.
+
+    :param model: The model of the items, RSSItem.
+    :type model: Model
+    :param batch_size: The amount of contents to check per batch. Defaults to get_batch_size().
+    :type batch_size: int
+    :param pause: The amount of seconds to pause between two batches. Defaults to get_batch_pause().
+    :type pause: float
+    :returns:  int -- the amount of deleted contents
+
+    """
+    if batch_size is None:
+        batch_size = get_batch_size()
+    if pause is None:
+        pause = get_batch_pause()
+    content_field = get_content_field(model)
+    using = router.db_for_write(model)
+    pks = content_field.rel.to._default_manager.using(using).order_by('pk').values_list('pk', flat=True)
+    deleted = 0
+    last_pk = None
+    while True:
+        batch = list((pks.filter(pk__gt=last_pk) if last_pk is not None else pks)[:batch_size])
+        if not batch:
+            return deleted
+        with transaction.atomic(using=using):
+            deleted += delete_unused_contents(content_field, batch, using)
+        if len(batch) < batch_size:
+            return deleted
+        last_pk = batch[-1]
+        if pause:
+            time.sleep(pause)
+
+
+def delete_rows(model, pks, content_ids=(), using='default'):
+    """Deletes Tweets or RSSItems by primary key with a plain DELETE, and removes them from the search index.
+    Should be called in a transaction.
+
+    :param model: Tweet or RSSItem.
+    :type model: Model
+    :param pks: The primary keys of the rows to delete.
+    :type pks: list
+    :param content_ids: The primary keys of the contents of the rows, deleted when no item uses them anymore.
+    :type content_ids: iterable
+    :param using: The alias of the database.
+    :type using: str
+    :returns:  int -- the amount of deleted rows
+
+    """
+    quote_name = connections[using].ops.quote_name
+    cursor = connections[using].cursor()
+    cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+        quote_name(model._meta.db_table), quote_name(model._meta.pk.column), ', '.join(['%s'] * len(pks))), pks)
+    deleted = cursor.rowcount
+    unindex_items(model, pks)
+    if content_ids:
+        delete_unused_contents(get_content_field(model), content_ids, using)
+    return deleted
+
+
+def delete_in_batches(queryset, batch_size=None, pause=None):
+    """Deletes the rows of a queryset in batches of primary keys.
+
+    :param queryset: The rows to delete.
+    :type queryset: QuerySet
+    :param batch_size: The amount of rows to delete per batch. Defaults to get_batch_size().
+    :type batch_size: int
+    :param pause: The amount of seconds to pause between two batches. Defaults to get_batch_pause().
+    :type pause: float
+    :returns:  int -- the amount of deleted rows
+
+    """
+    if batch_size is None:
+        batch_size = get_batch_size()
+    if pause is None:
+        pause = get_batch_pause()
+    model = queryset.model
+    using = router.db_for_write(model)
+    content_field = get_content_field(model)
+    if content_field is not None:
+        rows = queryset.order_by().values_list('pk', content_field.name)
+    else:
+        rows = queryset.order_by().values_list('pk', flat=True)
+    deleted = 0
+    while True:
+        batch = list(rows[:batch_size])
+        if not batch:
+            return deleted
+        content_ids = []
+        if content_field is not None:
+            content_ids = set(content_id for pk, content_id in batch if content_id is not None)
+            batch = [pk for pk, content_id in batch]
+        with transaction.atomic(using=using):
+            deleted += delete_rows(model, batch, content_ids, using)
+        if len(batch) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a full-text search index over the visible Tweets and RSSItems, and search_items for querying it.
+
+The index is kept up to date incrementally: items are indexed when they are inserted by Feed.refresh(), re-indexed
+when they are saved (e.g. after hiding or unhiding them) and removed when they are deleted one by one, in batches, with
+the delete action of the admin or when their feed is deleted. Depending on the database one of these backends is used:
+
+* PostgreSQL: a tsvector column with a GIN index, ranked with ts_rank.
+* SQLite with FTS5: an FTS5 table, ranked with bm25.
+* Others: an inverted index of terms in the SearchTerm model, ranked by term frequency.
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import strip_tags
+import re
+
+# Used to combine the kind and primary key of an item into one FTS5 rowid
+KINDS = {'rss': 0, 'tweet': 1}
+# Terms in titles weigh more than terms in texts and descriptions
+TITLE_WEIGHT = 2
+MAX_TERM_LENGTH = 40
+
+_fts5_tables = {}
+
+
+def is_enabled():
+    """Returns whether items are indexed, settings.XFEED_SEARCH_INDEX or True."""
+    return getattr(settings, 'XFEED_SEARCH_INDEX', True)
+
+
+def get_kind(model):
+    """Returns the kind of item a model holds, 'tweet' or 'rss', or None if the model is not indexed."""
+    return {'tweet': 'tweet', 'rssitem': 'rss'}.get(model._meta.model_name)
+
+
+def tokenize(text):
+    """Returns the lowercase terms of a text."""
+    return [term[:MAX_TERM_LENGTH] for term in re.findall(r'\w+', text.lower(), re.UNICODE)]
+
+
+class PostgresBackend(object):
+    """
+    Searches the xfeed_search table with a tsvector column, created by migration 0011_search
+    """
+    def __init__(self):
+        self.config = getattr(settings, 'XFEED_SEARCH_CONFIG', 'simple')
+
+    def add(self, entries):
+        connection.cursor().executemany(
+            "INSERT INTO xfeed_search (kind, item_id, feed_id, document) VALUES (%s, %s, %s, "
+            "setweight(to_tsvector(%s::regconfig, %s), 'A') || setweight(to_tsvector(%s::regconfig, %s), 'B'))",
+            [(entry['kind'], entry['item_id'], entry['feed_id'], self.config, entry['title'], self.config,
+              entry['body']) for entry in entries])
+
+    def remove(self, kind, item_ids):
+        connection.cursor().execute('DELETE FROM xfeed_search WHERE kind = %%s AND item_id IN (%s)' % (
+            ', '.join(['%s'] * len(item_ids))), [kind] + list(item_ids))
+
+    def remove_feed(self, feed_id):
+        connection.cursor().execute('DELETE FROM xfeed_search WHERE feed_id = %s', [feed_id])
+
+    def search(self, query, feed_ids, limit, offset):
+        sql = ('SELECT kind, item_id, ts_rank(document, query) AS rank '
+               'FROM xfeed_search, plainto_tsquery(%s::regconfig, %s) query WHERE document @@ query')
+        params = [self.config, query]
+        if feed_ids is not None:
+            sql += ' AND feed_id IN (%s)' % ', '.join(['%s'] * len(feed_ids))
+            params.extend(feed_ids)
+        cursor = connection.cursor()
+        cursor.execute(sql + ' ORDER BY rank DESC, item_id DESC LIMIT %s OFFSET %s', params + [limit, offset])
+        return cursor.fetchall()
+
+
+class SQLiteBackend(object):
+    """
+    Searches the xfeed_search FTS5 table, created by migration 0011_search when SQLite supports FTS5
+    """
+    def add(self, entries):
+        connection.cursor().executemany(
+            'INSERT INTO xfeed_search (rowid, title, body, feed_id) VALUES (%s, %s, %s, %s)',
+            [(entry['item_id'] * 2 + KINDS[entry['kind']], entry['title'], entry['body'], entry['feed_id'])
+             for entry in entries])
+
+    def remove(self, kind, item_ids):
+        connection.cursor().execute('DELETE FROM xfeed_search WHERE rowid IN (%s)' % (
+            ', '.join(['%s'] * len(item_ids))), [item_id * 2 + KINDS[kind] for item_id in item_ids])
+
+    def remove_feed(self, feed_id):
+        connection.cursor().execute('DELETE FROM xfeed_search WHERE feed_id = %s', [feed_id])
+
+    def search(self, query, feed_ids, limit, offset):
+        # Every term is quoted, so the query syntax of FTS5 can not be used to break the query
+        match = ' '.join('"%s"' % term.replace('"', '""') for term in query.split())
+        if not match:
+            return []
+        sql = ('SELECT rowid, bm25(xfeed_search, %s, 1.0) AS rank FROM xfeed_search '
+               'WHERE xfeed_search MATCH %%s' % float(TITLE_WEIGHT))
+        params = [match]
+        if feed_ids is not None:
+            sql += ' AND feed_id IN (%s)' % ', '.join(['%s'] * len(feed_ids))
+            params.extend(feed_ids)
+        cursor = connection.cursor()
+        cursor.execute(sql + ' ORDER BY rank, rowid DESC LIMIT %s OFFSET %s', params + [limit, offset])
+        kinds = dict((value, kind) for kind, value in KINDS.items())
+        # bm25 is lower for better matches
+        return [(kinds[rowid % 2], rowid // 2, -rank) for rowid, rank in cursor.fetchall()]
+
+
+class PythonBackend(object):
+    """
+    Searches the SearchTerm model, an inverted index of the terms of every item
+    """
+    def add(self, entries):
+        from xfeed.models import SearchTerm
+        terms = []
+        for entry in entries:
+            weights = {}
+            for weight, text in ((TITLE_WEIGHT, entry['title']), (1, entry['body'])):
+                for term in tokenize(text):
+                    weights[term] = weights.get(term, 0) + weight
+            terms.extend(SearchTerm(term=term, kind=entry['kind'], item_id=entry['item_id'],
+                                    feed_id=entry['feed_id'], weight=weight) for term, weight in weights.items())
+        SearchTerm.objects.bulk_create(terms)
+
+    def remove(self, kind, item_ids):
+        from xfeed.models import SearchTerm
+        SearchTerm.objects.filter(kind=kind, item_id__in=item_ids).delete()
+
+    def remove_feed(self, feed_id):
+        from xfeed.models import SearchTerm
+        SearchTerm.objects.filter(feed=feed_id).delete()
+
+    def search(self, query, feed_ids, limit, offset):
+        from django.db.models import Count, Sum
+        from xfeed.models import SearchTerm
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        matches = SearchTerm.objects.filter(term__in=terms)
+        if feed_ids is not None:
+            matches = matches.filter(feed__in=feed_ids)
+        # Only items that contain every term match
+        matches = matches.values('kind', 'item_id').annotate(matched=Count('term', distinct=True), rank=Sum('weight'))
+        matches = matches.filter(matched=len(terms)).order_by('-rank', '-item_id')[offset:offset + limit]
+        return [(match['kind'], match['item_id'], match['rank']) for match in matches]
+
+
+def has_fts5_table():
+    """Returns whether the FTS5 table of the SQLite database exists."""
+    name = connection.settings_dict['NAME']
+    if name not in _fts5_tables:
+        _fts5_tables[name] = 'xfeed_search' in connection.introspection.table_names()
+    return _fts5_tables[name]
+
+
+def get_backend():
+    """Returns the search backend for the database."""
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    if connection.vendor == 'sqlite' and has_fts5_table():
+        return SQLiteBackend()
+    return PythonBackend()
+
+
+def index_items(model, queryset):
+    """Adds the visible items of a queryset to the index. The items must not be indexed yet.
+
+    :param model: Tweet or RSSItem.
+    :type model: Model
+    :param queryset: The items to index.
+    :type queryset: QuerySet
+
+    """
+    kind = get_kind(model)
+    if kind is None or not is_enabled():
+        return
+    if kind == 'tweet':
+        entries = [{'kind': kind, 'item_id': pk, 'feed_id': feed_id, 'title': '', 'body': text}
+                   for pk, feed_id, text in queryset.filter(hide=False).order_by().values_list('pk', 'feed_id', 'text')]
+    else:
+        entries = [{'kind': kind, 'item_id': pk, 'feed_id': feed_id, 'title': title,
+                    'body': strip_tags(description or '')}
+                   for pk, feed_id, title, description in queryset.filter(hide=False).order_by().values_list(
+                       'pk', 'feed_id', 'title', 'content__body')]
+    if entries:
+        get_backend().add(entries)
+
+
+def unindex_items(model, pks):
+    """Removes items from the index.
+
+    :param model: Tweet or RSSItem.
+    :type model: Model
+    :param pks: The primary keys of the items.
+    :type pks: list
+
+    """
+    kind = get_kind(model)
+    if kind is None or not pks or not is_enabled():
+        return
+    get_backend().remove(kind, pks)
+
+
+def unindex_feed(feed_id):
+    """Removes all items of a feed from the index."""
+    if is_enabled():
+        get_backend().remove_feed(feed_id)
+
+
+def search_items(query, feeds=None, limit=20, offset=0):
+    """Searches the visible Tweets and RSSItems, best match first.
+
+    :param query: The terms to search for, all terms must match.
+    :type query: unicode
+    :param feeds: If given, only items of these feeds are searched.
+    :type feeds: list
+    :param limit: The maximum amount of results.
+    :type limit: int
+    :param offset: The amount of results to skip.
+    :type offset: int
+    :returns:  list -- an Object per result, holding its type ('tweet' or 'rss'), the item and its rank
+
+    """
+    from xfeed.models import RSSItem, Tweet
+    if feeds is not None:
+        feeds = [feed.pk for feed in feeds]
+        if not feeds:
+            return []
+    hits = get_backend().search(query, feeds, limit, offset)
+    items = {
+        'tweet': Tweet.objects.in_bulk([item_id for kind, item_id, rank in hits if kind == 'tweet']),
+        'rss': RSSItem.objects.select_related('content').in_bulk(
+            [item_id for kind, item_id, rank in hits if kind == 'rss']),
+    }
+    # Items deleted with QuerySet.delete() outside the admin are not removed from the index, they are skipped here
+    return [{'type': kind, 'item': items[kind][item_id], 'rank': rank} for kind, item_id, rank in hits
+            if item_id in items[kind] and not items[kind][item_id].hide]
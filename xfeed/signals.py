@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Provides the signals sent by Feed.refresh().
+
+pre_refresh is sent with the feed before it is refreshed.
+post_refresh is sent with the feed, the measurement of the refresh and the stored FeedRefreshLog (None if logging is
+disabled) after it is refreshed, whether the refresh succeeded or not.
+"""
+
+from django.dispatch import Signal
+
+pre_refresh = Signal(providing_args=['feed'])
+post_refresh = Signal(providing_args=['feed', 'measurement', 'log'])
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Provides QueryStats and percentile, helpers for measuring refreshes and summarizing the measurements.
+"""
+
+
+class QueryStats(object):
+    """
+    Context manager that counts the queries made on a database connection and the time they took.
+    Like django.test.utils.CaptureQueriesContext, it enables the debug cursor of the connection while active. The
+    queries it logged are removed again when the connection would not have logged them otherwise, outside a request
+    nothing else clears the log.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+        self.time = 0.0
+
+    def __enter__(self):
+        self.force_debug_cursor = self.connection.force_debug_cursor
+        self.connection.force_debug_cursor = True
+        queries_log = self.connection.queries_log
+        self.last = queries_log[-1] if queries_log else None
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.force_debug_cursor = self.force_debug_cursor
+        # The log has a maximum length, so the new queries are found by walking back to the last known query
+        queries = []
+        for query in reversed(self.connection.queries_log):
+            if query is self.last:
+                break
+            queries.append(query)
+        self.count = len(queries)
+        self.time = sum(float(query['time']) for query in queries)
+        if not self.connection.queries_logged:
+            for i in range(self.count):
+                self.connection.queries_log.pop()
+
+
+def percentile(values, percent):
+    """Returns a percentile of values, using the nearest rank.
+
+    :param values: The values, in any order.
+    :type values: list
+    :param percent: The percentile, between 0 and 100.
+    :type percent: int
+    :returns:  float -- the percentile, or None if there are no values
+
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(len(values) - 1, rank))]
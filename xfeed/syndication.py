@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Provides get_syndication, a function that republishes the items of one or more feeds as RSS 2.0, Atom or JSON Feed.
+
+Generated documents are cached per feed version, so they are only generated again after one of the feeds changed
+(e.g. after a refresh stored new items). The cached document holds its own ETag and Last-Modified date, the latter is
+the last change of the feeds or of their items as stored in the database, so it never moves backwards.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import feedgenerator
+from xfeed.caching import get_cache_timeout, get_group_cache_key
+from xfeed.models import RSSChannelData, RSSItem, Tweet
+import hashlib
+import json
+
+FORMATS = {
+    'rss': feedgenerator.Rss201rev2Feed,
+    'atom': feedgenerator.Atom1Feed,
+    'json': None,
+}
+JSON_FEED_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+
+def get_items(feeds, amount):
+    """Returns the newest visible items of a group of feeds, as dicts with the fields of a syndication item.
+
+    :param feeds: The feeds to get the items of.
+    :type feeds: list
+    :param amount: The maximum amount of items.
+    :type amount: int
+    :returns:  list -- the items, newest first
+
+    """
+    twitter_feeds = [feed.pk for feed in feeds if feed.feed_type == 'twitter']
+    rss_feeds = [feed.pk for feed in feeds if feed.feed_type == 'rss']
+    items = []
+    if twitter_feeds:
+        for tweet in Tweet.objects.filter(feed__in=twitter_feeds, hide=False).order_by('-create_date')[:amount]:
+            items.append({'id': 'tweet:%s' % tweet.ogid, 'title': tweet.text[:100], 'description': tweet.text,
+                          'link': 'https://twitter.com/%s/status/%s' % (tweet.from_user_name, tweet.ogid),
+                          'author': tweet.from_user_name, 'date': tweet.create_date})
+    if rss_feeds:
+        rss_items = RSSItem.objects.filter(feed__in=rss_feeds, hide=False).select_related('content')
+        for rss_item in rss_items.order_by('-pub_date')[:amount]:
+            items.append({'id': rss_item.ogid, 'title': rss_item.title, 'description': rss_item.description,
+                          'link': rss_item.link, 'author': None, 'date': rss_item.pub_date})
+    items.sort(key=lambda item: item['date'], reverse=True)
+    return items[:amount]
+
+
+def get_channel(feeds, link):
+    """Returns the title, link and description to publish a group of feeds with.
+
+    :param feeds: The feeds to get the channel of.
+    :type feeds: list
+    :param link: The link to use when no feed provides one.
+    :type link: str
+    :returns:  Object -- holds the title, link and description
+
+    """
+    if len(feeds) == 1:
+        feed = feeds[0]
+        try:
+            channel_data = RSSChannelData.objects.get(feed=feed)
+        except RSSChannelData.DoesNotExist:
+            return {'title': feed.name, 'link': feed.website or link, 'description': feed.name}
+        return {'title': channel_data.title or feed.name, 'link': channel_data.link or feed.website or link,
+                'description': channel_data.subtitle or feed.name}
+    names = ', '.join(feed.name for feed in feeds)
+    return {'title': names, 'link': link, 'description': names}
+
+
+def get_last_modified(feeds):
+    """Returns the date a group of feeds or any of their items last changed, as stored in the database.
+
+    :param feeds: The feeds to get the date of.
+    :type feeds: list
+    :returns:  datetime -- the last change
+
+    """
+    return max(date for feed in feeds for date in (feed.modified_on, feed.content_changed_at) if date is not None)
+
+
+def generate(feeds, format, link, feed_url):
+    """Generates a syndication document for a group of feeds.
+
+    :param feeds: The feeds to publish.
+    :type feeds: list
+    :param format: 'rss', 'atom' or 'json'.
+    :type format: str
+    :param link: The link of the website that publishes the document.
+    :type link: str
+    :param feed_url: The URL the document is served at.
+    :type feed_url: str
+    :returns:  Object -- holds the content type, the body, the ETag and the Last-Modified date
+
+    """
+    channel = get_channel(feeds, link)
+    items = get_items(feeds, getattr(settings, 'XFEED_SYNDICATION_ITEMS', 50))
+    if format == 'json':
+        content_type = JSON_FEED_CONTENT_TYPE
+        body = json.dumps({
+            'version': 'https://jsonfeed.org/version/1',
+            'title': channel['title'],
+            'home_page_url': channel['link'],
+            'feed_url': feed_url,
+            'description': channel['description'],
+            'items': [dict({'id': item['id'], 'url': item['link'], 'title': item['title'],
+                            'content_html': item['description'], 'date_published': item['date']},
+                           **({'author': {'name': item['author']}} if item['author'] else {}))
+                      for item in items],
+        }, cls=DjangoJSONEncoder)
+    else:
+        generator = FORMATS[format](title=channel['title'], link=channel['link'], description=channel['description'],
+                                    feed_url=feed_url)
+        for item in items:
+            generator.add_item(title=item['title'], link=item['link'], description=item['description'],
+                               unique_id=item['id'], pubdate=item['date'], author_name=item['author'])
+        content_type = generator.mime_type
+        body = generator.writeString('utf-8')
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+    return {'content_type': content_type, 'body': body, 'etag': hashlib.md5(body).hexdigest(),
+            'last_modified': get_last_modified(feeds)}
+
+
+def get_syndication(feeds, format, link, feed_url):
+    """Returns the cached syndication document for a group of feeds, generating it if it is not cached.
+    The document is cached per group and format, so the link and URL must be the same for every request of the group.
+
+    :param feeds: The feeds to publish.
+    :type feeds: list
+    :param format: 'rss', 'atom' or 'json'.
+    :type format: str
+    :param link: The link of the website that publishes the document.
+    :type link: str
+    :param feed_url: The URL the document is served at, see xfeed.views.get_syndication_url.
+    :type feed_url: str
+    :returns:  Object -- holds the content type, the body, the ETag and the Last-Modified date
+    :raises: ValueError
+
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown syndication format %s' % format)
+    # Saving a feed (e.g. renaming it) changes the channel of the document as well
+    key = get_group_cache_key(feeds, 'syndication', format, sorted((feed.pk, feed.modified_on) for feed in feeds))
+    syndication = cache.get(key)
+    if syndication is None:
+        syndication = generate(feeds, format, link, feed_url)
+        cache.set(key, syndication, get_cache_timeout())
+    return syndication
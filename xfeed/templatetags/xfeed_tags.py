@@ -1,10 +1,52 @@
 from django import template
+from django.core.cache import cache
+from xfeed.caching import get_cache_key, get_cache_timeout
 
 register = template.Library()
 
 @register.simple_tag
 def generate_feed_list(feed, amount=None, list_class=None, li_class=None, list_type='ul'):
-    """Generates a HTML list with items from a feed
+    """Generates a HTML list with items from a feed. The list is cached until the items of the feed change.
+
+    :param feed: The feed to generate the list from.
+    :type feed: Feed
+    :param amount: The amount of items to show.
+    :type amount: int
+    :param ul_class: The <ul> or <ol> class to use.
+    :type ul_class: str
+    :param li_class: The <li> class to use.
+    :type li_class: str
+    :param list_type: The list type to use. Defaults to 'ul'
+    :type list_type: str
+    :raises:  ValueError
+    """
+
+    key = get_cache_key(feed, 'feed_list', amount, list_class, li_class, list_type)
+    ret = cache.get(key)
+    if ret is None:
+        ret = render_feed_list(feed, amount, list_class, li_class, list_type)
+        cache.set(key, ret, get_cache_timeout())
+    return ret
+
+
+def get_visible_items(feed, items):
+    """Returns the items of a feed that are not hidden. Uses the 'visible_items' attribute if it was set, a list of
+    prefetched items or a queryset (e.g. by the detail view).
+
+    :param feed: The feed to get the items of.
+    :type feed: Feed
+    :param items: The related manager of the items (e.g. feed.tweets).
+    :type items: Manager
+    :returns:  QuerySet or list -- the visible items
+    """
+    visible_items = getattr(feed, 'visible_items', None)
+    if visible_items is not None:
+        return visible_items
+    return items.filter(hide=False)
+
+
+def render_feed_list(feed, amount=None, list_class=None, li_class=None, list_type='ul'):
+    """Renders a HTML list with items from a feed
 
     :param feed: The feed to generate the list from.
     :type feed: Feed
@@ -21,7 +63,7 @@ def generate_feed_list(feed, amount=None, list_class=None, li_class=None, list_t
 
     if feed.feed_type == 'twitter':
         ret = ['<%s class="%s">' % (list_type, list_class or 'tweet-list')]
-        tweets = feed.tweets.all()
+        tweets = get_visible_items(feed, feed.tweets)
         if amount:
             if not int(amount):
                 raise ValueError('Amount must be a number')
@@ -34,7 +76,7 @@ def generate_feed_list(feed, amount=None, list_class=None, li_class=None, list_t
                 '<div class="tweet-body">%s</div></li>' % (li_class or 'tweet', t.profile_image_url, t.from_user_name, t.text))
     if feed.feed_type == 'rss':
         ret = ['<%s class="%s">' % (list_type, list_class or 'rss-list')]
-        rss_items = feed.rss_items.all()
+        rss_items = get_visible_items(feed, feed.rss_items.select_related('content'))
         if amount:
             if not int(amount):
                 raise ValueError('Amount must be a number')
@@ -0,0 +1,6 @@
+"""
+Tests of refreshing, storing, cleaning up and publishing feeds.
+
+RSS feeds are served by a local HTTP server and Twitter is replaced by a stub, so no network access is needed.
+The query budgets and timings of the hot paths are kept apart in test_benchmarks.
+"""
@@ -0,0 +1,388 @@
+"""
+Offline benchmarks for refreshing, ingesting, cleaning up and rendering feeds.
+
+Every benchmark writes its wall time and query count to stderr and fails when the query count exceeds its budget,
+so N+1 regressions fail the build. The startup benchmark fails when the web modules import a feed provider.
+The behavior itself is tested by the other test modules.
+"""
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.template import Context, Template
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from StringIO import StringIO
+from xfeed import search, websub
+from xfeed.archive import get_archived_items
+from xfeed.models import Feed, RSSContent, RSSItem, SearchTerm, Tweet, hide_items
+from xfeed.tests.utils import FeedServer, XFeedTestCase, create_rss_items, create_tweets, generate_rss, stub_twitter
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Storing the FeedRefreshLog of a refresh and looking up the oldest log to keep
+LOG_QUERIES = 2
+
+# Storing the new version of a feed whose items changed, see xfeed.caching
+VERSION_QUERIES = 1
+
+# Values per IN lookup when storing new items, see xfeed.models.get_lookup_batches
+LOOKUP_BATCH_SIZE = 500
+
+# Imports the modules a web worker needs, and reports the import time and which backends got imported
+STARTUP_SCRIPT = '''
+import django, json, sys, time
+start = time.time()
+django.setup()
+import xfeed.admin, xfeed.models, xfeed.templatetags.xfeed_tags, xfeed.urls
+%s
+print(json.dumps({'elapsed': time.time() - start, 'modules': [name for name in ('feedparser', 'twitter')
+                                                              if name in sys.modules]}))
+'''
+
+
+class BenchmarkTestCase(XFeedTestCase):
+    """
+    TestCase with a benchmark context manager that reports wall time and enforces a query budget
+    """
+    @contextlib.contextmanager
+    def benchmark(self, name, max_queries):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            yield
+            elapsed = time.time() - start
+        sys.stderr.write('\n%-50s %8.3fs %6s queries (budget %s) ' % (name, elapsed, len(queries), max_queries))
+        self.assertLessEqual(len(queries), max_queries,
+                             '%s made %s queries, the budget is %s' % (name, len(queries), max_queries))
+
+    def insert_queries(self, model, amount):
+        """Returns the amount of INSERT queries bulk_create needs for an amount of rows on this database."""
+        batch_size = max(connection.ops.bulk_batch_size(model._meta.concrete_fields, [None] * amount), 1)
+        return (amount + batch_size - 1) // batch_size
+
+    def lookup_queries(self, amount):
+        """Returns the amount of queries needed to look up an amount of values, see get_lookup_batches."""
+        return max((amount + LOOKUP_BATCH_SIZE - 1) // LOOKUP_BATCH_SIZE, 1)
+
+    def rss_insert_queries(self, amount):
+        """Returns the amount of queries needed to insert an amount of new RSSItems with new descriptions.
+        The existing contents are looked up, the new contents inserted in a (nested) transaction and their primary keys
+        selected. Beyond a batch of lookups, the original IDs and the new items to index are looked up in batches as
+        well."""
+        return (self.insert_queries(RSSItem, amount) + 4 + self.insert_queries(RSSContent, amount) +
+                4 * (self.lookup_queries(amount) - 1))
+
+    def delete_queries(self, amount, batch_size=500):
+        """Returns the amount of queries delete_in_batches may need for an amount of rows.
+        Every batch selects its primary keys and deletes them, their search index entries and their unused contents
+        in a (nested) transaction."""
+        return 6 * (amount // batch_size + 1)
+
+    def index_queries(self, amount):
+        """Returns the amount of queries needed to add an amount of new items to the search index.
+        The items are selected, then inserted with one query, or as SearchTerms (at most 8 per item) without full-text
+        search."""
+        if isinstance(search.get_backend(), search.PythonBackend):
+            return 1 + self.insert_queries(SearchTerm, amount * 8)
+        return 2
+
+
+class RefreshBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks Feed.refresh() and refresh_xfeeds. Apart from the INSERT batches bulk_create needs on the database
+    (SQLite limits the amount of parameters per query), the query counts must not grow with the amount of entries.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(RefreshBenchmark, cls).setUpClass()
+        cls.server = FeedServer()
+        for amount in (10, 100, 1000):
+            cls.server.documents['/%s.xml' % amount] = generate_rss(amount)
+        cls.server.documents['/mirror.xml'] = generate_rss(100, host='EXAMPLE.com:80',
+                                                           query='?utm_source=mirror&utm_medium=rss#top')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super(RefreshBenchmark, cls).tearDownClass()
+
+    def test_refresh_rss(self):
+        for amount in (10, 100, 1000):
+            feed = Feed.objects.create(name='RSS %s' % amount, feed_type='rss', uuid='rss-%s' % amount,
+                                       target=self.server.url('/%s.xml' % amount))
+            with self.benchmark('refresh RSS, %s new entries' % amount,
+                                9 + LOG_QUERIES + VERSION_QUERIES + self.rss_insert_queries(amount) +
+                                self.index_queries(amount)):
+                feed.refresh()
+            with self.benchmark('refresh RSS, %s unchanged entries' % amount, 3 + LOG_QUERIES):
+                feed.refresh()
+
+    def test_refresh_rss_new_entries(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/100.xml'))
+        feed.refresh()
+        self.server.documents['/100.xml'] = generate_rss(100, offset=50)
+        try:
+            with self.benchmark('refresh RSS, 50 new of 100 entries',
+                                9 + LOG_QUERIES + VERSION_QUERIES +
+                                self.rss_insert_queries(50) + self.index_queries(50)):
+                feed.refresh()
+        finally:
+            self.server.documents['/100.xml'] = generate_rss(100)
+
+    def test_refresh_rss_mirror(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/100.xml'))
+        feed.refresh()
+        mirror = Feed.objects.create(name='Mirror', feed_type='rss', uuid='mirror',
+                                     target=self.server.url('/mirror.xml'))
+        # The descriptions are already stored, only looked up
+        with self.benchmark('refresh RSS, 100 entries of another feed',
+                            9 + LOG_QUERIES + VERSION_QUERIES +
+                            self.insert_queries(RSSItem, 100) + 1 + self.index_queries(100)):
+            mirror.refresh()
+
+    def test_refresh_rss_not_modified(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/100.xml'))
+        feed.refresh()
+        with self.benchmark('refresh RSS, not modified', 3 + LOG_QUERIES):
+            feed.refresh()
+
+    def test_xfeed_stats(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/10.xml'))
+        feed.refresh()
+        # The logs and the names of their feeds
+        with self.benchmark('xfeed_stats, 1 refresh', 2):
+            call_command('xfeed_stats', stdout=StringIO())
+
+    def test_refresh_twitter(self):
+        feed = Feed.objects.create(name='Twitter', feed_type='twitter', uuid='twitter', target='xfeed')
+        with stub_twitter(200):
+            with self.benchmark('refresh Twitter, 200 new statuses',
+                                8 + LOG_QUERIES + VERSION_QUERIES +
+                                self.insert_queries(Tweet, 200) + self.index_queries(200)):
+                feed.refresh()
+        with stub_twitter(600):
+            with self.benchmark('refresh Twitter, 400 new statuses in pages',
+                                8 + LOG_QUERIES + VERSION_QUERIES +
+                                self.insert_queries(Tweet, 400) + self.index_queries(400)):
+                feed.refresh()
+
+    def test_refresh_xfeeds(self):
+        amount = 20
+        for i in range(amount):
+            Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                target=self.server.url('/10.xml'))
+        # Fetching the feeds, then refreshing every feed as above
+        with self.benchmark('refresh_xfeeds, %s feeds' % amount,
+                            1 + (9 + LOG_QUERIES + VERSION_QUERIES +
+                                 self.rss_insert_queries(10) + self.index_queries(10)) * amount):
+            call_command('refresh_xfeeds', stdout=StringIO())
+
+
+@override_settings(XFEED_DELETE_BATCH_SIZE=500)
+class RetentionBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks Feed.clean_up() and Feed.flush() on large tables
+    """
+    amount = 5000
+
+    def setUp(self):
+        super(RetentionBenchmark, self).setUp()
+        self.feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        self.now = timezone.now()
+        create_rss_items(self.feed, self.amount, self.now)
+
+    def test_clean_up(self):
+        with self.benchmark('clean_up, %s of %s items' % (self.amount / 2, self.amount),
+                            2 + self.delete_queries(self.amount / 2)):
+            self.feed.clean_up(self.now - timedelta(minutes=self.amount / 2, seconds=-1))
+
+    def test_clean_up_archive(self):
+        date = self.now - timedelta(minutes=self.amount / 2, seconds=-1)
+        # Every batch also inserts the archive rows of its months
+        with self.benchmark('clean_up to archive, %s of %s items' % (self.amount / 2, self.amount),
+                            2 + self.delete_queries(self.amount / 2) + self.amount / 2 / 500 + 1):
+            self.feed.clean_up(date, archive=True)
+        with self.benchmark('read archive, %s items' % (self.amount / 2), 1):
+            list(get_archived_items(self.feed, RSSItem))
+
+    def test_flush(self):
+        with self.benchmark('flush, %s items' % self.amount, 3 + self.delete_queries(self.amount)):
+            self.feed.flush()
+
+
+class HideBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks hiding and unhiding many items at once, like the bulk actions of the admin
+    """
+    amount = 1000
+
+    def test_hide_items(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, self.amount)
+        RSSItem.objects.update(hide=True)
+        # Per batch of 500 items: selecting the items, a transaction with one UPDATE and the search index, and the
+        # version of the feed. Then the select that finds no more items.
+        batches = self.amount // 500
+        with self.benchmark('unhide %s items' % self.amount,
+                            batches * (4 + self.index_queries(500) + VERSION_QUERIES) + 1):
+            hide_items(RSSItem.objects.all(), False)
+        with self.benchmark('hide %s items' % self.amount, batches * (5 + VERSION_QUERIES) + 1):
+            hide_items(RSSItem.objects.all(), True)
+
+
+class TransferBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks xfeed_export and xfeed_import, the query counts must only grow with the amount of batches
+    """
+    amount = 2500
+    batch_size = 1000
+
+    def test_export_import(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, self.amount)
+        batches = self.amount // self.batch_size + 1
+        out = StringIO()
+        # The feeds, channels and Tweets, then the RSS items per batch
+        with self.benchmark('xfeed_export, %s items' % self.amount, 3 + batches):
+            call_command('xfeed_export', batch_size=self.batch_size, stdout=out, stderr=StringIO())
+        feed.flush()
+        RSSContent.objects.all().delete()
+        # Looking up the feed, then inserting every batch like a refresh
+        with self.benchmark('xfeed_import, %s items' % self.amount,
+                            1 + batches * (3 + self.rss_insert_queries(self.batch_size) +
+                                           self.index_queries(self.batch_size))):
+            call_command('xfeed_import', stdin=StringIO(out.getvalue()), batch_size=self.batch_size,
+                         stdout=StringIO())
+        with self.benchmark('xfeed_import, %s existing items' % self.amount,
+                            1 + batches * (2 + self.lookup_queries(self.batch_size))):
+            call_command('xfeed_import', stdin=StringIO(out.getvalue()), batch_size=self.batch_size,
+                         stdout=StringIO())
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls', XFEED_WEBSUB_CALLBACK_URL='http://testserver/websub/')
+class WebSubBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks content pushed by a WebSub hub
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(WebSubBenchmark, cls).setUpClass()
+        cls.server = FeedServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super(WebSubBenchmark, cls).tearDownClass()
+
+    def test_push(self):
+        hub, topic = self.server.url('/hub'), self.server.url('/websub.xml')
+        self.server.documents['/websub.xml'] = generate_rss(10, hub=hub, topic=topic)
+        feed = Feed.objects.create(name='WebSub', feed_type='rss', uuid='websub', target=topic)
+        feed.refresh()
+        websub.update_subscriptions()
+        path, params = self.server.hub_requests[-1]
+        self.client.get('/websub/websub/', {'hub.mode': 'subscribe', 'hub.topic': topic, 'hub.challenge': 'challenge',
+                                            'hub.lease_seconds': '864000'})
+        body = generate_rss(100, hub=hub, topic=topic)
+        signature = 'sha1=' + hmac.new(str(params['hub.secret'][0]), body, hashlib.sha1).hexdigest()
+        with self.benchmark('push RSS, 90 new of 100 entries',
+                            10 + LOG_QUERIES + VERSION_QUERIES + self.rss_insert_queries(90) + self.index_queries(90)):
+            self.client.post('/websub/websub/', body, content_type='application/rss+xml',
+                             HTTP_X_HUB_SIGNATURE=signature)
+        self.assertEqual(feed.rss_items.count(), 100)
+
+
+class RenderBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks rendering generate_feed_list, with and without a cached list
+    """
+    def test_generate_feed_list(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 1000)
+        template = Template('{% load xfeed_tags %}{% generate_feed_list feed 100 %}')
+        with self.benchmark('generate_feed_list, 100 items, not cached', 1):
+            template.render(Context({'feed': feed}))
+        with self.benchmark('generate_feed_list, 100 items, cached', 0):
+            template.render(Context({'feed': feed}))
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls', XFEED_DETAIL_ITEMS=100)
+class DetailBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks the detail view, which must not select any items when the list is cached or the client has it
+    """
+    def test_detail(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 1000)
+        url = reverse('detail', kwargs={'uuid': feed.uuid})
+        # The feed state, the feed and the rendered items
+        with self.benchmark('detail, 100 of 1000 items, not cached', 3):
+            response = self.client.get(url)
+        with self.benchmark('detail, 100 of 1000 items, cached', 2):
+            self.client.get(url)
+        with self.benchmark('detail, not modified', 1):
+            self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls')
+class TimelineBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks paging through the merged timeline of a Twitter and a RSS feed
+    """
+    def test_timeline(self):
+        rss = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        twitter = Feed.objects.create(name='Twitter', feed_type='twitter', uuid='twitter', target='xfeed')
+        create_rss_items(rss, 23)
+        create_tweets(twitter, 23)
+        url = reverse('timeline')
+        cursor = ''
+        while cursor is not None:
+            # The feeds, the Tweets and the RSS items
+            with self.benchmark('timeline, page of 7 items', 3):
+                response = self.client.get(url, {'feed': ['rss', 'twitter'], 'limit': 7, 'cursor': cursor})
+            cursor = json.loads(response.content)['next']
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls')
+class SyndicationBenchmark(BenchmarkTestCase):
+    """
+    Benchmarks the syndication views, which must generate a document once per group and format
+    """
+    def test_group_syndication(self):
+        feeds = [Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                     target='http://example.com/') for i in range(2)]
+        for feed in feeds:
+            create_rss_items(feed, 100)
+        url = reverse('group_syndication', kwargs={'format': 'atom'})
+        # The feeds, then the items of every feed type
+        with self.benchmark('syndication, 2 feeds, not cached', 2):
+            self.client.get(url, {'feed': ['rss-1', 'rss-0']})
+        with self.benchmark('syndication, 2 feeds, cached', 1):
+            self.client.get(url, {'feed': ['rss-0', 'rss-1']})
+
+
+class StartupBenchmark(SimpleTestCase):
+    """
+    Imports the web modules in a fresh interpreter, with and without the feed providers
+    """
+    def run_startup(self, imports=''):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT % imports], env=env)
+        return json.loads(output.splitlines()[-1])
+
+    def test_startup(self):
+        web = min([self.run_startup() for _ in range(3)], key=lambda result: result['elapsed'])
+        full = min([self.run_startup('import xfeed.providers.rss, xfeed.providers.twitter') for _ in range(3)],
+                   key=lambda result: result['elapsed'])
+        sys.stderr.write('\n%-50s %8.3fs (with providers %.3fs) ' % ('startup: web modules', web['elapsed'],
+                                                                     full['elapsed']))
+        self.assertEqual(web['modules'], [], 'The web modules import %s' % ', '.join(web['modules']))
+        self.assertEqual(full['modules'], ['feedparser', 'twitter'])
@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from xfeed.caching import get_cache_key, get_group_cache_key
+from xfeed.models import Feed, RSSItem, hide_items
+from xfeed.tests.utils import XFeedTestCase, create_rss_items
+
+
+class FeedVersionTest(XFeedTestCase):
+    """
+    Bumps the version of a feed in the database, so every process that shares the cache sees it
+    """
+    def setUp(self):
+        super(FeedVersionTest, self).setUp()
+        self.feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(self.feed, 5)
+
+    def test_bump(self):
+        key = get_cache_key(self.feed, 'feed_list')
+        group_key = get_group_cache_key([self.feed], 'syndication')
+        self.assertIsNone(self.feed.content_changed_at)
+        # Another process, which only shares the database, sees the new version
+        hide_items(RSSItem.objects.filter(ogid='1'), True)
+        feed = Feed.objects.get(pk=self.feed.pk)
+        self.assertNotEqual(get_cache_key(feed, 'feed_list'), key)
+        self.assertNotEqual(get_group_cache_key([feed], 'syndication'), group_key)
+        self.assertIsNotNone(feed.content_changed_at)
+        # Even without any cached versions
+        cache.clear()
+        self.assertEqual(get_cache_key(Feed.objects.get(pk=self.feed.pk), 'feed_list'),
+                         get_cache_key(feed, 'feed_list'))
+
+    def test_save_stale_instance(self):
+        stale = Feed.objects.get(pk=self.feed.pk)
+        result = self.feed.flush()
+        self.assertEqual(result['rss_items_count'], 5)
+        stale.name = 'Renamed'
+        stale.save()
+        feed = Feed.objects.get(pk=self.feed.pk)
+        self.assertEqual(feed.name, 'Renamed')
+        self.assertEqual((feed.version, feed.content_changed_at), (self.feed.version, self.feed.content_changed_at))
+        self.assertNotEqual(feed.version, stale.version)
+
+    def test_save_copy(self):
+        feed = Feed.objects.get(pk=self.feed.pk)
+        feed.pk = None
+        feed.uuid = 'copy'
+        feed.save()
+        self.assertNotEqual(feed.pk, self.feed.pk)
+        copy = Feed.objects.get(uuid='copy')
+        self.assertEqual(copy.name, 'RSS')
+        self.assertEqual(Feed.objects.get(pk=self.feed.pk).uuid, 'rss')
+        # The copy is saved like any other feed from then on
+        copy.name = 'Copy'
+        copy.save()
+        self.assertEqual(Feed.objects.get(uuid='copy').name, 'Copy')
+
+    def test_save_deferred(self):
+        feed = Feed.objects.only('pk', 'name').get(pk=self.feed.pk)
+        feed.name = 'Renamed'
+        with self.assertNumQueries(1):
+            feed.save()
+        self.assertEqual(Feed.objects.get(pk=self.feed.pk).name, 'Renamed')
+
+    def test_new_feeds(self):
+        other = Feed.objects.create(name='Other', feed_type='rss', uuid='other', target='http://example.com/')
+        self.assertNotEqual(other.version, self.feed.version)
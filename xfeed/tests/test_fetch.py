@@ -0,0 +1,85 @@
+from django.test.utils import override_settings
+from xfeed.exceptions import FetchError
+from xfeed.fetch import CHUNK_SIZE, fetch
+from xfeed.models import Feed
+from xfeed.tests.utils import FeedServer, XFeedTestCase, compress, generate_rss
+import hashlib
+
+
+class FetchTest(XFeedTestCase):
+    """
+    Fetches compressed, oversized and redirected documents from a local HTTP server
+    """
+    # Hard to compress, so the compressed document is read in several chunks as well
+    document = generate_rss(10) + '<!--%s-->' % ' '.join(hashlib.sha1(str(i)).hexdigest() for i in range(20000))
+
+    @classmethod
+    def setUpClass(cls):
+        super(FetchTest, cls).setUpClass()
+        cls.server = FeedServer()
+        for encoding in ('gzip', 'deflate', 'raw-deflate'):
+            cls.server.documents['/%s.xml' % encoding] = cls.document
+            cls.server.encodings['/%s.xml' % encoding] = encoding
+            cls.server.documents['/%s-bomb.xml' % encoding] = '<!--%s-->' % (' ' * (4 * 1024 * 1024))
+            cls.server.encodings['/%s-bomb.xml' % encoding] = encoding
+        cls.server.documents['/large.xml'] = cls.document
+        cls.server.documents['/20.xml'] = generate_rss(20)
+        for code in (301, 302, 307, 308):
+            cls.server.redirects['/%s.xml' % code] = (code, '/20.xml')
+        cls.server.redirects['/chain.xml'] = (301, '/302.xml')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super(FetchTest, cls).tearDownClass()
+
+    def test_encodings(self):
+        self.assertGreater(len(compress(self.document, 'gzip')), 2 * CHUNK_SIZE)
+        for encoding in ('gzip', 'deflate', 'raw-deflate'):
+            response = fetch(self.server.url('/%s.xml' % encoding))
+            self.assertEqual(response['headers']['content-encoding'], encoding.replace('raw-', ''))
+            self.assertEqual(response['body'], self.document)
+
+    def test_max_bytes(self):
+        # Rejected by its Content-Length
+        with self.assertRaisesRegexp(FetchError, 'larger than 1000 bytes'):
+            fetch(self.server.url('/large.xml'), max_bytes=1000)
+        self.assertEqual(len(fetch(self.server.url('/large.xml'), max_bytes=len(self.document))['body']),
+                         len(self.document))
+        # Compressed documents are rejected while decompressing
+        for encoding in ('gzip', 'deflate', 'raw-deflate'):
+            with self.assertRaisesRegexp(FetchError, 'larger than 1000 bytes'):
+                fetch(self.server.url('/%s.xml' % encoding), max_bytes=1000)
+            with self.assertRaisesRegexp(FetchError, 'larger than 1048576 bytes'):
+                fetch(self.server.url('/%s-bomb.xml' % encoding), max_bytes=1024 * 1024)
+
+    @override_settings(XFEED_MAX_RESPONSE_BYTES=1000)
+    def test_max_response_bytes(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/gzip.xml'))
+        with self.assertRaisesRegexp(RuntimeError, 'larger than 1000 bytes'):
+            feed.refresh()
+        self.assertEqual(feed.refresh_logs.get().outcome, 'failed')
+        self.assertEqual(feed.rss_items.count(), 0)
+
+    def test_redirects(self):
+        for code, permanent in ((301, True), (302, False), (307, False), (308, True)):
+            response = fetch(self.server.url('/%s.xml' % code))
+            self.assertEqual((response['status'], response['body']), (200, generate_rss(20)))
+            self.assertEqual(response['url'], self.server.url('/20.xml'))
+            self.assertEqual(response['permanent_url'], self.server.url('/20.xml') if permanent else None)
+        # A temporary redirect along the way keeps the original URL
+        self.assertIsNone(fetch(self.server.url('/chain.xml'))['permanent_url'])
+
+    def test_refresh_permanent_redirect(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/308.xml'))
+        feed.refresh()
+        self.assertEqual(Feed.objects.get(pk=feed.pk).target, self.server.url('/20.xml'))
+
+    @override_settings(XFEED_MAX_ENTRIES=5)
+    def test_max_entries(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/20.xml'))
+        feed.refresh()
+        # The newest entries are kept, whatever their order in the document
+        self.assertEqual(sorted(feed.rss_items.values_list('title', flat=True)),
+                         sorted('Item %s' % i for i in range(15, 20)))
+        self.assertEqual(feed.refresh_logs.get().entries_inserted, 5)
@@ -0,0 +1,151 @@
+from django.contrib.admin.sites import site
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from datetime import timedelta
+from xfeed.admin import FeedAdmin
+from xfeed.leases import claim_feeds, refresh_claimed_feeds, release_feeds, renew_leases
+from xfeed.models import Feed
+import threading
+import time
+
+
+class LeaseTest(TestCase):
+    """
+    Claims and releases feeds with leases, with SELECT ... FOR UPDATE SKIP LOCKED or the conditional UPDATE, depending
+    on the database
+    """
+    def setUp(self):
+        for i in range(6):
+            Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                target='http://example.com/%s.xml' % i)
+
+    def test_claim(self):
+        first = claim_feeds(Feed.objects.all(), 'first', 4)
+        second = claim_feeds(Feed.objects.all(), 'second', 4)
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(feed.pk for feed in first) & set(feed.pk for feed in second))
+        self.assertEqual(claim_feeds(Feed.objects.all(), 'third', 4), [])
+        # Every claim has its own owner, so it finds its feeds by their owner, not by the expiry date
+        self.assertEqual(len(set(feed.lease_owner for feed in first)), 1)
+        self.assertTrue(first[0].lease_owner.startswith('first/'))
+
+    def test_claim_twice(self):
+        first = claim_feeds(Feed.objects.all(), 'first', 3)
+        second = claim_feeds(Feed.objects.all(), 'first', 3)
+        self.assertEqual(len(second), 3)
+        self.assertNotEqual(first[0].lease_owner, second[0].lease_owner)
+        self.assertFalse(set(feed.pk for feed in first) & set(feed.pk for feed in second))
+
+    def test_renew(self):
+        feeds = claim_feeds(Feed.objects.all(), 'first', 6)
+        Feed.objects.update(lease_expires_at=timezone.now() + timedelta(seconds=1))
+        # Only the leases of the worker itself are renewed
+        self.assertEqual(renew_leases(feeds, 'second'), 0)
+        self.assertEqual(renew_leases(feeds, 'first'), 6)
+        self.assertFalse(Feed.objects.filter(lease_expires_at__lt=timezone.now() + timedelta(seconds=500)).exists())
+        # A lease that expired and was claimed by another worker is not taken back
+        Feed.objects.filter(pk=feeds[0].pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(claim_feeds(Feed.objects.all(), 'second', 6)), 1)
+        self.assertEqual(renew_leases(feeds, 'first'), 5)
+
+    def test_claim_expired(self):
+        first = claim_feeds(Feed.objects.all(), 'first', 6)
+        Feed.objects.filter(pk__in=[feed.pk for feed in first[:2]]).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1))
+        second = claim_feeds(Feed.objects.all(), 'second', 6)
+        self.assertEqual(set(feed.pk for feed in second), set(feed.pk for feed in first[:2]))
+
+    def test_release(self):
+        feeds = claim_feeds(Feed.objects.all(), 'first', 6)
+        # Only the leases of the worker itself are released
+        release_feeds(feeds, 'second')
+        self.assertEqual(Feed.objects.filter(lease_owner__startswith='first/').count(), 6)
+        scheduled = timezone.now() + timedelta(hours=1)
+        Feed.objects.filter(pk=feeds[0].pk).update(next_refresh_at=scheduled)
+        release_feeds(feeds, 'first')
+        self.assertFalse(Feed.objects.exclude(lease_owner='').exists())
+        self.assertFalse(Feed.objects.filter(lease_expires_at__isnull=False).exists())
+        # The scheduled refresh is kept, the feeds that are still due are not claimed again right away
+        self.assertEqual(Feed.objects.get(pk=feeds[0].pk).next_refresh_at, scheduled)
+        self.assertFalse(Feed.objects.filter(next_refresh_at__lte=timezone.now()).exists())
+        self.assertEqual(claim_feeds(Feed.objects.all(), 'second', 6), [])
+
+    def test_refresh_claimed_feeds(self):
+        batches = []
+
+        def refresh(feeds):
+            batches.append([feed.lease_owner.split('/')[0] for feed in feeds])
+            return {'succeeded': feeds, 'deferred': [], 'failed': [], 'elapsed': 0}
+        result = refresh_claimed_feeds(Feed.objects.all(), worker_id='first', batch_size=4, refresh=refresh)
+        self.assertEqual(batches, [['first'] * 4, ['first'] * 2])
+        self.assertEqual(len(result['succeeded']), 6)
+        self.assertFalse(Feed.objects.exclude(lease_owner='').exists())
+        self.assertFalse(Feed.objects.filter(next_refresh_at__lte=timezone.now()).exists())
+
+    def test_refresh_now(self):
+        Feed.objects.update(next_refresh_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(claim_feeds(Feed.objects.all(), 'first', 6), [])
+        Feed.objects.filter(uuid='rss-2').update(is_active=False)
+        admin = FeedAdmin(Feed, site)
+        messages = []
+        admin.message_user = lambda request, message: messages.append(message)
+        admin.refresh_now(None, Feed.objects.filter(uuid__in=['rss-0', 'rss-1', 'rss-2']))
+        # Inactive feeds are never refreshed, so they are not made due
+        self.assertTrue(messages[0].startswith('2 active feeds are due now.'))
+        self.assertEqual(set(feed.uuid for feed in claim_feeds(Feed.objects.all(), 'first', 6)),
+                         set(['rss-0', 'rss-1']))
+
+
+class ConcurrentLeaseTest(TransactionTestCase):
+    """
+    Claims feeds from several threads at once. Runs on the test database itself, so the threads need a database they
+    can share (not an in-memory SQLite database).
+    """
+    amount = 48
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db(connection.settings_dict['NAME']):
+            self.skipTest('The threads can not share an in-memory SQLite database')
+
+    def test_claim_feeds_workers(self):
+        for i in range(self.amount):
+            Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                target='http://example.com/%s.xml' % i)
+        claimed = []
+
+        def claim(worker_id):
+            try:
+                while True:
+                    feeds = claim_feeds(Feed.objects.all(), worker_id, 3)
+                    if not feeds:
+                        return
+                    claimed.extend(feed.pk for feed in feeds)
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=claim, args=('worker-%s' % i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Every feed is claimed by exactly one worker
+        self.assertEqual(sorted(claimed), sorted(Feed.objects.values_list('pk', flat=True)))
+
+    @override_settings(XFEED_LEASE_DURATION=0.6)
+    def test_renew_during_refresh(self):
+        for i in range(3):
+            Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                target='http://example.com/%s.xml' % i)
+        claimed = []
+
+        def refresh(feeds):
+            # Takes longer than the lease duration, the leases are renewed in the meantime
+            time.sleep(1.2)
+            claimed.extend(claim_feeds(Feed.objects.all(), 'second', 3))
+            return {'succeeded': feeds, 'deferred': [], 'failed': [], 'elapsed': 1.2}
+        result = refresh_claimed_feeds(Feed.objects.all(), worker_id='first', batch_size=3, refresh=refresh)
+        self.assertEqual(len(result['succeeded']), 3)
+        self.assertEqual(claimed, [])
+        self.assertFalse(Feed.objects.exclude(lease_owner='').exists())
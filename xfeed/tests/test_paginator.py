@@ -0,0 +1,46 @@
+from django.db import connection
+from unittest import skipUnless
+from xfeed.models import Feed, RSSItem
+from xfeed.paginator import EXACT_COUNT_LIMIT, EstimatedCountPaginator, get_estimated_count
+from xfeed.tests.utils import XFeedTestCase, create_rss_items
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Fakes the statistics of SQLite')
+class EstimatedCountPaginatorTest(XFeedTestCase):
+    """
+    Counts the rows of the large item tables from the statistics of the database, unless they are filtered
+    """
+    def setUp(self):
+        super(EstimatedCountPaginatorTest, self).setUp()
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 20)
+        RSSItem.objects.filter(ogid__in=['1', '2']).update(hide=True)
+        cursor = connection.cursor()
+        cursor.execute('ANALYZE')
+        self.set_estimate(50000)
+
+    def set_estimate(self, count):
+        """Makes the statistics of the RSS items table estimate an amount of rows."""
+        connection.cursor().execute("UPDATE sqlite_stat1 SET stat = %s WHERE tbl = 'xfeed_rssitem'", ['%s 1' % count])
+
+    def test_unfiltered(self):
+        self.assertEqual(get_estimated_count(RSSItem), 50000)
+        paginator = EstimatedCountPaginator(RSSItem.objects.all(), 10)
+        self.assertEqual((paginator.count, paginator.num_pages), (50000, 5000))
+        # The pages themselves hold the actual rows
+        self.assertEqual(len(paginator.page(2)), 10)
+
+    def test_filtered(self):
+        self.assertEqual(EstimatedCountPaginator(RSSItem.objects.filter(hide=False), 10).count, 18)
+        self.assertEqual(EstimatedCountPaginator(RSSItem.objects.filter(feed__uuid='rss'), 10).count, 20)
+        self.assertEqual(EstimatedCountPaginator(RSSItem.objects.values('feed').distinct(), 10).count, 1)
+        self.assertEqual(EstimatedCountPaginator(list(RSSItem.objects.all()), 10).count, 20)
+
+    def test_fallback(self):
+        # Small tables are counted exactly
+        self.set_estimate(EXACT_COUNT_LIMIT)
+        self.assertEqual(EstimatedCountPaginator(RSSItem.objects.all(), 10).count, 20)
+        # Tables without statistics as well
+        connection.cursor().execute("DELETE FROM sqlite_stat1 WHERE tbl = 'xfeed_rssitem'")
+        self.assertIsNone(get_estimated_count(RSSItem))
+        self.assertEqual(EstimatedCountPaginator(RSSItem.objects.all(), 10).count, 20)
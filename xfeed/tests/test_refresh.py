@@ -0,0 +1,434 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from StringIO import StringIO
+from xfeed import clients
+from xfeed.fetch import CHUNK_SIZE
+from xfeed.management.commands.refresh_xfeeds import Command as RefreshCommand
+from xfeed.models import Feed, RSSChannelData, RSSContent, RSSItem
+from xfeed.pipeline import pipeline_refresh_feeds
+from xfeed.providers import Provider, get_provider
+from xfeed.refresh import refresh_feeds
+from xfeed.tests.utils import (FeedServer, LAST_MODIFIED, XFeedTestCase, create_rss_items, create_tweets,
+                               generate_rss, stub_twitter)
+import hashlib
+import re
+import time
+
+
+class RefreshTest(XFeedTestCase):
+    """
+    Refreshes RSS feeds served by a local HTTP server and Twitter feeds with a stub of the Twitter API
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(RefreshTest, cls).setUpClass()
+        cls.server = FeedServer()
+        cls.server.documents['/100.xml'] = generate_rss(100)
+        cls.server.documents['/mirror.xml'] = generate_rss(100, host='EXAMPLE.com:80',
+                                                           query='?utm_source=mirror&utm_medium=rss#top')
+        # Every chunk arrives well within the timeout, the whole document does not
+        cls.server.documents['/slow.xml'] = generate_rss(10) + ' ' * (3 * CHUNK_SIZE)
+        cls.server.delays['/slow.xml'] = 0.4
+        # The second chunk arrives after the deadline, even though it arrives within the timeout of a single read
+        cls.server.documents['/stalled.xml'] = generate_rss(10) + ' ' * (3 * CHUNK_SIZE)
+        cls.server.delays['/stalled.xml'] = 0.8
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super(RefreshTest, cls).tearDownClass()
+
+    def test_refresh_rss(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/100.xml'))
+        feed.refresh()
+        self.assertEqual(feed.rss_items.count(), 100)
+        item = feed.rss_items.get(ogid='http://example.com/items/1')
+        self.assertEqual((item.title, item.description, item.link),
+                         ('Item 1', 'Description of item 1', 'http://example.com/items/1'))
+        self.assertEqual(feed.rsschanneldata.title, 'Benchmark')
+        log = feed.refresh_logs.get()
+        self.assertEqual((log.outcome, log.entries_seen, log.entries_inserted), ('updated', 100, 100))
+
+    def test_refresh_rss_new_entries(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/100.xml'))
+        feed.refresh()
+        self.server.documents['/100.xml'] = generate_rss(100, offset=50)
+        try:
+            feed.refresh()
+        finally:
+            self.server.documents['/100.xml'] = generate_rss(100)
+        self.assertEqual(feed.rss_items.count(), 150)
+        self.assertEqual(feed.refresh_logs.latest('pk').entries_inserted, 50)
+
+    def test_refresh_rss_mirror(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/100.xml'))
+        feed.refresh()
+        mirror = Feed.objects.create(name='Mirror', feed_type='rss', uuid='mirror',
+                                     target=self.server.url('/mirror.xml'))
+        mirror.refresh()
+        # The descriptions are shared, the links are canonical
+        self.assertEqual(RSSContent.objects.count(), 100)
+        self.assertEqual(set(mirror.rss_items.values_list('ogid', 'link')),
+                         set(feed.rss_items.values_list('ogid', 'link')))
+
+    def test_refresh_rss_not_modified(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/100.xml'))
+        feed.refresh()
+        self.server.requests[:] = []
+        feed.refresh()
+        path, headers = self.server.requests[-1]
+        self.assertEqual(headers.getheader('if-none-match'), '"%s"' % hashlib.sha1(generate_rss(100)).hexdigest())
+        self.assertEqual(headers.getheader('if-modified-since'), LAST_MODIFIED)
+        log = feed.refresh_logs.latest('pk')
+        self.assertEqual((log.outcome, log.entries_inserted, log.bytes_received), ('not_modified', 0, 0))
+        self.assertEqual(feed.rss_items.count(), 100)
+
+    def test_refresh_rss_same_body(self):
+        self.server.documents['/same.xml'] = generate_rss(10)
+        self.server.ignore_validators.add('/same.xml')
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/same.xml'))
+        feed.refresh()
+        self.assertEqual(feed.content_digest, hashlib.sha1(generate_rss(10)).hexdigest())
+        version = feed.version
+        # The server answers with the same document instead of a 304, which is not parsed or stored again
+        feed.refresh()
+        log = feed.refresh_logs.latest('pk')
+        self.assertEqual((log.outcome, log.entries_inserted, log.bytes_received),
+                         ('not_modified', 0, len(generate_rss(10))))
+        self.assertEqual(Feed.objects.get(pk=feed.pk).version, version)
+        self.server.documents['/same.xml'] = generate_rss(10, offset=5)
+        feed.refresh()
+        self.assertEqual(feed.refresh_logs.latest('pk').outcome, 'updated')
+        self.assertEqual(feed.rss_items.count(), 15)
+
+    def test_refresh_rss_empty_body(self):
+        self.server.documents['/empty.xml'] = ''
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/empty.xml'))
+        # An empty document is not taken for the (empty) digest of a feed that was never fetched
+        with self.assertRaises(RuntimeError):
+            feed.refresh()
+        self.assertEqual(feed.refresh_logs.get().outcome, 'failed')
+
+    def test_refresh_rss_channel(self):
+        self.server.documents['/channel.xml'] = generate_rss(10)
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/channel.xml'))
+        feed.refresh()
+        self.assertEqual(RSSChannelData.objects.get(feed=feed).title, 'Benchmark')
+        digest, version = feed.channel_digest, feed.version
+        # Only the channel changed, it is updated and invalidates the cached output
+        self.server.documents['/channel.xml'] = generate_rss(10, title='Renamed')
+        feed.refresh()
+        feed = Feed.objects.get(pk=feed.pk)
+        self.assertEqual(RSSChannelData.objects.get(feed=feed).title, 'Renamed')
+        self.assertEqual(RSSChannelData.objects.count(), 1)
+        self.assertNotEqual(feed.channel_digest, digest)
+        self.assertNotEqual(feed.version, version)
+        self.assertEqual(feed.refresh_logs.latest('pk').entries_inserted, 0)
+        # New items with an unchanged channel leave the channel alone
+        RSSChannelData.objects.filter(feed=feed).update(title='Edited')
+        self.server.documents['/channel.xml'] = generate_rss(10, offset=5, title='Renamed')
+        feed.refresh()
+        self.assertEqual(RSSChannelData.objects.get(feed=feed).title, 'Edited')
+        self.assertEqual(feed.rss_items.count(), 15)
+
+    def test_refresh_rss_deadline(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/slow.xml'))
+        with self.assertRaisesRegexp(RuntimeError, 'longer than 1 seconds'):
+            feed.refresh(timeout=1)
+        self.assertEqual(feed.refresh_logs.get().outcome, 'failed')
+        self.assertEqual(feed.rss_items.count(), 0)
+
+    def test_refresh_rss_deadline_during_read(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/stalled.xml'))
+        start = time.time()
+        with self.assertRaisesRegexp(RuntimeError, 'longer than 1 seconds'):
+            feed.refresh(timeout=1)
+        self.assertLess(time.time() - start, 1.5)
+
+    def test_refresh_twitter(self):
+        feed = Feed.objects.create(name='Twitter', feed_type='twitter', uuid='twitter', target='xfeed')
+        with stub_twitter(200):
+            feed.refresh()
+        self.assertEqual(feed.tweets.count(), 200)
+        # Only the statuses newer than the stored Tweets are fetched, in pages
+        with stub_twitter(600):
+            feed.refresh()
+        self.assertEqual(feed.tweets.count(), 600)
+        self.assertEqual(feed.refresh_logs.latest('pk').entries_inserted, 400)
+        self.assertEqual(feed.tweets.latest('create_date').text, 'Status 600')
+
+    def test_refresh_xfeeds(self):
+        self.server.documents['/10.xml'] = generate_rss(10)
+        for i in range(3):
+            Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                target=self.server.url('/10.xml'))
+        out = StringIO()
+        call_command('refresh_xfeeds', stdout=out)
+        self.assertIn('3 succeeded, 0 deferred, 0 failed', out.getvalue())
+        self.assertEqual(RSSItem.objects.count(), 30)
+        # Failing feeds make the command fail, after the other feeds were refreshed
+        Feed.objects.create(name='Missing', feed_type='rss', uuid='missing', target=self.server.url('/missing.xml'))
+        out = StringIO()
+        with self.assertRaisesRegexp(CommandError, '1 feeds failed to refresh'):
+            call_command('refresh_xfeeds', stdout=out, stderr=StringIO())
+        self.assertIn('3 succeeded, 0 deferred, 1 failed', out.getvalue())
+
+    def test_provider_interface(self):
+        class IncompleteProvider(Provider):
+            def fetch(self, feed, measurement, timeout=None):
+                return {'not_modified': True}
+
+        # Providers must implement every stage of a refresh
+        with self.assertRaises(TypeError):
+            IncompleteProvider()
+        self.assertIsInstance(get_provider('rss'), Provider)
+
+    def test_refresh_xfeeds_due_only(self):
+        self.server.documents['/10.xml'] = generate_rss(10)
+        now = timezone.now()
+        for uuid, next_refresh_at in (('new', None), ('due', now - timedelta(minutes=1)),
+                                      ('later', now + timedelta(minutes=10))):
+            Feed.objects.create(name=uuid, feed_type='rss', uuid=uuid, target=self.server.url('/10.xml'),
+                                next_refresh_at=next_refresh_at)
+        out = StringIO()
+        call_command('refresh_xfeeds', due_only=True, stdout=out)
+        self.assertIn('Refreshed 2 feeds', out.getvalue())
+        self.assertEqual(sorted(Feed.objects.filter(last_refreshed__isnull=False).values_list('uuid', flat=True)),
+                         ['due', 'new'])
+        # Both are scheduled now
+        out = StringIO()
+        call_command('refresh_xfeeds', due_only=True, stdout=out)
+        self.assertIn('Refreshed 0 feeds', out.getvalue())
+
+    def test_refresh_schedule(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/missing.xml'))
+        for failure_count in (1, 2):
+            self.assertEqual(len(refresh_feeds([feed])['failed']), 1)
+            feed = Feed.objects.get(pk=feed.pk)
+            self.assertEqual(feed.failure_count, failure_count)
+        # Without items the feed is polled every minimum interval, doubled for every failure
+        delta = feed.next_refresh_at - timezone.now()
+        self.assertTrue(timedelta(seconds=1190) < delta <= timedelta(seconds=1200))
+        feed.target = self.server.url('/100.xml')
+        feed.save()
+        self.assertEqual(len(refresh_feeds([feed])['succeeded']), 1)
+        feed = Feed.objects.get(pk=feed.pk)
+        self.assertEqual(feed.failure_count, 0)
+        # The items of the document are years old
+        delta = feed.next_refresh_at - timezone.now()
+        self.assertTrue(timedelta(seconds=86390) < delta <= timedelta(seconds=86400))
+
+    @override_settings(XFEED_REFRESH_POLL_INTERVAL=600)
+    def test_refresh_xfeeds_poll(self):
+        self.server.documents['/10.xml'] = generate_rss(10)
+        Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/10.xml'))
+        Feed.objects.create(name='Missing', feed_type='rss', uuid='missing', target=self.server.url('/missing.xml'))
+        Feed.objects.create(name='Later', feed_type='rss', uuid='later', target=self.server.url('/10.xml'),
+                            next_refresh_at=timezone.now() + timedelta(seconds=120))
+        options = {'workers': 1, 'per_host': None, 'timeout': None, 'due_only': True, 'daemon': True,
+                   'pipeline': False, 'parse_workers': None, 'distributed': False}
+        command = RefreshCommand(stdout=StringIO(), stderr=StringIO())
+        # Failures do not stop the daemon, it sleeps until the next feed is due
+        self.assertTrue(115 <= command.poll(options) <= 121)
+        self.assertIn('1 succeeded, 0 deferred, 1 failed', command.stdout._out.getvalue())
+        self.assertEqual(Feed.objects.get(uuid='later').last_refreshed, None)
+        # Wakes up regularly when no feed is due soon
+        Feed.objects.filter(uuid='later').update(is_active=False)
+        self.assertEqual(command.poll(options), 600)
+
+
+class ScheduleTest(XFeedTestCase):
+    """
+    Schedules the next refresh of feeds by how often they post, and backs off after failures
+    """
+    def setUp(self):
+        super(ScheduleTest, self).setUp()
+        self.feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+
+    def create_items(self, feed, amount, interval):
+        """Stores an amount of items for a feed, interval apart, the newest now."""
+        now = timezone.now()
+        if feed.feed_type == 'twitter':
+            create_tweets(feed, amount)
+            items = feed.tweets.all()
+            date_field = 'create_date'
+        else:
+            create_rss_items(feed, amount)
+            items = feed.rss_items.all()
+            date_field = 'pub_date'
+        for i in range(amount):
+            items.filter(ogid=str(i)).update(**{date_field: now - interval * i})
+
+    def assertInterval(self, seconds):
+        self.assertAlmostEqual(self.feed.get_refresh_interval().total_seconds(), seconds, delta=1)
+
+    def test_refresh_interval(self):
+        self.assertInterval(300)
+        # The average time between the 10 newest items, including the time since the newest item
+        self.create_items(self.feed, 20, timedelta(hours=1))
+        self.assertInterval(9 * 3600 / 10)
+        twitter = Feed.objects.create(name='Twitter', feed_type='twitter', uuid='twitter', target='xfeed')
+        self.create_items(twitter, 5, timedelta(hours=2))
+        self.assertAlmostEqual(twitter.get_refresh_interval().total_seconds(), 4 * 7200 / 5, delta=1)
+
+    def test_refresh_interval_clamped(self):
+        self.create_items(self.feed, 10, timedelta(minutes=1))
+        self.assertInterval(300)
+        self.feed.rss_items.all().delete()
+        self.create_items(self.feed, 10, timedelta(days=7))
+        self.assertInterval(86400)
+        with self.settings(XFEED_MIN_REFRESH_INTERVAL=10, XFEED_MAX_REFRESH_INTERVAL=3600):
+            self.assertInterval(3600)
+            self.feed.rss_items.all().delete()
+            self.assertInterval(10)
+
+    def test_schedule_refresh(self):
+        self.feed.schedule_refresh()
+        self.assertEqual(self.feed.failure_count, 0)
+        self.assertAlmostEqual((self.feed.next_refresh_at - timezone.now()).total_seconds(), 300, delta=1)
+        # Doubled for every failure in a row, up to the maximum interval
+        for failure_count, seconds in ((1, 600), (2, 1200), (3, 2400)):
+            self.feed.schedule_refresh(failed=True)
+            self.assertEqual(self.feed.failure_count, failure_count)
+            self.assertAlmostEqual((self.feed.next_refresh_at - timezone.now()).total_seconds(), seconds, delta=1)
+        self.feed.failure_count = 100
+        self.feed.schedule_refresh(failed=True)
+        self.assertAlmostEqual((self.feed.next_refresh_at - timezone.now()).total_seconds(), 86400, delta=1)
+        # A successful refresh resets the back-off
+        self.feed.schedule_refresh()
+        self.assertEqual(self.feed.failure_count, 0)
+        self.assertAlmostEqual((self.feed.next_refresh_at - timezone.now()).total_seconds(), 300, delta=1)
+
+
+@override_settings(XFEED_LOOKUP_BATCH_SIZE=7)
+class InsertTest(XFeedTestCase):
+    """
+    Inserts new items, looking up the stored original IDs and contents a batch at a time
+    """
+    def test_insert_new_items(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        date = timezone.now()
+
+        def items(start, stop):
+            return [RSSItem(feed=feed, ogid=str(i), pub_date=date, language='en', title='Item %s' % i,
+                            description='Description of item %s' % i, link='http://example.com/items/%s' % i)
+                    for i in range(start, stop)]
+
+        self.assertEqual(feed.insert_new_items(RSSItem, items(0, 20)), 20)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(feed.insert_new_items(RSSItem, items(10, 30) + items(25, 30)), 10)
+        # 20 original IDs, and the contents and index entries of 10 new items
+        lookups = [query['sql'] for query in queries.captured_queries if ' IN (' in query['sql']]
+        self.assertEqual(len(lookups), 3 + 2 + 2 + 2)
+        self.assertTrue(all(values.count(',') < 7 for query in lookups for values in re.findall(r' IN \(([^)]*)\)', query)))
+        self.assertEqual(sorted(feed.rss_items.values_list('ogid', flat=True), key=int), [str(i) for i in range(30)])
+        self.assertEqual(RSSContent.objects.count(), 30)
+        self.assertEqual(feed.rss_items.get(ogid='29').content.body, 'Description of item 29')
+
+
+class ConcurrentRefreshTest(TransactionTestCase):
+    """
+    Refreshes feeds in several threads and processes, which must not fail on the locks of the database.
+    Runs on the test database itself, so the threads need a database they can share (not an in-memory SQLite database).
+    """
+    amount = 12
+    rounds = 3
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db(connection.settings_dict['NAME']):
+            self.skipTest('The threads can not share an in-memory SQLite database')
+        cache.clear()
+        self.server = FeedServer()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_refresh_xfeeds_workers(self):
+        for i in range(self.amount):
+            Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                target=self.server.url('/%s.xml' % i))
+        for round in range(self.rounds):
+            # Every round has new entries, of which the descriptions are shared by several feeds
+            for i in range(self.amount):
+                self.server.documents['/%s.xml' % i] = generate_rss(50, offset=round * 50 + i)
+            out = StringIO()
+            err = StringIO()
+            call_command('refresh_xfeeds', workers=4, stdout=out, stderr=err)
+            self.assertEqual(err.getvalue(), '')
+            self.assertIn('%s succeeded, 0 deferred, 0 failed' % self.amount, out.getvalue())
+        self.assertEqual(RSSItem.objects.count(), self.amount * self.rounds * 50)
+        self.assertEqual(RSSContent.objects.count(), self.rounds * 50 + self.amount - 1)
+
+    def test_refresh_xfeeds_per_host(self):
+        for i in range(self.amount):
+            Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                target=self.server.url('/%s.xml' % i))
+            self.server.delays['/%s.xml' % i] = 0.2
+        runs = [(options, per_host, max_active) for options in ({}, {'pipeline': True, 'parse_workers': 0})
+                for per_host, max_active in ((2, 2), (self.amount, 4))]
+        for run, (options, per_host, max_active) in enumerate(runs):
+            # Every run has new entries, so the server does not answer with a 304
+            for i in range(self.amount):
+                self.server.documents['/%s.xml' % i] = generate_rss(10, offset=run * 10 + i)
+            self.server.max_active = 0
+            out = StringIO()
+            call_command('refresh_xfeeds', workers=4, per_host=per_host, stdout=out, stderr=StringIO(), **options)
+            self.assertIn('%s succeeded, 0 deferred, 0 failed' % self.amount, out.getvalue())
+            # All feeds are on the same host, the workers only fetch per_host of them at the same time
+            self.assertEqual(self.server.max_active, max_active)
+        self.assertEqual(RSSItem.objects.count(), self.amount * 10 * len(runs))
+
+    def test_pipeline(self):
+        self.server.documents['/unchanged.xml'] = generate_rss(10)
+        rss = get_provider('rss')
+        store = rss.store
+
+        def store_or_fail(feed, document, records):
+            inserted = store(feed, document, records)
+            if feed.name == 'Broken':
+                raise RuntimeError('Storing failed after inserting %s items' % inserted)
+            return inserted
+        rss.store = store_or_fail
+        try:
+            with stub_twitter(10):
+                clients.get_twitter_client().remaining = 0
+                clients.get_twitter_client().reset = timezone.now() + timedelta(minutes=15)
+                for parse_workers in (0, 2):
+                    feeds = []
+                    for i in range(3):
+                        self.server.documents['/%s-%s.xml' % (parse_workers, i)] = generate_rss(10, offset=i)
+                        feeds.append(Feed.objects.create(name='RSS', feed_type='rss',
+                                                         uuid='rss-%s-%s' % (parse_workers, i),
+                                                         target=self.server.url('/%s-%s.xml' % (parse_workers, i))))
+                    unchanged = Feed.objects.create(name='Unchanged', feed_type='rss',
+                                                    uuid='unchanged-%s' % parse_workers,
+                                                    target=self.server.url('/unchanged.xml'))
+                    unchanged.refresh()
+                    missing = Feed.objects.create(name='Missing', feed_type='rss', uuid='missing-%s' % parse_workers,
+                                                  target=self.server.url('/missing.xml'))
+                    broken = Feed.objects.create(name='Broken', feed_type='rss', uuid='broken-%s' % parse_workers,
+                                                 target=self.server.url('/unchanged.xml'))
+                    twitter = Feed.objects.create(name='Twitter', feed_type='twitter',
+                                                  uuid='twitter-%s' % parse_workers, target='xfeed')
+                    # The feeds share write batches, the failing feeds must not roll back the others
+                    result = pipeline_refresh_feeds(feeds + [unchanged, missing, broken, twitter], fetch_workers=2,
+                                                    parse_workers=parse_workers, batch_size=10)
+                    self.assertEqual(set(result['succeeded']), set(feeds + [unchanged]))
+                    self.assertEqual(result['deferred'], [twitter])
+                    self.assertEqual(set(feed for feed, error in result['failed']), set([missing, broken]))
+                    for feed in feeds:
+                        self.assertEqual(feed.rss_items.count(), 10)
+                        self.assertEqual(feed.refresh_logs.get().outcome, 'updated')
+                    self.assertEqual(unchanged.refresh_logs.latest('pk').outcome, 'not_modified')
+                    self.assertEqual(missing.refresh_logs.get().outcome, 'failed')
+                    self.assertEqual(broken.refresh_logs.get().outcome, 'failed')
+                    self.assertEqual(broken.rss_items.count(), 0)
+                    self.assertEqual(twitter.refresh_logs.get().outcome, 'deferred')
+        finally:
+            del rss.store
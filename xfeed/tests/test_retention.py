@@ -0,0 +1,161 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from StringIO import StringIO
+from xfeed import search
+from xfeed.archive import get_archived_items
+from xfeed.models import Feed, RSSContent, RSSItem, hide_items
+from xfeed.tests.utils import XFeedTestCase, create_rss_items, create_tweets
+
+
+@override_settings(XFEED_DELETE_BATCH_SIZE=7)
+class RetentionTest(XFeedTestCase):
+    """
+    Cleans up, flushes and archives the items of a feed in batches
+    """
+    amount = 50
+
+    def setUp(self):
+        super(RetentionTest, self).setUp()
+        self.feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        self.now = timezone.now()
+        create_rss_items(self.feed, self.amount, self.now)
+        search.index_items(RSSItem, self.feed.rss_items.all())
+
+    def test_clean_up(self):
+        result = self.feed.clean_up(self.now - timedelta(minutes=20, seconds=-1))
+        self.assertEqual(result, {'tweets_count': 0, 'rss_items_count': 30})
+        self.assertEqual(self.feed.rss_items.count(), 20)
+        self.assertFalse(self.feed.rss_items.filter(pub_date__lt=self.now - timedelta(minutes=20)).exists())
+        # The contents of the deleted items are deleted with them
+        self.assertEqual(RSSContent.objects.count(), 20)
+        self.assertEqual(len(search.search_items('description', limit=self.amount)), 20)
+
+    def test_clean_up_archive(self):
+        date = self.now - timedelta(minutes=25, seconds=-1)
+        result = self.feed.clean_up(date, archive=True)
+        self.assertEqual(result['rss_items_count'], 25)
+        self.assertEqual(self.feed.rss_items.count(), 25)
+        self.assertEqual(sum(self.feed.archives.values_list('item_count', flat=True)), 25)
+        items = list(get_archived_items(self.feed, RSSItem))
+        self.assertEqual(len(items), 25)
+        self.assertEqual(items[-1].title, 'Item 25')
+        self.assertEqual(items[-1].description, 'Description of item 25')
+        self.assertEqual(items[-1].pub_date, self.now - timedelta(minutes=25))
+        start = self.now - timedelta(minutes=40)
+        self.assertEqual(len(list(get_archived_items(self.feed, RSSItem, start, date))),
+                         len([item for item in items if start <= item.pub_date < date]))
+
+    def test_flush(self):
+        result = self.feed.flush()
+        self.assertEqual(result['rss_items_count'], self.amount)
+        self.assertFalse(self.feed.rss_items.exists())
+        self.assertFalse(RSSContent.objects.exists())
+        self.assertEqual(search.search_items('description'), [])
+
+
+@override_settings(XFEED_DELETE_BATCH_SIZE=3)
+class RetentionPolicyTest(XFeedTestCase):
+    """
+    Enforces the retention days and the maximum amount of items of every feed
+    """
+    def setUp(self):
+        super(RetentionPolicyTest, self).setUp()
+        self.feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        self.twitter = Feed.objects.create(name='Twitter', feed_type='twitter', uuid='twitter', target='xfeed')
+
+    def test_retention_days(self):
+        # Items 0 to 4 are newer than a day, items 5 to 9 are older
+        now = timezone.now() - timedelta(days=1) + timedelta(minutes=4, seconds=30)
+        create_rss_items(self.feed, 10, now)
+        create_tweets(self.twitter, 10, now)
+        for feed in (self.feed, self.twitter):
+            feed.retention_days = 1
+        self.assertEqual(self.feed.enforce_retention(), {'tweets_count': 0, 'rss_items_count': 5})
+        self.assertEqual(self.twitter.enforce_retention(), {'tweets_count': 5, 'rss_items_count': 0})
+        self.assertEqual(sorted(self.feed.rss_items.values_list('ogid', flat=True)), [str(i) for i in range(5)])
+        self.assertEqual(sorted(self.twitter.tweets.values_list('ogid', flat=True)), [str(i) for i in range(5)])
+        self.assertEqual(self.feed.enforce_retention(), {'tweets_count': 0, 'rss_items_count': 0})
+
+    def test_retention_max_items(self):
+        create_rss_items(self.feed, 10)
+        create_tweets(self.twitter, 10)
+        # Items 3, 4 and 5 share the date of the fifth newest item
+        date = self.feed.rss_items.get(ogid='4').pub_date
+        self.feed.rss_items.filter(ogid__in=['3', '5']).update(pub_date=date)
+        self.feed.retention_max_items = 5
+        self.assertEqual(self.feed.enforce_retention(), {'tweets_count': 0, 'rss_items_count': 4})
+        self.assertEqual(sorted(self.feed.rss_items.values_list('ogid', flat=True)), [str(i) for i in range(6)])
+        # Fewer items than the maximum
+        self.feed.retention_max_items = 6
+        self.assertEqual(self.feed.enforce_retention()['rss_items_count'], 0)
+        self.twitter.retention_max_items = 20
+        self.assertEqual(self.twitter.enforce_retention()['tweets_count'], 0)
+        self.twitter.retention_max_items = 1
+        self.assertEqual(self.twitter.enforce_retention()['tweets_count'], 9)
+        self.assertEqual(list(self.twitter.tweets.values_list('ogid', flat=True)), ['0'])
+        self.twitter.retention_max_items = 0
+        self.assertEqual(self.twitter.enforce_retention()['tweets_count'], 1)
+        self.assertFalse(self.twitter.tweets.exists())
+
+    def test_no_policy(self):
+        create_rss_items(self.feed, 10, timezone.now() - timedelta(days=400))
+        self.assertEqual(self.feed.enforce_retention(), {'tweets_count': 0, 'rss_items_count': 0})
+        self.assertEqual(self.feed.rss_items.count(), 10)
+
+    def test_command(self):
+        create_rss_items(self.feed, 10)
+        create_tweets(self.twitter, 10)
+        other = Feed.objects.create(name='Other', feed_type='rss', uuid='other', target='http://example.com/')
+        create_rss_items(other, 10)
+        Feed.objects.filter(pk=self.feed.pk).update(retention_max_items=3)
+        Feed.objects.filter(pk=self.twitter.pk).update(retention_max_items=4)
+        RSSContent.objects.create(digest='0' * 40, body='Orphaned')
+        out = StringIO()
+        call_command('enforce_retention', stdout=out)
+        lines = out.getvalue().splitlines()
+        # Feeds without a retention policy are skipped
+        self.assertEqual(len(lines), 3)
+        self.assertIn('Enforced retention of RSS-feed RSS. 0 tweets and 7 RSS items were removed.', lines)
+        self.assertIn('Enforced retention of Twitter-feed Twitter. 6 tweets and 0 RSS items were removed.', lines)
+        self.assertEqual(lines[-1], 'Successfully enforced retention. 6 tweets, 7 RSS items and 1 RSS contents were '
+                                    'removed.')
+        self.assertEqual((self.feed.rss_items.count(), self.twitter.tweets.count(), other.rss_items.count()),
+                         (3, 4, 10))
+        self.assertFalse(RSSContent.objects.filter(digest='0' * 40).exists())
+        out = StringIO()
+        call_command('enforce_retention', archive=True, stdout=out)
+        self.assertIn('0 tweets and 0 RSS items were archived.', out.getvalue())
+
+
+class HideTest(XFeedTestCase):
+    """
+    Hides and unhides many items at once, like the bulk actions of the admin
+    """
+    amount = 30
+
+    def test_hide_items(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, self.amount)
+        RSSItem.objects.update(hide=True)
+        self.assertEqual(hide_items(RSSItem.objects.all(), False, batch_size=7), self.amount)
+        self.assertEqual(len(search.search_items('description', limit=self.amount + 1)), self.amount)
+        # Only the items that change are counted
+        self.assertEqual(hide_items(RSSItem.objects.filter(ogid__in=['1', '2']), True), 2)
+        self.assertEqual(hide_items(RSSItem.objects.all(), True), self.amount - 2)
+        self.assertEqual(search.search_items('description'), [])
+        with self.assertRaises(ValueError):
+            hide_items(RSSItem.objects.all(), 'yes')
+
+    def test_hide_items_batches(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, self.amount)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(hide_items(RSSItem.objects.all(), True, batch_size=7), self.amount)
+        # Every batch of keys is updated in its own UPDATE
+        updates = [query['sql'] for query in queries.captured_queries if 'UPDATE "xfeed_rssitem"' in query['sql']]
+        self.assertEqual(len(updates), (self.amount + 6) // 7)
+        self.assertFalse(RSSItem.objects.filter(hide=False).exists())
+        self.assertEqual(search.search_items('description'), [])
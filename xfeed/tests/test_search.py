@@ -0,0 +1,93 @@
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+from xfeed import search
+from xfeed.models import Feed, RSSItem, Tweet, hide_items
+from xfeed.tests.utils import XFeedTestCase, create_rss_items, create_tweets
+import json
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls')
+class SearchViewTest(XFeedTestCase):
+    """
+    Searches the visible items of feeds through the search view, page by page
+    """
+    def setUp(self):
+        super(SearchViewTest, self).setUp()
+        self.rss = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        self.twitter = Feed.objects.create(name='Twitter', feed_type='twitter', uuid='twitter', target='xfeed')
+        create_rss_items(self.rss, 15)
+        create_tweets(self.twitter, 5)
+        search.index_items(RSSItem, self.rss.rss_items.all())
+        search.index_items(Tweet, self.twitter.tweets.all())
+
+    def test_paging(self):
+        url = reverse('search')
+        items = []
+        offset = 0
+        while offset is not None:
+            response = self.client.get(url, {'q': 'description', 'limit': 4, 'offset': offset})
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.content)
+            self.assertLessEqual(len(page['items']), 4)
+            items.extend((item['type'], item['id']) for item in page['items'])
+            offset = page['next']
+        self.assertEqual(sorted(items), sorted(('rss', str(i)) for i in range(15)))
+        response = self.client.get(url, {'q': 'status', 'feed': 'twitter'})
+        self.assertEqual(sorted(item['id'] for item in json.loads(response.content)['items']),
+                         [str(i) for i in range(5)])
+        self.assertEqual(json.loads(self.client.get(url, {'q': 'status', 'feed': 'rss'}).content)['items'], [])
+
+    def test_hidden_items(self):
+        hide_items(self.rss.rss_items.filter(ogid__in=['1', '2']), True)
+        response = self.client.get(reverse('search'), {'q': 'description', 'limit': 100})
+        ids = [item['id'] for item in json.loads(response.content)['items']]
+        self.assertEqual(len(ids), 13)
+        self.assertNotIn('1', ids)
+        self.assertNotIn('2', ids)
+
+    def test_invalid(self):
+        url = reverse('search')
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'item', 'limit': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'item', 'feed': 'missing'}).status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='xfeed.tests.urls')
+class DeleteTest(XFeedTestCase):
+    """
+    Removes items that are deleted one by one or with the delete action of the admin from the search index
+    """
+    def setUp(self):
+        super(DeleteTest, self).setUp()
+        self.feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(self.feed, 10)
+        search.index_items(RSSItem, self.feed.rss_items.all())
+
+    def indexed_pks(self):
+        """Returns the primary keys of the RSS items in the index, search_items would skip deleted items."""
+        return sorted(item_id for kind, item_id, rank in search.get_backend().search('description', None, 100, 0)
+                      if kind == 'rss')
+
+    def test_delete(self):
+        version = self.feed.version
+        item = self.feed.rss_items.get(ogid='3')
+        item.delete()
+        self.assertEqual(len(self.indexed_pks()), 9)
+        self.assertNotIn(item.pk, self.indexed_pks())
+        self.assertNotEqual(Feed.objects.get(pk=self.feed.pk).version, version)
+
+    def test_admin_delete_selected(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.login(username='admin', password='secret')
+        pks = list(self.feed.rss_items.filter(ogid__in=['1', '2']).values_list('pk', flat=True))
+        url = '/admin/xfeed/rssitem/'
+        data = {'action': 'delete_selected', '_selected_action': pks}
+        # The confirmation page does not delete anything
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.indexed_pks()), 10)
+        response = self.client.post(url, dict(data, post='yes'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(RSSItem.objects.filter(pk__in=pks).exists())
+        self.assertEqual(self.indexed_pks(), sorted(self.feed.rss_items.values_list('pk', flat=True)))
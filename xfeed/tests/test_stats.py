@@ -0,0 +1,69 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from StringIO import StringIO
+from xfeed.models import Feed
+from xfeed.tests.utils import FeedServer, XFeedTestCase, generate_rss
+
+# Storing the FeedRefreshLog of a refresh and looking up the oldest log to keep
+LOG_QUERIES = 2
+
+
+class StatsTest(XFeedTestCase):
+    """
+    Measures refreshes and summarizes them with xfeed_stats
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(StatsTest, cls).setUpClass()
+        cls.server = FeedServer()
+        cls.server.documents['/10.xml'] = generate_rss(10)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super(StatsTest, cls).tearDownClass()
+
+    def test_xfeed_stats(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/10.xml'))
+        missing = Feed.objects.create(name='Missing', feed_type='rss', uuid='missing',
+                                      target=self.server.url('/missing.xml'))
+        with CaptureQueriesContext(connection) as queries:
+            feed.refresh()
+        with self.assertRaises(RuntimeError):
+            missing.refresh()
+        # Every query of the refresh is measured, apart from storing the log itself at the end
+        measured = queries.captured_queries[:-LOG_QUERIES]
+        log = feed.refresh_logs.get()
+        self.assertEqual(log.query_count, len(measured))
+        self.assertAlmostEqual(log.query_time, sum(float(query['time']) for query in measured))
+        self.assertLessEqual(log.query_time, log.duration)
+        self.assertEqual(missing.refresh_logs.get().query_count, 0)
+        out = StringIO()
+        call_command('xfeed_stats', stdout=out)
+        out = out.getvalue()
+        self.assertIn('2 refreshes of 2 feeds in the last 7 days. 50.0% failed, 0.0% deferred.', out)
+        self.assertIn('Queries: p50 %s, p95 %s' % (log.query_count, log.query_count), out)
+        self.assertIn('  RSS: 1 refreshes, duration p50 %.3fs' % log.duration, out)
+        self.assertIn('  Missing: 1 of 1 refreshes failed (100.0%), last error: Failed to fetch RSS for feed Missing',
+                      out)
+
+    def test_log_entries(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/10.xml'))
+        with self.settings(XFEED_REFRESH_LOG_ENTRIES=2):
+            for i in range(3):
+                feed.refresh()
+        self.assertEqual(list(feed.refresh_logs.order_by('pk').values_list('outcome', flat=True)),
+                         ['not_modified', 'not_modified'])
+        with self.settings(XFEED_REFRESH_LOG_ENTRIES=0):
+            feed.refresh()
+        self.assertEqual(feed.refresh_logs.count(), 2)
+
+    @override_settings(DEBUG=False)
+    def test_queries_log(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target=self.server.url('/10.xml'))
+        length = len(connection.queries_log)
+        feed.refresh()
+        # Outside a request nothing else clears the log, a daemon would keep the SQL of every refresh
+        self.assertEqual(len(connection.queries_log), length)
+        self.assertGreater(feed.refresh_logs.get().query_count, 0)
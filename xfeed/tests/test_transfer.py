@@ -0,0 +1,71 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from datetime import timedelta
+from StringIO import StringIO
+from xfeed.models import Feed, RSSContent
+from xfeed.tests.utils import XFeedTestCase, create_rss_items
+import json
+
+
+class TransferTest(XFeedTestCase):
+    """
+    Exports feeds and their items with xfeed_export and imports them again with xfeed_import
+    """
+    amount = 25
+    batch_size = 10
+
+    def test_export_import(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        now = timezone.now()
+        create_rss_items(feed, self.amount, now)
+        out = StringIO()
+        call_command('xfeed_export', batch_size=self.batch_size, stdout=out, stderr=StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + self.amount)
+        self.assertEqual(json.loads(lines[0])['model'], 'feed')
+        feed.flush()
+        RSSContent.objects.all().delete()
+        out = StringIO()
+        call_command('xfeed_import', stdin=StringIO('\n'.join(lines)), batch_size=self.batch_size, stdout=out)
+        self.assertIn('0 feeds, 0 channels, 0 tweets and %s RSS items' % self.amount, out.getvalue())
+        self.assertEqual(feed.rss_items.count(), self.amount)
+        item = feed.rss_items.get(ogid='1')
+        self.assertEqual((item.pub_date, item.description), (now - timedelta(minutes=1), 'Description of item 1'))
+        # Importing again skips the stored items
+        call_command('xfeed_import', stdin=StringIO('\n'.join(lines)), batch_size=self.batch_size,
+                     stdout=StringIO())
+        self.assertEqual(feed.rss_items.count(), self.amount)
+        out = StringIO()
+        call_command('xfeed_export', uuids=['rss'], since=now - timedelta(minutes=10), stdout=out, stderr=StringIO())
+        self.assertEqual(len(out.getvalue().splitlines()), 1 + 11)
+
+    def test_import_new_feed(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 3)
+        out = StringIO()
+        call_command('xfeed_export', stdout=out, stderr=StringIO())
+        feed.delete()
+        call_command('xfeed_import', stdin=StringIO(out.getvalue()), stdout=StringIO())
+        feed = Feed.objects.get(uuid='rss')
+        self.assertEqual((feed.name, feed.target), ('RSS', 'http://example.com/'))
+        self.assertEqual(feed.rss_items.count(), 3)
+
+    def test_import_invalid(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 3)
+        out = StringIO()
+        call_command('xfeed_export', stdout=out, stderr=StringIO())
+        feed.flush()
+        lines = out.getvalue().splitlines()
+        record = json.loads(lines[-1])
+        del record['pub_date']
+        # Records without a date are rejected, also when no dates are given to compare them with
+        for options in ({}, {'since': timezone.now() - timedelta(days=1)}):
+            with self.assertRaisesRegexp(CommandError, 'Line 4 has no pub_date'):
+                call_command('xfeed_import', stdin=StringIO('\n'.join(lines[:-1] + [json.dumps(record)])),
+                             stdout=StringIO(), **options)
+        # Dates are validated by the argument parser
+        for command in ('xfeed_export', 'xfeed_import'):
+            with self.assertRaisesRegexp(CommandError, 'argument --since: Invalid date format'):
+                call_command(command, '--since=2015-13-01', stdin=StringIO(), stdout=StringIO(), stderr=StringIO())
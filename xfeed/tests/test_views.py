@@ -0,0 +1,198 @@
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.template import Context, Template
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date, urlsafe_base64_encode
+from datetime import timedelta
+from xfeed.models import Feed, RSSItem, Tweet, hide_items
+from xfeed.tests.utils import XFeedTestCase, create_rss_items
+import calendar
+import json
+
+
+class FeedListTest(XFeedTestCase):
+    """
+    Renders generate_feed_list, which is cached until the items of the feed change
+    """
+    def test_generate_feed_list(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 20)
+        template = Template('{% load xfeed_tags %}{% generate_feed_list feed 5 "my-list" "my-item" "ol" %}')
+        html = template.render(Context({'feed': feed}))
+        self.assertTrue(html.startswith('<ol class="my-list"><li class="my-item">'))
+        self.assertEqual(html.count('<li '), 5)
+        self.assertIn('Description of item 0', html)
+        self.assertEqual(template.render(Context({'feed': feed})), html)
+        # Hiding an item invalidates the cached list
+        item = feed.rss_items.get(ogid='0')
+        item.set_hide(True)
+        item.save()
+        html = template.render(Context({'feed': Feed.objects.get(pk=feed.pk)}))
+        self.assertNotIn('Description of item 0', html)
+        self.assertIn('Description of item 5', html)
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls')
+class DetailTest(XFeedTestCase):
+    """
+    Serves the detail view of a feed with validators
+    """
+    def test_detail(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 10)
+        url = reverse('detail', kwargs={'uuid': feed.uuid})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.count('<li '), 10)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(reverse('detail', kwargs={'uuid': 'missing'})).status_code, 404)
+
+    def test_all_items(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 120)
+        response = self.client.get(reverse('detail', kwargs={'uuid': feed.uuid}))
+        self.assertEqual(response.content.count('<li '), 120)
+        with self.settings(XFEED_DETAIL_ITEMS=100):
+            cache.clear()
+            response = self.client.get(reverse('detail', kwargs={'uuid': feed.uuid}))
+        self.assertEqual(response.content.count('<li '), 100)
+
+    def test_validators_change_with_items(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 10)
+        url = reverse('detail', kwargs={'uuid': feed.uuid})
+        etag = self.client.get(url)['ETag']
+        # Neither hiding nor removing items touches the feed itself
+        for change in (lambda: hide_items(feed.rss_items.filter(ogid='0'), True),
+                       lambda: feed.clean_up(timezone.now() - timedelta(minutes=5)),
+                       lambda: feed.flush()):
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            changed_at = Feed.objects.get(pk=feed.pk).content_changed_at
+            self.assertEqual(response['Last-Modified'], http_date(calendar.timegm(changed_at.utctimetuple())))
+            etag = response['ETag']
+        self.assertEqual(response.content.count('<li '), 0)
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls')
+class TimelineTest(XFeedTestCase):
+    """
+    Pages through the merged timeline of a Twitter and a RSS feed, of which many items share a date
+    """
+    def test_timeline(self):
+        rss = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        twitter = Feed.objects.create(name='Twitter', feed_type='twitter', uuid='twitter', target='xfeed')
+        now = timezone.now()
+        # Groups of 5 items and 5 Tweets with the same date
+        dates = [now - timedelta(minutes=i // 5) for i in range(23)]
+        RSSItem.objects.bulk_create([
+            RSSItem(feed=rss, ogid=str(i), pub_date=date, language='en', title='Item %s' % i,
+                    link='http://example.com/items/%s' % i, hide=i == 3) for i, date in enumerate(dates)])
+        Tweet.objects.bulk_create([
+            Tweet(feed=twitter, ogid=str(i), create_date=date, from_user_id=1, from_user_name='xfeed', language='en',
+                  profile_image_url='http://example.com/profile.png', source='xfeed', text='Status %s' % i)
+            for i, date in enumerate(dates)])
+        url = reverse('timeline')
+        items = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(url, {'feed': ['rss', 'twitter'], 'limit': 7, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.content)
+            items.extend((item['type'], item['id'], item['date']) for item in page['items'])
+            cursor = page['next']
+        keys = [(kind, id) for kind, id, date in items]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(set(keys), set([('rss', str(i)) for i in range(23) if i != 3] +
+                                        [('tweet', str(i)) for i in range(23)]))
+        dates = [date for kind, id, date in items]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        # Tampered cursors
+        for cursor in ['invalid'] + [urlsafe_base64_encode(value) for value in (
+                'x:rss:1', '1400000000000000:unknown:1', '1400000000000000:rss')]:
+            response = self.client.get(url, {'feed': ['rss', 'twitter'], 'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'feed': ['rss', 'missing']}).status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls')
+class SyndicationTest(XFeedTestCase):
+    """
+    Republishes feeds as RSS 2.0, Atom and JSON Feed
+    """
+    def test_group_syndication(self):
+        feeds = [Feed.objects.create(name='RSS %s' % i, feed_type='rss', uuid='rss-%s' % i,
+                                     target='http://example.com/') for i in range(2)]
+        for feed in feeds:
+            create_rss_items(feed, 10)
+        url = reverse('group_syndication', kwargs={'format': 'atom'})
+        response = self.client.get(url, {'feed': ['rss-1', 'rss-0']})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http://testserver%s?feed=rss-0&amp;feed=rss-1' % url, response.content)
+        self.assertEqual(response.content.count('<entry>'), 20)
+        # The order of the feeds and other parameters do not make a new document
+        cached = self.client.get(url, {'feed': ['rss-0', 'rss-1'], '_': '1400000000'})
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(self.client.get(url, {'feed': ['rss-0', 'missing']}).status_code, 404)
+
+    def test_rss(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/',
+                                   website='http://example.com/')
+        create_rss_items(feed, 3)
+        response = self.client.get(reverse('syndication', kwargs={'uuid': 'rss', 'format': 'rss'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/rss+xml'))
+        self.assertIn('<rss ', response.content)
+        self.assertIn('<title>RSS</title>', response.content)
+        self.assertEqual(response.content.count('<item>'), 3)
+        self.assertIn('<link>http://example.com/items/0</link>', response.content)
+        self.assertIn('Description of item 0', response.content)
+
+    def test_json(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 3)
+        url = reverse('syndication', kwargs={'uuid': 'rss', 'format': 'json'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json; charset=utf-8')
+        document = json.loads(response.content)
+        self.assertEqual(document['version'], 'https://jsonfeed.org/version/1')
+        self.assertEqual(document['feed_url'], 'http://testserver%s' % url)
+        self.assertEqual([item['id'] for item in document['items']], ['0', '1', '2'])
+        self.assertEqual(document['items'][0]['url'], 'http://example.com/items/0')
+        self.assertEqual(document['items'][0]['content_html'], 'Description of item 0')
+
+    def test_conditional_get(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        create_rss_items(feed, 3)
+        url = reverse('syndication', kwargs={'uuid': 'rss', 'format': 'atom'})
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        # Hiding the newest item changes the document, its Last-Modified date does not move backwards
+        hide_items(feed.rss_items.filter(ogid='0'), True)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotIn('Description of item 0', changed.content)
+        changed_at = Feed.objects.get(pk=feed.pk).content_changed_at
+        self.assertEqual(changed['Last-Modified'], http_date(calendar.timegm(changed_at.utctimetuple())))
+        self.assertGreaterEqual(parse_http_date(changed['Last-Modified']), parse_http_date(response['Last-Modified']))
+
+    def test_channel_changes(self):
+        feed = Feed.objects.create(name='RSS', feed_type='rss', uuid='rss', target='http://example.com/')
+        url = reverse('syndication', kwargs={'uuid': 'rss', 'format': 'atom'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # An empty feed is dated by the feed itself
+        self.assertEqual(response['Last-Modified'], http_date(calendar.timegm(feed.modified_on.utctimetuple())))
+        feed.name = 'Renamed'
+        feed.save()
+        response = self.client.get(url)
+        self.assertIn('<title>Renamed</title>', response.content)
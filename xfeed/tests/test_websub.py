@@ -0,0 +1,88 @@
+from django.test.utils import override_settings
+from django.utils import timezone
+from datetime import timedelta
+from xfeed import websub
+from xfeed.models import Feed
+from xfeed.tests.utils import FeedServer, XFeedTestCase, generate_rss
+import hashlib
+import hmac
+
+
+@override_settings(ROOT_URLCONF='xfeed.urls', XFEED_WEBSUB_CALLBACK_URL='http://testserver/websub/')
+class WebSubTest(XFeedTestCase):
+    """
+    Discovers, subscribes and verifies at a local stand-in hub, and stores the content it pushes
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(WebSubTest, cls).setUpClass()
+        cls.server = FeedServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super(WebSubTest, cls).tearDownClass()
+
+    def subscribe(self):
+        """Returns a feed with a verified subscription at the stand-in hub, and the parameters of the request."""
+        hub, topic = self.server.url('/hub'), self.server.url('/websub.xml')
+        self.server.documents['/websub.xml'] = generate_rss(10, hub=hub, topic=topic)
+        feed = Feed.objects.create(name='WebSub', feed_type='rss', uuid='websub', target=topic)
+        feed.refresh()
+        self.assertEqual((feed.hub, feed.websub_topic), (hub, topic))
+
+        result = websub.update_subscriptions()
+        self.assertEqual(result['subscribed'], [feed])
+        path, params = self.server.hub_requests[-1]
+        self.assertEqual(params['hub.mode'], ['subscribe'])
+        self.assertEqual(params['hub.callback'], ['http://testserver/websub/websub/'])
+        # Only the pending request of the feed is verified
+        verification = {'hub.mode': 'subscribe', 'hub.topic': topic, 'hub.challenge': 'challenge',
+                        'hub.lease_seconds': '864000'}
+        self.assertEqual(self.client.get('/websub/websub/', dict(verification, **{'hub.topic': hub})).status_code,
+                         404)
+        response = self.client.get('/websub/websub/', verification)
+        self.assertEqual((response.status_code, response.content), (200, 'challenge'))
+        self.assertEqual(websub.update_subscriptions()['subscribed'], [])
+        return Feed.objects.get(pk=feed.pk), params
+
+    def test_push(self):
+        feed, params = self.subscribe()
+        body = generate_rss(100, hub=feed.hub, topic=feed.websub_topic)
+        signature = 'sha1=' + hmac.new(str(params['hub.secret'][0]), body, hashlib.sha1).hexdigest()
+        # Unsigned content is acknowledged but ignored
+        response = self.client.post('/websub/websub/', body, content_type='application/rss+xml',
+                                    HTTP_X_HUB_SIGNATURE='sha1=' + '0' * 40)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(feed.rss_items.count(), 10)
+        response = self.client.post('/websub/websub/', body, content_type='application/rss+xml',
+                                    HTTP_X_HUB_SIGNATURE=signature)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(feed.rss_items.count(), 100)
+        # Polled as a safety net only
+        feed = Feed.objects.get(pk=feed.pk)
+        self.assertGreater(feed.next_refresh_at, timezone.now() + timedelta(hours=23))
+
+        feed.set_active(False)
+        feed.save()
+        self.assertEqual(websub.update_subscriptions()['unsubscribed'], [feed])
+        self.assertEqual(self.server.hub_requests[-1][1]['hub.mode'], ['unsubscribe'])
+
+    def test_denied(self):
+        feed, params = self.subscribe()
+        denial = {'hub.mode': 'denied', 'hub.topic': feed.websub_topic, 'hub.reason': 'spoofed'}
+        # Denials carry no challenge, so only a pending subscription request can be denied
+        self.assertEqual(self.client.get('/websub/websub/', denial).status_code, 404)
+        self.assertEqual(Feed.objects.get(pk=feed.pk).websub_state, 'subscribed')
+        Feed.objects.filter(pk=feed.pk).update(websub_state='subscribing')
+        self.assertEqual(self.client.get('/websub/websub/', denial).status_code, 200)
+        feed = Feed.objects.get(pk=feed.pk)
+        self.assertEqual((feed.websub_state, feed.websub_expires_at), ('denied', None))
+
+    def test_invalid_content_length(self):
+        feed, params = self.subscribe()
+        response = self.client.post('/websub/websub/', 'x', content_type='application/rss+xml', CONTENT_LENGTH='x')
+        self.assertEqual(response.status_code, 400)
+        with self.settings(XFEED_MAX_RESPONSE_BYTES=10):
+            response = self.client.post('/websub/websub/', 'x' * 11, content_type='application/rss+xml')
+        self.assertEqual(response.status_code, 413)
@@ -0,0 +1,11 @@
+"""
+URLconf of the tests that go through the admin.
+"""
+
+from django.conf.urls import include, url
+from django.contrib import admin
+
+urlpatterns = [
+    url(r'^admin/', include(admin.site.urls)),
+    url(r'^', include('xfeed.urls')),
+]
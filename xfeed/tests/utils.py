@@ -0,0 +1,249 @@
+"""
+Provides the local HTTP server, the Twitter stub and the fixtures shared by the tests and benchmarks.
+"""
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.html import escape
+from datetime import timedelta
+from email.utils import formatdate
+from StringIO import StringIO
+from xfeed import clients, search
+from xfeed.fetch import CHUNK_SIZE
+from xfeed.models import RSSItem, Tweet, attach_contents
+import BaseHTTPServer
+import SocketServer
+import contextlib
+import gzip
+import hashlib
+import socket
+import sys
+import threading
+import time
+import urlparse
+import zlib
+
+# Last-Modified header of every document of FeedServer
+LAST_MODIFIED = formatdate(1400000000, usegmt=True)
+
+TWITTER_SETTINGS = {
+    'TWITTER_CONSUMER_KEY': 'key',
+    'TWITTER_CONSUMER_SECRET': 'secret',
+    'TWITTER_ACCESS_TOKEN_KEY': 'token key',
+    'TWITTER_ACCESS_TOKEN_SECRET': 'token secret',
+}
+
+
+def generate_rss(amount, offset=0, hub=None, topic=None, host='example.com', query='', title='Benchmark'):
+    """Returns a RSS 2.0 document with an amount of items, and the WebSub links of a hub if given.
+    The links of the items are on the host and end with the query."""
+    items = ''.join(
+        '<item><title>Item %(i)s</title><link>http://%(host)s/items/%(i)s%(query)s</link>'
+        '<guid>http://%(host)s/items/%(i)s%(query)s</guid><description>Description of item %(i)s</description>'
+        '<pubDate>%(date)s</pubDate></item>' % {'i': i, 'host': host, 'query': escape(query),
+                                                 'date': formatdate(1400000000 + i * 60)}
+        for i in range(offset, offset + amount))
+    links = ''
+    if hub is not None:
+        links = '<atom:link rel="hub" href="%s"/><atom:link rel="self" href="%s"/>' % (hub, topic)
+    return ('<?xml version="1.0" encoding="utf-8"?><rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">'
+            '<channel><title>%(title)s</title>'
+            '<link>http://example.com/</link><description>Benchmark feed</description><language>en</language>'
+            '<pubDate>%(date)s</pubDate><lastBuildDate>%(date)s</lastBuildDate><generator>xfeed</generator>'
+            '<copyright>xfeed</copyright>%(links)s%(items)s</channel></rss>' % {
+                'title': title, 'date': formatdate(1400000000), 'links': links, 'items': items})
+
+
+def compress(document, encoding):
+    """Returns a document compressed for a Content-Encoding of FeedServer.encodings: 'gzip', 'deflate' (zlib-wrapped)
+    or 'raw-deflate' (sent as deflate without the zlib wrapper, like some servers do)."""
+    if encoding == 'gzip':
+        out = StringIO()
+        with gzip.GzipFile(fileobj=out, mode='wb') as gzip_file:
+            gzip_file.write(document)
+        return out.getvalue()
+    if encoding == 'deflate':
+        return zlib.compress(document)
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(document) + compressor.flush()
+
+
+class FeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves the documents of FeedServer.documents by path, and stands in for a WebSub hub by accepting every POST.
+    Documents are served with an ETag and Last-Modified header, and a 304 when the request has matching validators,
+    unless their path is in FeedServer.ignore_validators.
+    The document of a path in FeedServer.delays is sent in chunks of CHUNK_SIZE bytes, with a pause before every chunk.
+    A path in FeedServer.redirects is redirected with its (status code, path), the document of a path in
+    FeedServer.encodings is compressed, see compress.
+    """
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers))
+        if self.path in self.server.redirects:
+            code, path = self.server.redirects[self.path]
+            self.send_response(code)
+            self.send_header('Location', self.server.url(path))
+            self.end_headers()
+            return
+        document = self.server.documents.get(self.path)
+        if document is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"%s"' % hashlib.sha1(document).hexdigest()
+        if self.path not in self.server.ignore_validators and (
+                self.headers.getheader('if-none-match') == etag or (
+                    self.headers.getheader('if-none-match') is None and
+                    self.headers.getheader('if-modified-since') == LAST_MODIFIED)):
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        encoding = self.server.encodings.get(self.path)
+        if encoding is not None:
+            document = compress(document, encoding)
+            self.send_header('Content-Encoding', 'deflate' if encoding == 'raw-deflate' else encoding)
+        self.send_header('Content-Length', str(len(document)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.end_headers()
+        delay = self.server.delays.get(self.path)
+        if not delay:
+            self.wfile.write(document)
+            return
+        for offset in range(0, len(document), CHUNK_SIZE):
+            self.wfile.flush()
+            with self.server.lock:
+                self.server.active += 1
+                self.server.max_active = max(self.server.max_active, self.server.active)
+            time.sleep(delay)
+            with self.server.lock:
+                self.server.active -= 1
+            self.wfile.write(document[offset:offset + CHUNK_SIZE])
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('content-length') or 0))
+        self.server.hub_requests.append((self.path, urlparse.parse_qs(body)))
+        self.send_response(202)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class FeedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local HTTP server for RSS documents, running in a background thread and handling every request in its own thread.
+    Keeps track of the maximum amount of requests that were pausing at the same time.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FeedHandler)
+        self.documents = {}
+        self.requests = []
+        self.delays = {}
+        self.ignore_validators = set()
+        self.redirects = {}
+        self.encodings = {}
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.hub_requests = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%s%s' % (self.server_port, path)
+
+    def handle_error(self, request, client_address):
+        # Clients that give up on a slow document close the connection while it is being sent
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubUser(object):
+    id = 1
+    screen_name = 'xfeed'
+    lang = 'en'
+    profile_image_url = 'http://example.com/profile.png'
+
+
+class StubStatus(object):
+    def __init__(self, id):
+        self.id = id
+        self.created_at = time.strftime('%a %b %d %H:%M:%S +0000 %Y', time.gmtime(1400000000 + id * 60))
+        self.user = StubUser()
+        self.source = 'xfeed'
+        self.text = 'Status %s' % id
+        self.in_reply_to_user_id = None
+        self.in_reply_to_screen_name = None
+        self.in_reply_to_status_id = None
+
+
+class StubApi(object):
+    """
+    Stands in for twitter.Api, the user timeline holds the statuses 1 up to StubApi.latest
+    """
+    base_url = 'https://api.twitter.com/1.1'
+    latest = 0
+
+    def __init__(self, **kwargs):
+        pass
+
+    def GetUserTimeline(self, screen_name, since_id=None, max_id=None, count=200):
+        newest = min(self.latest, max_id or self.latest)
+        oldest = max(since_id or 0, newest - count)
+        return [StubStatus(id) for id in range(newest, oldest, -1)]
+
+
+@contextlib.contextmanager
+def stub_twitter(latest):
+    """Replaces twitter.Api by StubApi with a timeline of the given amount of statuses."""
+    api = clients.twitter.Api
+    clients.twitter.Api = StubApi
+    StubApi.latest = latest
+    clients._clients.clear()
+    try:
+        with override_settings(**TWITTER_SETTINGS):
+            yield
+    finally:
+        clients.twitter.Api = api
+        clients._clients.clear()
+
+
+def create_rss_items(feed, amount, now=None):
+    """Stores an amount of RSSItems for a feed, one minute apart, the newest at now."""
+    now = now or timezone.now()
+    items = [RSSItem(feed=feed, ogid=str(i), pub_date=now - timedelta(minutes=i), language='en',
+                     title='Item %s' % i, description='Description of item %s' % i,
+                     link='http://example.com/items/%s' % i) for i in range(amount)]
+    attach_contents(items)
+    RSSItem.objects.bulk_create(items)
+
+
+def create_tweets(feed, amount, now=None):
+    """Stores an amount of Tweets for a feed, one minute apart, the newest at now."""
+    now = now or timezone.now()
+    Tweet.objects.bulk_create([
+        Tweet(feed=feed, ogid=str(i), create_date=now - timedelta(minutes=i), from_user_id=1, from_user_name='xfeed',
+              language='en', profile_image_url='http://example.com/profile.png', source='xfeed', text='Status %s' % i)
+        for i in range(amount)])
+
+
+class XFeedTestCase(TestCase):
+    """
+    TestCase that starts every test with an empty cache
+    """
+    def setUp(self):
+        cache.clear()
+        # Looks up the search backend of the database before any query is counted
+        search.get_backend()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Provides export_feeds and import_feeds, functions for moving feeds and their items between databases as NDJSON.
+
+Every line holds one object with a "model" key: "feed", "channel", "tweet" or "rss". Channels and items refer to their
+feed by its uuid, dates are in ISO 8601 format and the description of a RSS item is included in the item. Rows are
+read in batches of primary keys and items are inserted in batches, so the memory use does not grow with the amount of
+items.
+"""
+
+from xfeed.archive import decode_dates, encode_value, get_archived_fields, get_date_field
+from xfeed.models import Feed, RSSChannelData, RSSItem, Tweet
+import json
+
+# The fields of a Feed that are exported, the refresh, lease and WebSub state belong to the database it was refreshed in
+FEED_FIELDS = ('name', 'feed_type', 'uuid', 'target', 'api_point', 'website', 'is_active', 'retention_days',
+               'retention_max_items')
+ITEM_MODELS = {'tweet': Tweet, 'rss': RSSItem}
+
+
+def get_item_fields(model):
+    """Returns the names of the fields of a Tweet or RSSItem that are exported. The creation and modification dates are
+    set by the database that imports the item."""
+    return [name for name in get_archived_fields(model) if name not in ('created_on', 'modified_on')]
+
+
+def get_channel_fields():
+    """Returns the names of the fields of a RSSChannelData that are exported."""
+    return [field.name for field in RSSChannelData._meta.concrete_fields
+            if field.name not in ('feed', 'created_on', 'modified_on')]
+
+
+def iterate_in_batches(queryset, batch_size):
+    """Yields the rows of a values_list queryset that starts with the primary key, selected in batches of primary keys.
+    Unlike QuerySet.iterator(), the database never returns more than a batch at once."""
+    last_pk = None
+    while True:
+        batch = list((queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset).order_by('pk')[:batch_size])
+        for row in batch:
+            yield row
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1][0]
+
+
+def write_record(stream, record):
+    stream.write(json.dumps(record, default=encode_value, separators=(',', ':')) + '\n')
+
+
+def export_feeds(stream, uuids=None, start=None, end=None, batch_size=1000):
+    """Writes feeds, their channel data and their items to a stream as NDJSON.
+
+    :param stream: The stream to write to.
+    :type stream: file
+    :param uuids: If given, only the feeds with these uuids are exported.
+    :type uuids: list
+    :param start: If given, only items of this date or later are exported.
+    :type start: DateTime
+    :param end: If given, only items before this date are exported.
+    :type end: DateTime
+    :param batch_size: The amount of rows to select per query.
+    :type batch_size: int
+    :returns:  Object -- holds counts for the amount of exported feeds/channels/tweets/rss-items
+
+    """
+    result = {'feeds_count': 0, 'channels_count': 0, 'tweets_count': 0, 'rss_items_count': 0}
+    feeds = Feed.objects.all()
+    if uuids:
+        feeds = feeds.filter(uuid__in=uuids)
+    for row in iterate_in_batches(feeds.values_list('pk', *FEED_FIELDS), batch_size):
+        record = dict(zip(FEED_FIELDS, row[1:]))
+        record['model'] = 'feed'
+        write_record(stream, record)
+        result['feeds_count'] += 1
+    channel_fields = get_channel_fields()
+    channels = RSSChannelData.objects.filter(feed__in=feeds)
+    for row in iterate_in_batches(channels.values_list('pk', 'feed__uuid', *channel_fields), batch_size):
+        record = dict(zip(channel_fields, row[2:]))
+        record.update(model='channel', feed=row[1])
+        write_record(stream, record)
+        result['channels_count'] += 1
+    for kind, model, count in (('tweet', Tweet, 'tweets_count'), ('rss', RSSItem, 'rss_items_count')):
+        names = get_item_fields(model)
+        columns = ['content__body' if name == 'description' else name for name in names]
+        date_field = get_date_field(model)
+        items = model.objects.filter(feed__in=feeds)
+        if start is not None:
+            items = items.filter(**{date_field + '__gte': start})
+        if end is not None:
+            items = items.filter(**{date_field + '__lt': end})
+        for row in iterate_in_batches(items.values_list('pk', 'feed__uuid', *columns), batch_size):
+            record = dict(zip(names, row[2:]))
+            record.update(model=kind, feed=row[1])
+            write_record(stream, record)
+            result[count] += 1
+    return result
+
+
+def import_feeds(stream, uuids=None, start=None, end=None, batch_size=1000):
+    """Reads feeds, their channel data and their items from NDJSON written by export_feeds. Feeds and channels that
+    already exist are kept, items are inserted in batches per feed with Feed.insert_new_items, which skips the items
+    of which the original ID is already stored for the feed.
+
+    :param stream: The stream to read from.
+    :type stream: file
+    :param uuids: If given, only the feeds with these uuids are imported.
+    :type uuids: list
+    :param start: If given, only items of this date or later are imported.
+    :type start: DateTime
+    :param end: If given, only items before this date are imported.
+    :type end: DateTime
+    :param batch_size: The amount of items to insert per batch.
+    :type batch_size: int
+    :returns:  Object -- holds counts for the amount of imported feeds/channels/tweets/rss-items, and the amount of
+               skipped items of which the feed does not exist
+    :raises: ValueError
+
+    """
+    result = {'feeds_count': 0, 'channels_count': 0, 'tweets_count': 0, 'rss_items_count': 0, 'skipped_count': 0}
+    feeds = {}
+    pending = []
+    channel_fields = get_channel_fields()
+    item_fields = dict((kind, get_item_fields(model)) for kind, model in ITEM_MODELS.items())
+
+    def get_feed(uuid):
+        if uuid not in feeds:
+            feeds[uuid] = Feed.objects.filter(uuid=uuid).first()
+        return feeds[uuid]
+
+    def insert_pending():
+        batches = {}
+        for kind, uuid, item in pending:
+            batches.setdefault((kind, uuid), []).append(item)
+        for (kind, uuid), items in batches.items():
+            feed = get_feed(uuid)
+            if feed is None:
+                result['skipped_count'] += len(items)
+                continue
+            model = ITEM_MODELS[kind]
+            count = feed.insert_new_items(model, [model(feed=feed, **item) for item in items])
+            result['tweets_count' if kind == 'tweet' else 'rss_items_count'] += count
+        del pending[:]
+
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record.pop('model')
+            uuid = record.pop('uuid' if kind == 'feed' else 'feed')
+        except (ValueError, KeyError, AttributeError):
+            raise ValueError('Line %s is not a valid record' % number)
+        if uuids and uuid not in uuids:
+            continue
+        if kind == 'feed':
+            if get_feed(uuid) is None:
+                feeds[uuid] = Feed.objects.create(uuid=uuid, **dict(
+                    (name, value) for name, value in decode_dates(Feed, record).items() if name in FEED_FIELDS))
+                result['feeds_count'] += 1
+        elif kind == 'channel':
+            feed = get_feed(uuid)
+            if feed is not None and not RSSChannelData.objects.filter(feed=feed).exists():
+                RSSChannelData.objects.create(feed=feed, **dict((name, value) for name, value in decode_dates(
+                    RSSChannelData, record).items() if name in channel_fields))
+                result['channels_count'] += 1
+        elif kind in ITEM_MODELS:
+            model = ITEM_MODELS[kind]
+            item = dict((name, value) for name, value in decode_dates(model, record).items()
+                        if name in item_fields[kind])
+            date = item.get(get_date_field(model))
+            if not date:
+                # The date is required, and without it the record can not be compared with since and until
+                raise ValueError('Line %s has no %s' % (number, get_date_field(model)))
+            if (start is not None and date < start) or (end is not None and date >= end):
+                continue
+            pending.append((kind, uuid, item))
+            if len(pending) >= batch_size:
+                insert_pending()
+        else:
+            raise ValueError('Line %s has an unknown model: %s' % (number, kind))
+    insert_pending()
+    return result
@@ -4,4 +4,9 @@ from . import views
 
 urlpatterns = [
     url(r'^feed/(?P<uuid>[a-z0-9\-]+)/$', views.detail, name='detail'),
+    url(r'^feed/(?P<uuid>[a-z0-9\-]+)/(?P<format>rss|atom|json)/$', views.syndication, name='syndication'),
+    url(r'^timeline/$', views.timeline, name='timeline'),
+    url(r'^search/$', views.search, name='search'),
+    url(r'^websub/(?P<uuid>[a-z0-9\-]+)/$', views.websub_callback, name='websub_callback'),
+    url(r'^syndication/(?P<format>rss|atom|json)/$', views.syndication, name='group_syndication'),
 ]
\ No newline at end of file
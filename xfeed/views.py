@@ -1,13 +1,286 @@
 from django.shortcuts import render
 
 # Create your views here.
-from django.http import Http404
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render_to_response
-from xfeed.models import Feed
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode, urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+from xfeed.fetch import get_max_bytes
+from xfeed.models import Feed, RSSItem, Tweet
+from xfeed.search import search_items
+from xfeed.syndication import get_syndication
+from xfeed.websub import get_pushed_document, verify_intent, verify_signature
+from datetime import datetime
+import calendar
+import hashlib
 
+
+def get_feed_state(request, uuid):
+    """Returns the values of a feed that its validators are derived from. Fetched once per request.
+
+    :returns:  tuple -- (pk, feed_type, modified_on, content_changed_at, version), or None if the feed does not exist
+
+    """
+    if not hasattr(request, 'xfeed_state'):
+        request.xfeed_state = Feed.objects.filter(uuid=uuid).values_list(
+            'pk', 'feed_type', 'modified_on', 'content_changed_at', 'version').first()
+    return request.xfeed_state
+
+
+def feed_etag(request, uuid):
+    """Returns the ETag of the detail page of a feed, derived from values stored in the database only."""
+    state = get_feed_state(request, uuid)
+    if state is None:
+        return None
+    pk, feed_type, modified_on, content_changed_at, version = state
+    # The feed version changes when items are inserted, hidden or removed, which does not touch the feed itself
+    return hashlib.md5('%s:%s:%s' % (uuid, modified_on, version)).hexdigest()
+
+
+def feed_last_modified(request, uuid):
+    """Returns the Last-Modified date of the detail page of a feed, the last change of the feed or of its items."""
+    state = get_feed_state(request, uuid)
+    if state is None:
+        return None
+    return max(date for date in state[2:4] if date is not None)
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
 def detail(request, uuid):
+    state = get_feed_state(request, uuid)
+    if state is None:
+        raise Http404("Feed does not exist")
     try:
-        f = Feed.objects.get(uuid=uuid)
+        f = Feed.objects.select_related('rsschanneldata').get(pk=state[0])
     except Feed.DoesNotExist:
         raise Http404("Feed does not exist")
-    return render_to_response('xfeed/detail.html', {'feed': f})
\ No newline at end of file
+    # Not evaluated here, generate_feed_list only selects the items it renders when its list is not cached
+    if f.feed_type == 'twitter':
+        f.visible_items = f.tweets.filter(hide=False)
+    else:
+        f.visible_items = f.rss_items.filter(hide=False).select_related('content')
+    response = render_to_response('xfeed/detail.html', {
+        'feed': f, 'amount': getattr(settings, 'XFEED_DETAIL_ITEMS', None)})
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'XFEED_DETAIL_CACHE_MAX_AGE', 0))
+    return response
+
+
+TIMELINE_KINDS = {'rss': 0, 'tweet': 1}
+
+
+def encode_cursor(date, kind, pk):
+    """Encodes the position of a timeline item into an opaque cursor."""
+    microseconds = calendar.timegm(date.utctimetuple()) * 1000000 + date.microsecond
+    return urlsafe_base64_encode('%s:%s:%s' % (microseconds, kind, pk))
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor into the (date, kind, pk) position of a timeline item.
+
+    :raises: ValueError
+
+    """
+    try:
+        microseconds, kind, pk = urlsafe_base64_decode(str(cursor)).split(':')
+        microseconds = int(microseconds)
+        date = datetime.utcfromtimestamp(microseconds // 1000000).replace(microsecond=microseconds % 1000000)
+        if kind not in TIMELINE_KINDS:
+            raise ValueError
+        return timezone.make_aware(date, timezone.utc), kind, int(pk)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise ValueError('Invalid cursor')
+
+
+def after_cursor(queryset, date_field, kind, cursor):
+    """Filters the items of a queryset that come after a cursor in the newest first timeline order.
+
+    Items are ordered by date, then by kind and then by primary key, all descending.
+    """
+    if cursor is None:
+        return queryset
+    date, cursor_kind, pk = cursor
+    if TIMELINE_KINDS[kind] < TIMELINE_KINDS[cursor_kind]:
+        return queryset.filter(**{date_field + '__lte': date})
+    if TIMELINE_KINDS[kind] > TIMELINE_KINDS[cursor_kind]:
+        return queryset.filter(**{date_field + '__lt': date})
+    return queryset.filter(Q(**{date_field + '__lt': date}) | Q(**{date_field: date, 'pk__lt': pk}))
+
+
+def timeline(request):
+    """Returns a JSON timeline of the visible Tweets and RSS items of one or more feeds, newest first.
+
+    Feeds are given with one or more 'feed' parameters holding their uuid. The 'cursor' parameter holds the 'next'
+    value of the previous page. The 'limit' parameter sets the page size, up to settings.XFEED_TIMELINE_MAX_LIMIT
+    (defaults to 100). At most three queries are made, however many feeds are merged.
+    """
+    max_limit = getattr(settings, 'XFEED_TIMELINE_MAX_LIMIT', 100)
+    try:
+        limit = max(1, min(max_limit, int(request.GET.get('limit', 20))))
+        cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    except ValueError, e:
+        return HttpResponseBadRequest(e)
+    uuids = request.GET.getlist('feed')
+    if not uuids:
+        return HttpResponseBadRequest('No feed given')
+    feeds = dict((feed.pk, feed) for feed in Feed.objects.filter(uuid__in=uuids).only('uuid', 'feed_type'))
+    if len(feeds) != len(set(uuids)):
+        raise Http404("Feed does not exist")
+
+    items = []
+    twitter_feeds = [pk for pk, feed in feeds.items() if feed.feed_type == 'twitter']
+    rss_feeds = [pk for pk, feed in feeds.items() if feed.feed_type == 'rss']
+    if twitter_feeds:
+        tweets = after_cursor(Tweet.objects.filter(feed__in=twitter_feeds, hide=False), 'create_date', 'tweet', cursor)
+        for tweet in tweets.order_by('-create_date', '-pk').values(
+                'pk', 'feed', 'ogid', 'create_date', 'text', 'from_user_name', 'profile_image_url')[:limit]:
+            items.append((tweet['create_date'], 'tweet', tweet['pk'], {
+                'type': 'tweet', 'feed': feeds[tweet['feed']].uuid, 'id': tweet['ogid'],
+                'date': tweet['create_date'], 'text': tweet['text'], 'from_user_name': tweet['from_user_name'],
+                'profile_image_url': tweet['profile_image_url']}))
+    if rss_feeds:
+        rss_items = after_cursor(RSSItem.objects.filter(feed__in=rss_feeds, hide=False), 'pub_date', 'rss', cursor)
+        for rss_item in rss_items.order_by('-pub_date', '-pk').values(
+                'pk', 'feed', 'ogid', 'pub_date', 'title', 'link', 'content__body')[:limit]:
+            items.append((rss_item['pub_date'], 'rss', rss_item['pk'], {
+                'type': 'rss', 'feed': feeds[rss_item['feed']].uuid, 'id': rss_item['ogid'],
+                'date': rss_item['pub_date'], 'title': rss_item['title'], 'link': rss_item['link'],
+                'description': rss_item['content__body'] or ''}))
+
+    items.sort(key=lambda item: (item[0], TIMELINE_KINDS[item[1]], item[2]), reverse=True)
+    page = items[:limit]
+    next_cursor = None
+    if len(page) == limit:
+        date, kind, pk, data = page[-1]
+        next_cursor = encode_cursor(date, kind, pk)
+    return JsonResponse({'items': [data for date, kind, pk, data in page], 'next': next_cursor})
+
+
+def search(request):
+    """Returns a JSON list of the visible Tweets and RSS items that match a search query, best match first.
+
+    The 'q' parameter holds the terms to search for, all terms must match. Results can be limited to feeds with one or
+    more 'feed' parameters holding their uuid. The 'offset' parameter holds the 'next' value of the previous page and
+    the 'limit' parameter sets the page size, up to settings.XFEED_SEARCH_MAX_LIMIT (defaults to 100).
+    """
+    max_limit = getattr(settings, 'XFEED_SEARCH_MAX_LIMIT', 100)
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return HttpResponseBadRequest('No query given')
+    try:
+        limit = max(1, min(max_limit, int(request.GET.get('limit', 20))))
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError, e:
+        return HttpResponseBadRequest(e)
+    feeds = None
+    uuids = request.GET.getlist('feed')
+    if uuids:
+        feeds = list(Feed.objects.filter(uuid__in=uuids).only('uuid'))
+        if len(feeds) != len(set(uuids)):
+            raise Http404("Feed does not exist")
+
+    results = search_items(query, feeds=feeds, limit=limit, offset=offset)
+    feed_ids = set(result['item'].feed_id for result in results)
+    uuids = dict(Feed.objects.filter(pk__in=feed_ids).values_list('pk', 'uuid'))
+    items = []
+    for result in results:
+        item = result['item']
+        if result['type'] == 'tweet':
+            items.append({'type': 'tweet', 'feed': uuids[item.feed_id], 'id': item.ogid, 'date': item.create_date,
+                          'text': item.text, 'from_user_name': item.from_user_name,
+                          'profile_image_url': item.profile_image_url, 'rank': result['rank']})
+        else:
+            items.append({'type': 'rss', 'feed': uuids[item.feed_id], 'id': item.ogid, 'date': item.pub_date,
+                          'title': item.title, 'link': item.link, 'description': item.description,
+                          'rank': result['rank']})
+    # Items deleted with QuerySet.delete() are skipped, so in rare cases a page ends the results early
+    next_offset = offset + limit if len(results) == limit else None
+    return JsonResponse({'items': items, 'next': next_offset})
+
+
+def get_syndication_url(request, format, feeds):
+    """Returns the URL of the syndication document of a group of feeds. The URL is the same for every request of the
+    group, whatever the order of the 'feed' parameters and any other parameters are."""
+    namespace = request.resolver_match.namespace
+    prefix = namespace + ':' if namespace else ''
+    if len(feeds) == 1:
+        path = reverse(prefix + 'syndication', kwargs={'uuid': feeds[0].uuid, 'format': format})
+    else:
+        path = '%s?%s' % (reverse(prefix + 'group_syndication', kwargs={'format': format}),
+                          urlencode([('feed', uuid) for uuid in sorted(feed.uuid for feed in feeds)]))
+    return request.build_absolute_uri(path)
+
+
+def get_request_syndication(request, format, uuid=None):
+    """Returns the syndication document for a request. Fetched once per request.
+
+    Feeds are given by the uuid in the URL, or by one or more 'feed' parameters holding their uuid.
+    """
+    if not hasattr(request, 'xfeed_syndication'):
+        uuids = [uuid] if uuid else request.GET.getlist('feed')
+        feeds = list(Feed.objects.filter(uuid__in=uuids).order_by('pk'))
+        if not feeds or len(feeds) != len(set(uuids)):
+            raise Http404("Feed does not exist")
+        request.xfeed_syndication = get_syndication(feeds, format, request.build_absolute_uri('/'),
+                                                    get_syndication_url(request, format, feeds))
+    return request.xfeed_syndication
+
+
+def syndication_etag(request, format, uuid=None):
+    """Returns the ETag of a syndication document."""
+    return get_request_syndication(request, format, uuid)['etag']
+
+
+def syndication_last_modified(request, format, uuid=None):
+    """Returns the Last-Modified date of a syndication document."""
+    return get_request_syndication(request, format, uuid)['last_modified']
+
+
+@condition(etag_func=syndication_etag, last_modified_func=syndication_last_modified)
+def syndication(request, format, uuid=None):
+    """Republishes the visible items of one or more feeds as RSS 2.0, Atom or JSON Feed."""
+    document = get_request_syndication(request, format, uuid)
+    response = HttpResponse(document['body'], content_type=document['content_type'])
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'XFEED_DETAIL_CACHE_MAX_AGE', 0))
+    return response
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def websub_callback(request, uuid):
+    """The WebSub callback of a feed, see xfeed.websub.
+
+    GET requests verify a subscription request and are answered with the challenge of the hub. POST requests hold
+    content pushed by the hub, which is stored like a refresh when it is signed with the secret of the subscription.
+    Unsigned content is acknowledged but ignored, as WebSub requires.
+    """
+    try:
+        feed = Feed.objects.get(uuid=uuid, feed_type='rss')
+    except Feed.DoesNotExist:
+        raise Http404("Feed does not exist")
+    if request.method == 'GET':
+        challenge = verify_intent(feed, request.GET)
+        if challenge is None:
+            raise Http404("No pending subscription request")
+        return HttpResponse(challenge, content_type='text/plain')
+
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid Content-Length')
+    if content_length > get_max_bytes():
+        return HttpResponse(status=413)
+    body = request.body
+    if feed.is_pushed() and verify_signature(feed, body, request.META.get('HTTP_X_HUB_SIGNATURE')):
+        headers = {'content-type': request.META.get('CONTENT_TYPE', '')}
+        try:
+            feed.refresh(document=get_pushed_document(feed, body, headers))
+        except Exception:
+            # Stored in the refresh log, the hub would only push the same content again
+            pass
+    return HttpResponse(status=202)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a WebSub (PubSubHubbub) subscriber, so hubs push new content of RSS feeds instead of waiting for a poll.
+
+1. Discovery: Feed.refresh() stores the hub and topic of the rel="hub" and rel="self" links of a feed, found in the
+   Link header of the response or in the document itself.
+2. Subscription: update_subscriptions asks the hubs of active feeds to subscribe the callback of the feed, renews
+   leases before they expire and unsubscribes feeds that are no longer active.
+3. Verification: the hub confirms the request at the callback (xfeed.views.websub_callback), which only succeeds for
+   the pending request of the feed.
+4. Distribution: the hub posts new content to the callback, signed with the secret of the subscription. The content is
+   stored by Feed.refresh(), like fetched content.
+
+Subscribed feeds are only polled every settings.XFEED_WEBSUB_POLL_INTERVAL seconds, as a safety net for missed pushes.
+WebSub is enabled by settings.XFEED_WEBSUB_CALLBACK_URL, the absolute URL of the websub/ path of xfeed.urls.
+"""
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.translation import ugettext as _
+from datetime import timedelta
+from xfeed.exceptions import FetchError
+from xfeed.fetch import USER_AGENT
+from xfeed.models import Feed
+import hashlib
+import hmac
+import re
+import urllib
+import urllib2
+import uuid
+
+LINK_HEADER_RE = re.compile(r'<([^>]*)>\s*((?:;\s*[^;,]+)*)')
+LINK_REL_RE = re.compile(r';\s*rel\s*=\s*"?([^";]+)"?', re.IGNORECASE)
+SIGNATURE_METHODS = {'sha1': hashlib.sha1, 'sha256': hashlib.sha256, 'sha384': hashlib.sha384,
+                     'sha512': hashlib.sha512}
+
+
+def get_callback_url(feed):
+    """Returns the URL the hub calls for a Feed, or None if WebSub is not enabled."""
+    base_url = getattr(settings, 'XFEED_WEBSUB_CALLBACK_URL', None)
+    if not base_url:
+        return None
+    return '%s/%s/' % (base_url.rstrip('/'), feed.uuid)
+
+
+def get_lease_seconds():
+    """Returns the lease that is requested from hubs, settings.XFEED_WEBSUB_LEASE_SECONDS or 10 days."""
+    return getattr(settings, 'XFEED_WEBSUB_LEASE_SECONDS', 864000)
+
+
+def get_websub_links(links, link_header=None):
+    """Returns the hub and topic of a feed.
+
+    :param links: The links of the feed document, dicts holding a 'rel' and 'href'.
+    :type links: list
+    :param link_header: The Link header of the response, which takes precedence over the document.
+    :type link_header: str
+    :returns:  Object -- holds the hub and topic, empty strings if the feed has none
+
+    """
+    found = {}
+    for href, params in LINK_HEADER_RE.findall(link_header or ''):
+        for rels in LINK_REL_RE.findall(params):
+            for rel in rels.lower().split():
+                found.setdefault(rel, href.strip())
+    for link in links:
+        for rel in (link.get('rel') or '').lower().split():
+            found.setdefault(rel, (link.get('href') or '').strip())
+    return {'hub': found.get('hub', '')[:255], 'topic': found.get('self', '')[:255]}
+
+
+def discover_hub(feed, links):
+    """Stores the hub and topic of a Feed, when they changed. A changed hub needs a new subscription.
+
+    :param feed: The feed the links were found in.
+    :type feed: Feed
+    :param links: The hub and topic, see get_websub_links.
+    :type links: dict
+
+    """
+    topic = (links['topic'] or feed.target) if links['hub'] else ''
+    if links['hub'] == feed.hub and topic == feed.websub_topic:
+        return
+    feed.hub, feed.websub_topic = links['hub'], topic
+    values = {'hub': feed.hub, 'websub_topic': feed.websub_topic}
+    if feed.websub_state != 'unsubscribing':
+        # The subscription at the old hub lapses when its lease expires
+        feed.websub_state, feed.websub_expires_at = '', None
+        values.update(websub_state='', websub_expires_at=None)
+    # A separate update, the refresh does not save the WebSub fields so it can not undo a verification
+    Feed.objects.filter(pk=feed.pk).update(**values)
+
+
+def request_subscription(feed, mode='subscribe', timeout=30):
+    """Asks the hub of a Feed to subscribe or unsubscribe its callback. The request is pending until the hub
+    verifies it at the callback, it is sent again by update_subscriptions when the hub did not verify it within
+    settings.XFEED_WEBSUB_VERIFY_TIMEOUT seconds (defaults to 3600).
+
+    :param feed: The feed to subscribe or unsubscribe.
+    :type feed: Feed
+    :param mode: 'subscribe' or 'unsubscribe'.
+    :type mode: str
+    :param timeout: Socket timeout in seconds.
+    :type timeout: int
+    :raises: FetchError, ValueError
+
+    """
+    if mode not in ('subscribe', 'unsubscribe'):
+        raise ValueError('The mode must be subscribe or unsubscribe')
+    callback_url = get_callback_url(feed)
+    if callback_url is None or not feed.hub:
+        raise ValueError('WebSub is not enabled or the feed has no hub')
+    if mode == 'subscribe' and not feed.websub_secret:
+        feed.websub_secret = uuid.uuid4().hex
+    feed.websub_state = 'subscribing' if mode == 'subscribe' else 'unsubscribing'
+    feed.websub_expires_at = timezone.now() + timedelta(
+        seconds=getattr(settings, 'XFEED_WEBSUB_VERIFY_TIMEOUT', 3600))
+    # Saved before the request, the hub may verify it before it answers
+    Feed.objects.filter(pk=feed.pk).update(websub_state=feed.websub_state, websub_secret=feed.websub_secret,
+                                           websub_expires_at=feed.websub_expires_at)
+    params = {'hub.mode': mode, 'hub.topic': feed.websub_topic, 'hub.callback': callback_url}
+    if mode == 'subscribe':
+        params.update({'hub.secret': feed.websub_secret, 'hub.lease_seconds': get_lease_seconds()})
+    request = urllib2.Request(feed.hub, urllib.urlencode(params), headers={'User-Agent': USER_AGENT})
+    try:
+        urllib2.urlopen(request, timeout=timeout).close()
+    except urllib2.HTTPError, e:
+        raise FetchError(_('HTTP error %s') % e.code)
+    except urllib2.URLError, e:
+        raise FetchError(e.reason)
+
+
+def get_due_subscriptions(now=None):
+    """Returns the feeds of which the subscription must be requested, and those that must be unsubscribed.
+
+    :returns:  tuple -- (QuerySet to subscribe, QuerySet to unsubscribe)
+
+    """
+    now = now or timezone.now()
+    renew_at = now + timedelta(seconds=getattr(settings, 'XFEED_WEBSUB_RENEW_BEFORE', 86400))
+    feeds = Feed.objects.filter(feed_type='rss').exclude(hub='')
+    subscribe = feeds.filter(is_active=True).filter(
+        Q(websub_state='') | Q(websub_state='subscribed', websub_expires_at__lte=renew_at) |
+        Q(websub_state='subscribing', websub_expires_at__lte=now) | Q(websub_state='unsubscribing'))
+    unsubscribe = feeds.filter(is_active=False).filter(
+        Q(websub_state__in=('subscribing', 'subscribed')) | Q(websub_state='unsubscribing', websub_expires_at__lte=now))
+    return subscribe, unsubscribe
+
+
+def update_subscriptions(timeout=30):
+    """Requests the subscriptions of active feeds with a hub, renews leases that expire within
+    settings.XFEED_WEBSUB_RENEW_BEFORE seconds (defaults to 1 day) and unsubscribes feeds that are no longer active.
+    Does nothing when WebSub is not enabled. Failing requests do not stop the other requests.
+
+    :param timeout: Socket timeout in seconds for every request.
+    :type timeout: int
+    :returns:  Object -- holds the lists of subscribed and unsubscribed feeds, and (feed, error) tuples of the failed
+               requests
+
+    """
+    result = {'subscribed': [], 'unsubscribed': [], 'failed': []}
+    if not getattr(settings, 'XFEED_WEBSUB_CALLBACK_URL', None):
+        return result
+    subscribe, unsubscribe = get_due_subscriptions()
+    for mode, feeds, done in (('subscribe', subscribe, result['subscribed']),
+                              ('unsubscribe', unsubscribe, result['unsubscribed'])):
+        for feed in feeds:
+            try:
+                request_subscription(feed, mode, timeout=timeout)
+            except Exception, e:
+                result['failed'].append((feed, e))
+            else:
+                done.append(feed)
+    return result
+
+
+def verify_intent(feed, params):
+    """Verifies a subscription request of a Feed on behalf of its hub, and stores the outcome.
+
+    :param feed: The feed the callback was called for.
+    :type feed: Feed
+    :param params: The query parameters of the verification.
+    :type params: QueryDict
+    :returns:  str -- the challenge to answer with, or None if the request was not made by this subscriber
+
+    """
+    mode = params.get('hub.mode')
+    if params.get('hub.topic') != feed.websub_topic or not feed.websub_topic:
+        return None
+    if mode == 'denied':
+        # A denial carries no challenge, so anyone can send one. It only answers a pending subscription request.
+        if feed.websub_state != 'subscribing':
+            return None
+        feed.websub_state, feed.websub_expires_at = 'denied', None
+        Feed.objects.filter(pk=feed.pk).update(websub_state='denied', websub_expires_at=None)
+        return ''
+    challenge = params.get('hub.challenge')
+    if not challenge:
+        return None
+    if mode == 'subscribe' and feed.websub_state == 'subscribing':
+        try:
+            lease_seconds = int(params.get('hub.lease_seconds') or get_lease_seconds())
+        except ValueError:
+            return None
+        feed.websub_state, feed.websub_expires_at = 'subscribed', timezone.now() + timedelta(seconds=lease_seconds)
+    elif mode == 'unsubscribe' and feed.websub_state == 'unsubscribing':
+        feed.websub_state, feed.websub_expires_at = '', None
+    else:
+        return None
+    Feed.objects.filter(pk=feed.pk).update(websub_state=feed.websub_state, websub_expires_at=feed.websub_expires_at)
+    return challenge
+
+
+def verify_signature(feed, body, signature):
+    """Returns whether pushed content is signed with the secret of the subscription of a Feed.
+
+    :param feed: The feed the content was pushed for.
+    :type feed: Feed
+    :param body: The pushed content.
+    :type body: str
+    :param signature: The X-Hub-Signature header, e.g. 'sha1=<hexdigest>'.
+    :type signature: str
+    :returns:  bool
+
+    """
+    method, _sep, digest = (signature or '').partition('=')
+    if not feed.websub_secret or method.lower() not in SIGNATURE_METHODS:
+        return False
+    expected = hmac.new(force_bytes(feed.websub_secret), body, SIGNATURE_METHODS[method.lower()]).hexdigest()
+    return hmac.compare_digest(expected, force_bytes(digest.strip().lower()))
+
+
+def get_pushed_document(feed, body, headers):
+    """Returns the document of content pushed by a hub, like Feed.fetch_document does for fetched content.
+
+    :param feed: The feed the content was pushed for.
+    :type feed: Feed
+    :param body: The pushed content.
+    :type body: str
+    :param headers: The headers of the push, with lowercase names.
+    :type headers: dict
+    :returns:  Object -- see Feed.fetch_document
+
+    """
+    content_digest = hashlib.sha1(body).hexdigest()
+    response = {'status': 200, 'url': feed.websub_topic or feed.target, 'permanent_url': None, 'etag': None,
+                'modified': None, 'headers': headers, 'body': body}
+    return {'not_modified': content_digest == feed.content_digest, 'response': response,
+            'content_digest': content_digest}